@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
       'corsheaders.middleware.CorsMiddleware',  # Must be at the top
+      'chats.middleware.MetricsMiddleware',  # Times everything below it
       'django.middleware.security.SecurityMiddleware',
       'django.contrib.sessions.middleware.SessionMiddleware',
       'django.middleware.common.CommonMiddleware',
@@ -43,6 +44,8 @@ MIDDLEWARE = [
       'django.contrib.messages.middleware.MessageMiddleware',
       'django.middleware.clickjacking.XFrameOptionsMiddleware',
       
+      'chats.middleware.QueryBudgetMiddleware',  # Above the chats middleware so their queries count too
+      'chats.middleware.JWTAuthenticationMiddleware',  # Decodes the token once for the middleware below and DRF
       'chats.middleware.RequestLoggingMiddleware',
       'chats.middleware.RestrictAccessByTimeMiddleware',
       'chats.middleware.OffensiveLanguageMiddleware',
@@ -101,7 +104,7 @@ AUTH_PASSWORD_VALIDATORS = [
   # REST framework default authentication & permission
 REST_FRAMEWORK = {
       'DEFAULT_AUTHENTICATION_CLASSES': [
-          'rest_framework_simplejwt.authentication.JWTAuthentication',
+          'chats.authentication.CachedJWTAuthentication',  # Shares the token decode with the chats middleware
           'rest_framework.authentication.BasicAuthentication',
           'rest_framework.authentication.SessionAuthentication',
       ],
@@ -155,6 +158,64 @@ CACHES = {
     }
 }
 
+# Per-request query limits enforced by chats.middleware.QueryBudgetMiddleware.
+# VIEWS maps URL names to budgets; views can also carry @query_budget(...).
+# STRICT raises instead of logging a warning, so tests fail on regressions. It is a
+# test-only switch (turn it on with override_settings): in a deployment every overrun
+# would become a 500 for the user.
+QUERY_BUDGET = {
+    'DEFAULT': None,
+    'VIEWS': {},
+    'STRICT': False,
+}
 
+# Request metrics served at /metrics (see chats.metrics). Each worker process
+# writes to its own mmap'd file in DIRECTORY; clear it when the server starts.
+METRICS = {
+    'DIRECTORY': env("METRICS_DIR", default=str(BASE_DIR / 'metrics')),  # type: ignore
+}
 
+# The "api-requests" log written by chats.middleware.RequestLoggingMiddleware
+# (see chats.log_handlers.install_queued_handler). When the queue is full,
+# OVERFLOW 'drop' discards records; 'block' makes the request wait up to
+# block_timeout seconds for room.
+REQUEST_LOGGING = {
+    'filename': env("REQUEST_LOG_FILE", default='requests.log'),  # type: ignore
+    'max_bytes': 10 * 1024 * 1024,  # 10 MB per file
+    'backup_count': 5,
+    'queue_size': 10000,
+    'overflow': env("REQUEST_LOG_OVERFLOW", default='drop'),  # type: ignore
+    'block_timeout': 1.0,
+    'batch_size': 256,
+}
+
+# Per-process cache of JWT user_id -> User used by chats.authentication.CachedJWTAuthentication.
+# Entries are dropped when a user is saved or deleted in this process; other
+# workers see changes after at most TTL seconds.
+JWT_USER_CACHE = {
+    'TTL': 60,
+    'MAX_SIZE': 1024,
+}
 
+# Message rate limit enforced by chats.middleware.RateLimitingMiddleware (see chats.ratelimit).
+# BACKEND: InProcessBackend (per worker), SQLiteBackend (a file shared by the workers
+# of one machine; OPTIONS 'path') or RedisBackend (shared by machines; OPTIONS 'url').
+# ALGORITHM: 'sliding_log' (exact) or 'token_bucket' (allows bursts of LIMIT).
+RATE_LIMIT = {
+    'BACKEND': env("RATE_LIMIT_BACKEND", default='chats.ratelimit.SQLiteBackend'),  # type: ignore
+    'OPTIONS': {},
+    'ALGORITHM': 'sliding_log',
+    'LIMIT': 10,  # Messages per user...
+    'WINDOW': 60,  # ...per this many seconds
+}
+
+# Seconds a user's group names stay cached for role checks once a token's
+# roles claim is stale (see chats.roles).
+ROLES_CACHE_TIMEOUT = 300
+
+# Word list for chats.middleware.OffensiveLanguageMiddleware and message
+# validation (see chats.moderation); reloaded when the file changes.
+MODERATION = {
+    'WORDLIST': env("MODERATION_WORDLIST", default=str(BASE_DIR / 'chats' / 'moderation_words.txt')),  # type: ignore
+    'RELOAD_INTERVAL': 5.0,  # Seconds between checks of the file's modification time
+}
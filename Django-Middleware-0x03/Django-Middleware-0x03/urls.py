@@ -5,7 +5,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework_simplejwt.views import TokenRefreshView
 from chats.auth import CustomTokenObtainPairView
-from chats.views import UserViewSet, get_me
+from chats.views import UserViewSet, get_me, metrics
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -38,6 +38,8 @@ urlpatterns = [
     # User endpoints
     path('api/users/me/', get_me, name='user-me'),
     path('api/users/', UserViewSet.as_view({'get': 'list'}), name='user-list'),  # Changed 'user' to 'users'
+    # Prometheus scrape target
+    path('metrics', metrics, name='metrics'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -2,6 +2,7 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import Token
 from rest_framework_simplejwt.views import TokenObtainPairView
 from typing import Dict, Any 
+from .roles import get_roles_version, load_roles
 
 """
 lass CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -17,6 +18,9 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token = super().get_token(user)
         token['username'] = user.username
         token['user_id'] = str(user.user_id)
+        # Read the version first: a group change after this point makes the claim stale.
+        token['roles_version'] = get_roles_version(user.user_id)
+        token['roles'] = load_roles(user)
         return token
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
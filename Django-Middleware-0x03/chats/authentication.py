@@ -0,0 +1,130 @@
+"""
+Token authentication shared by the chats middleware and DRF.
+
+Kept apart from chats.auth, which imports the simplejwt views: those import
+DRF's settings, which import the DEFAULT_AUTHENTICATION_CLASSES defined here.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+class TTLCache:
+    """
+    A small thread-safe in-process cache: entries expire `ttl` seconds after
+    they are set and the least recently used entry is evicted beyond `max_size`.
+    """
+
+    def __init__(self, ttl=60, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# user_id claim -> User, shared by every request this process serves.
+# Saving or deleting a user evicts it (see chats.signals); other processes
+# see the change after at most JWT_USER_CACHE['TTL'] seconds.
+user_cache = TTLCache(
+    ttl=getattr(settings, 'JWT_USER_CACHE', {}).get('TTL', 60),
+    max_size=getattr(settings, 'JWT_USER_CACHE', {}).get('MAX_SIZE', 1024),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that validates a request's token only once and looks
+    its user up in `user_cache` before going to the database.
+
+    The outcome is remembered on the Django request, so the chats middleware
+    (through get_jwt_user) and DRF's own authentication share one decode and
+    at most one user query per request.
+    """
+
+    def authenticate(self, request):
+        # DRF passes its Request wrapper; the middleware pass the HttpRequest.
+        http_request = getattr(request, '_request', request)
+        if not hasattr(http_request, '_jwt_authentication'):
+            try:
+                http_request._jwt_authentication = (super().authenticate(http_request), None)
+            except AuthenticationFailed as error:  # InvalidToken included
+                http_request._jwt_authentication = (None, error)
+        result, error = http_request._jwt_authentication
+        if error is not None:
+            raise error
+        return result
+
+    def get_user(self, validated_token):
+        try:
+            key = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            return super().get_user(validated_token)
+        user = user_cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(key, user)
+        else:
+            # The cached user was checked when loaded; the token was not.
+            if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                raise AuthenticationFailed("User is inactive", code="user_inactive")
+            if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+        # Every request gets its own instance, so no two threads share one.
+        user = copy.copy(user)
+        user._state = copy.copy(user._state)
+        user._state.fields_cache = {}
+        return user
+
+
+jwt_authentication = CachedJWTAuthentication()
+
+
+def get_jwt_authentication(request):
+    """
+    (user, validated token) for the request's Bearer token, or (None, None)
+    when it is missing or invalid. Decoded once per request however often
+    it is called.
+    """
+    try:
+        result = jwt_authentication.authenticate(request)
+    except AuthenticationFailed:
+        return None, None
+    return result or (None, None)
+
+
+def get_jwt_user(request):
+    """The user the request's Bearer token belongs to, or None."""
+    return get_jwt_authentication(request)[0]
@@ -0,0 +1,203 @@
+"""
+Non-blocking logging for the request path.
+
+Request threads only put records on a bounded in-memory queue
+(BoundedQueueHandler); one writer thread (BatchingQueueListener) drains it
+in batches and writes each batch as JSON lines with a single write and
+flush (BatchRotatingFileHandler). A slow disk or a log rotation therefore
+stalls the writer thread, not requests. When the queue is full the
+handler either drops the record (and counts it) or blocks the request
+thread for up to a timeout, depending on its overflow policy.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`.
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+DROP = 'drop'
+BLOCK = 'block'
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and every `extra=` field."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in STANDARD_ATTRS)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """A RotatingFileHandler that can also write a list of records with one write and one flush."""
+
+    def emit_batch(self, records):
+        records = [record for record in records if self.filter(record)]
+        if not records:
+            return
+        self.acquire()
+        try:
+            text = ''.join(self.format(record) + self.terminator for record in records)
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self.stream.tell() and self.stream.tell() + len(text) >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(text)
+            self.flush()
+        except Exception:
+            self.handleError(records[0])
+        finally:
+            self.release()
+
+
+class BatchingQueueListener:
+    """
+    Drains a queue of log records on one background thread, taking up to
+    `batch_size` records at a time and handing them to handlers with an
+    `emit_batch` method in one call (others get `handle` per record).
+    """
+
+    _sentinel = None
+
+    def __init__(self, queue, *handlers, batch_size=256, respect_handler_level=True):
+        self.queue = queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.respect_handler_level = respect_handler_level
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Queue the stop marker behind every pending record and wait for the
+        writer to flush them. Waits up to `timeout` seconds (None forever)
+        for room in a full queue and again for the thread to finish.
+        """
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=timeout)
+        except queue.Full:
+            # The writer has not freed a slot in time; give up rather than hang shutdown.
+            pass
+        else:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            record = self.queue.get()
+            while True:
+                if record is self._sentinel:
+                    stopping = True
+                else:
+                    batch.append(record)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.handle_batch(batch)
+            for _ in range(len(batch) + stopping):
+                self.queue.task_done()
+
+    def handle_batch(self, batch):
+        for handler in self.handlers:
+            records = [
+                record for record in batch
+                if not self.respect_handler_level or record.levelno >= handler.level
+            ]
+            if hasattr(handler, 'emit_batch'):
+                handler.emit_batch(records)
+            else:
+                for record in records:
+                    handler.handle(record)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler over a bounded queue, which owns the listener draining it.
+
+    overflow=DROP discards records while the queue is full; overflow=BLOCK
+    waits up to `block_timeout` seconds for room (None waits forever) and
+    then discards. Discarded records are counted in `dropped`. stop() waits
+    up to `stop_timeout` seconds for the queue to drain. The listener
+    is restarted in child processes, as threads do not survive a fork.
+    """
+
+    def __init__(self, *handlers, queue_size=10000, overflow=DROP, block_timeout=1.0, batch_size=256,
+                 stop_timeout=5.0):
+        if overflow not in (DROP, BLOCK):
+            raise ValueError(f"overflow must be {DROP!r} or {BLOCK!r}, not {overflow!r}")
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.stop_timeout = stop_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = BatchingQueueListener(self.queue, *handlers, batch_size=batch_size)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def enqueue(self, record):
+        try:
+            if self.overflow == BLOCK:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def start(self):
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out everything queued so far and stop the writer thread."""
+        self.listener.stop(timeout=self.stop_timeout)
+
+    def _restart_in_child(self):
+        if not self.listener.running:
+            return
+        self.queue = self.listener.queue = queue.Queue(maxsize=self.queue_size)
+        self.listener._thread = None
+        self.listener.start()
+
+
+def install_queued_handler(logger, filename, max_bytes=10 * 1024 * 1024, backup_count=5, **options):
+    """
+    Make `logger` write JSON lines to a rotating `filename` through a
+    BoundedQueueHandler (see its arguments for `options`) and start it.
+    """
+    file_handler = BatchRotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    file_handler.setFormatter(JSONLinesFormatter())
+    handler = BoundedQueueHandler(file_handler, **options)
+    logger.addHandler(handler)
+    handler.start()
+    return handler
@@ -0,0 +1,70 @@
+import random
+import re
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from chats.moderation import ModerationEngine
+
+
+class Command(BaseCommand):
+    help = (
+        "Time scanning the same messages against word lists of growing size, with the "
+        "Aho-Corasick engine and with a single regex alternation for comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[100, 1000, 10000, 50000],
+            help="Word-list sizes to try (default: 100 1000 10000 50000)."
+        )
+        parser.add_argument('--messages', type=int, default=2000, help="Messages scanned per size (default: 2000).")
+        parser.add_argument('--length', type=int, default=280, help="Characters per message (default: 280).")
+        parser.add_argument('--no-regex', action='store_true', help="Skip the regex comparison.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0).")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = self.random_words(rng, max(options['sizes']))
+        messages = [self.random_message(rng, options['length']) for _ in range(options['messages'])]
+        total_chars = sum(len(message) for message in messages)
+
+        self.stdout.write(f"{'terms':>8}{'build ms':>11}{'scan ms':>10}{'us/KB':>9}{'regex scan ms':>15}")
+        for size in options['sizes']:
+            terms = words[:size]
+            started = time.perf_counter()
+            engine = ModerationEngine(terms)
+            build = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for message in messages:
+                engine.find(message)
+            scan = time.perf_counter() - started
+
+            regex_scan = '-'
+            if not options['no_regex']:
+                pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, terms)) + r')\b', re.IGNORECASE)
+                started = time.perf_counter()
+                for message in messages:
+                    pattern.findall(message)
+                regex_scan = f"{(time.perf_counter() - started) * 1000:.1f}"
+
+            self.stdout.write(
+                f"{size:>8}{build * 1000:>11.1f}{scan * 1000:>10.1f}"
+                f"{scan * 1e6 / (total_chars / 1024):>9.1f}{regex_scan:>15}"
+            )
+
+    def random_words(self, rng, count):
+        words = set()
+        while len(words) < count:
+            words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+        return sorted(words, key=lambda _: rng.random())
+
+    def random_message(self, rng, length):
+        text = []
+        while sum(map(len, text)) < length:
+            text.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))))
+        return ' '.join(text)[:length]
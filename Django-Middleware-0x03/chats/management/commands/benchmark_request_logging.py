@@ -0,0 +1,109 @@
+import logging
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from chats.log_handlers import (
+    BLOCK, DROP, BatchRotatingFileHandler, BoundedQueueHandler, JSONLinesFormatter
+)
+
+
+class SlowDisk:
+    """A file object whose writes and flushes take `latency` seconds, like a saturated disk."""
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, text):
+        time.sleep(self.latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        time.sleep(self.latency)
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class SlowFileHandler(BatchRotatingFileHandler):
+    latency = 0.0
+
+    def _open(self):
+        return SlowDisk(super()._open(), self.latency)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long logging a request line takes on the request thread, "
+        "writing straight to the file versus through the queued pipeline, on a "
+        "simulated slow disk. Prints per-call latency percentiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=2000, help="Log records per run (default: 2000).")
+        parser.add_argument('--rate', type=float, default=1000.0, help="Records logged per second (default: 1000).")
+        parser.add_argument(
+            '--disk-latency',
+            type=float,
+            nargs='+',
+            default=[0.0, 0.001, 0.01],
+            help="Seconds each write/flush takes; one run per value (default: 0 0.001 0.01)."
+        )
+        parser.add_argument('--queue-size', type=int, default=10000, help="Queue bound (default: 10000).")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'disk latency':>13}  {'pipeline':<14}{'p50 us':>9}{'p99 us':>9}{'max us':>10}{'dropped':>9}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for latency in options['disk_latency']:
+                for pipeline in ('direct', DROP, BLOCK):
+                    path = Path(directory) / f'{pipeline}-{latency}.log'
+                    latencies, dropped = self.run(pipeline, path, latency, options)
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{latency * 1000:>10.1f} ms  {pipeline:<14}"
+                        f"{statistics.median(latencies) * 1e6:>9.1f}"
+                        f"{latencies[int(len(latencies) * 0.99)] * 1e6:>9.1f}"
+                        f"{latencies[-1] * 1e6:>10.1f}{dropped:>9}"
+                    )
+
+    def run(self, pipeline, path, latency, options):
+        """Log `records` lines at `rate`; returns (per-call seconds, records dropped)."""
+        file_handler = SlowFileHandler(path, maxBytes=1024 * 1024, backupCount=2, delay=True)
+        file_handler.latency = latency
+        file_handler.setFormatter(JSONLinesFormatter())
+        if pipeline == 'direct':
+            handler = file_handler
+        else:
+            handler = BoundedQueueHandler(file_handler, queue_size=options['queue_size'], overflow=pipeline)
+            handler.start()
+
+        logger = logging.getLogger(f'benchmark-request-logging.{pipeline}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        latencies = []
+        interval = 1.0 / options['rate']
+        started = time.perf_counter()
+        try:
+            for i in range(options['records']):
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                logged_at = time.perf_counter()
+                logger.info('', extra={
+                    'user': 'benchmark', 'method': 'GET', 'path': f'/api/chats/conversations/{i}/',
+                    'status': 200, 'payload': 'N/A'
+                })
+                latencies.append(time.perf_counter() - logged_at)
+        finally:
+            logger.removeHandler(handler)
+            if pipeline != 'direct':
+                handler.stop()
+            file_handler.close()
+        return latencies, getattr(handler, 'dropped', 0)
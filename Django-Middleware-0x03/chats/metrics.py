@@ -0,0 +1,190 @@
+"""
+Request metrics in the Prometheus text exposition format.
+
+Every process (e.g. each gunicorn worker) writes its samples to its own
+memory-mapped file in METRICS['DIRECTORY'], so workers never contend for a
+lock or overwrite each other. The /metrics view reads and sums the files of
+all workers, including ones that have exited, so counters never go back.
+Wipe the directory when the server (re)starts, e.g. from gunicorn's
+`on_starting` hook via `reset_metrics_directory()`.
+
+File layout: an 8-byte header holding the number of bytes in use, then
+records of (4-byte key length, key padded to 8 bytes, 8-byte double).
+A record is written in full before the header is advanced past it, so a
+reader never sees a half-written record.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HEADER = struct.Struct('q')
+INITIAL_SIZE = 1 << 16
+
+
+class MmapValues:
+    """A process-private, append-only map of string keys to float values backed by an mmap'd file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = HEADER.unpack_from(self._map, 0)[0] or HEADER.size
+        self._positions = {key: position for key, _, position in iter_records(self._map, self._used)}
+
+    def increment(self, key, amount=1.0):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._add(key)
+            value = struct.unpack_from('d', self._map, position)[0]
+            struct.pack_into('d', self._map, position, value + amount)
+
+    def _add(self, key):
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        record = struct.pack(f'i{padded}sd', len(encoded), encoded, 0.0)
+        while self._used + len(record) > len(self._map):
+            self._map.resize(len(self._map) * 2)
+        self._map[self._used:self._used + len(record)] = record
+        self._used += len(record)
+        HEADER.pack_into(self._map, 0, self._used)
+        position = self._used - 8
+        self._positions[key] = position
+        return position
+
+
+def iter_records(data, used):
+    """Yield (key, value, value position) for every record in a metrics file."""
+    position = HEADER.size
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        key_end = position + 4 + length
+        value_position = key_end + (-(4 + length) % 8)
+        yield (
+            bytes(data[position + 4:key_end]).decode('utf-8'),
+            struct.unpack_from('d', data, value_position)[0],
+            value_position,
+        )
+        position = value_position + 8
+
+
+def read_file(path):
+    with open(path, 'rb') as metrics_file:
+        data = metrics_file.read()
+    if len(data) < HEADER.size:
+        return
+    yield from ((key, value) for key, value, _ in iter_records(data, HEADER.unpack_from(data, 0)[0]))
+
+
+def metrics_directory():
+    return str(getattr(settings, 'METRICS', {}).get('DIRECTORY', os.path.join(settings.BASE_DIR, 'metrics')))
+
+
+def reset_metrics_directory():
+    """Delete every worker's samples; call once before workers start."""
+    for path in glob.glob(os.path.join(metrics_directory(), '*.db')):
+        os.remove(path)
+
+
+class RequestMetrics:
+    """Per-route, per-method, per-status request counters and latency histograms."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._values = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def values(self):
+        # (Re)open after a fork so every worker writes to a file of its own.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    directory = metrics_directory()
+                    os.makedirs(directory, exist_ok=True)
+                    self._values = MmapValues(os.path.join(directory, f'requests_{os.getpid()}.db'))
+                    self._pid = os.getpid()
+        return self._values
+
+    def observe(self, route, method, status, seconds):
+        labels = {'route': route, 'method': method, 'status': str(status)}
+        # Only the matching bucket is stored; buckets are made cumulative when rendered.
+        bucket = next((str(bound) for bound in self.buckets if seconds <= bound), '+Inf')
+        values = self.values
+        values.increment(json.dumps(['http_requests_total', labels]))
+        values.increment(json.dumps(['http_request_duration_seconds_bucket', {**labels, 'le': bucket}]))
+        values.increment(json.dumps(['http_request_duration_seconds_sum', labels]), seconds)
+
+    def collect(self):
+        """Sum the samples of every worker: {(name, sorted label items): value}."""
+        totals = defaultdict(float)
+        for path in glob.glob(os.path.join(metrics_directory(), '*.db')):
+            for key, value in read_file(path):
+                name, labels = json.loads(key)
+                totals[name, tuple(sorted(labels.items()))] += value
+        return totals
+
+    def render(self):
+        """The current metrics in the Prometheus text exposition format (version 0.0.4)."""
+        totals = self.collect()
+        requests, sums, buckets = {}, {}, defaultdict(dict)
+        for (name, labels), value in totals.items():
+            if name == 'http_requests_total':
+                requests[labels] = value
+            elif name == 'http_request_duration_seconds_sum':
+                sums[labels] = value
+            else:
+                labels = dict(labels)
+                bound = labels.pop('le')
+                buckets[tuple(sorted(labels.items()))][bound] = value
+
+        lines = [
+            '# HELP http_requests_total Requests served, by route, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        lines += [
+            f'http_requests_total{format_labels(labels)} {format_value(value)}'
+            for labels, value in sorted(requests.items())
+        ]
+        lines += [
+            '# HELP http_request_duration_seconds Request latency, by route, method and status.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for labels in sorted(buckets):
+            cumulative = 0.0
+            for bound in [str(bound) for bound in self.buckets] + ['+Inf']:
+                cumulative += buckets[labels].get(bound, 0.0)
+                lines.append(
+                    f'http_request_duration_seconds_bucket{format_labels(labels + (("le", bound),))} {format_value(cumulative)}'
+                )
+            lines.append(f'http_request_duration_seconds_sum{format_labels(labels)} {format_value(sums.get(labels, 0.0))}')
+            lines.append(f'http_request_duration_seconds_count{format_labels(labels)} {format_value(cumulative)}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    # Counts are whole numbers; print them without an exponent however large they get.
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def format_labels(labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+request_metrics = RequestMetrics()
@@ -2,12 +2,23 @@ import logging
 import logging.handlers
 import json
 import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
 from django.utils.timezone import now
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import get_jwt_authentication, get_jwt_user
+from .log_handlers import install_queued_handler
+from .metrics import request_metrics
+from .moderation import get_moderation_list
+from .ratelimit import rate_limiter_from_settings
+from .roles import MODERATION_ROLES, get_roles
 from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
 from typing import Callable
 from datetime import datetime
-from django.core.cache import cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,19 +28,46 @@ logger = logging.getLogger(__name__)
 logger = logging.getLogger("api-requests")
 logger.setLevel(20)  # Set log level to INFO (20)
 
-# Create a rotating file handler:
-# Logs will be saved in 'requests.log'
-# Each file max size: 10 MB
-# Keep up to 5 backup log files
-file_handler = logging.handlers.RotatingFileHandler(
-    'requests.log', 
-    maxBytes=10 * 1024 * 1024, 
-    backupCount=5
-)
-# Define log message format to include timestamp, user, HTTP method, path, and status code
-formatter = logging.Formatter('%(asctime)s - Method: %(method)s - Path: %(path)s - Status: %(status)s - User: %(user)s - Payload: %(payload)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+# Request threads only enqueue records; a writer thread appends them to the
+# rotating log file as JSON lines (timestamp, user, method, path, status, payload)
+# in batches, so disk stalls and rotation never hold up a request.
+# See REQUEST_LOGGING in settings for the file, queue size and overflow policy.
+request_log_handler = None
+_request_log_handler_lock = threading.Lock()
+
+
+def get_request_log_handler():
+    """
+    The "api-requests" handler, installed when the first RequestLoggingMiddleware
+    is created rather than at import, so it follows the settings in effect then
+    (a test run's temporary directory, for instance).
+    """
+    global request_log_handler
+    with _request_log_handler_lock:
+        if request_log_handler is None:
+            request_log_handler = install_queued_handler(
+                logger, **getattr(settings, 'REQUEST_LOGGING', {'filename': 'requests.log'})
+            )
+    return request_log_handler
+
+
+class JWTAuthenticationMiddleware:
+    """
+    Middleware to authenticate the request's Bearer token once, up front.
+
+    The user (or None) is remembered on the request by chats.authentication.get_jwt_user,
+    which the other chats middleware call, and DRF's CachedJWTAuthentication
+    reuses it in the view. Users are looked up through a per-process TTL
+    cache, so the whole stack costs at most one user query per request.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if 'HTTP_AUTHORIZATION' in request.META:
+            request.jwt_user = get_jwt_user(request)
+        return self.get_response(request)
 
 
 class RequestLoggingMiddleware:
@@ -56,12 +94,12 @@ class RequestLoggingMiddleware:
             get_response (callable): The next middleware or view in the request chain.
 
         Sets up:
-        - JWTAuthentication instance to decode JWT tokens.
         - A compiled regex pattern to match URLs starting with '/api/chats/'.
+        - The queued "api-requests" log handler, if no earlier instance did.
         """
         self.get_response = get_response
-        self.jwt_auth = JWTAuthentication()
         self.api_pattern = re.compile(r'^/api/(chats/|users/)')  # Regex to filter relevant API endpoints
+        get_request_log_handler()
         
         
     def __call__(self, request: HttpRequest) -> HttpResponse:
@@ -85,19 +123,9 @@ class RequestLoggingMiddleware:
         if not self.api_pattern.match(request.path):
             return self.get_response(request)
         
-        # Default user is 'Anonymous' if authentication fails or is missing
-        user: str = 'Anonymous'
-        try:
-            # Extract the Bearer token from the Authorization header
-            token = request.META.get('HTTP_AUTHORIZATION', '').replace('Bearer ', '')
-            # Validate the token
-            validated_token = self.jwt_auth.get_validated_token(token)
-            # Retrieve the user object linked to the token
-            user_object = self.jwt_auth.get_user(validated_token)
-            user = user_object.username  # Extract username
-        except Exception:
-            # If any error occurs (e.g., token missing/invalid), keep user as 'Anonymous'
-            pass
+        # Default user is 'Anonymous' if the token is missing or invalid
+        user_object = get_jwt_user(request)
+        user: str = user_object.username if user_object is not None else 'Anonymous'
         
         # Prepare to capture and sanitize the request payload if applicable
         payload: str = 'N/A'  # Default when no payload is expected
@@ -148,6 +176,183 @@ class RequestLoggingMiddleware:
         }
 
 
+# Structured (one JSON object per line) query statistics, kept apart from
+# "api-requests" because that logger's formatter expects its own extra fields.
+query_logger = logging.getLogger("db-queries")
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a view runs more queries than its budget allows and
+    QUERY_BUDGET['STRICT'] is on. The test client re-raises it, so the test
+    making the request fails; STRICT is a test-only switch, as in a
+    deployment the overrun would turn into a 500 for the user.
+    """
+
+
+def query_budget(max_queries):
+    """
+    Attach a query budget to a view function or view class.
+
+    `max_queries` is either an int, or for viewsets a dict of action name
+    to int, e.g. ``@query_budget({'list': 4, 'retrieve': 3})``.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+class QueryStats:
+    """
+    An execute_wrapper that counts the queries run through it, their total
+    time and how often each SQL statement repeats (ignoring parameters, so
+    an N+1 loop shows up as one statement run N times).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self) -> int:
+        """Queries that repeated a statement already run in this request."""
+        return sum(times - 1 for times in self.statements.values())
+
+
+class QueryBudgetMiddleware:
+    """
+    Middleware to instrument the database work of every request.
+
+    It wraps each database connection with `connection.execute_wrapper` for
+    the duration of the request and:
+    - Adds a `Server-Timing` header with the DB time, query count and
+      duplicate count, next to the total time spent in the stack below it
+    - Logs one JSON line per request to the "db-queries" logger
+    - Compares the query count with the view's budget, if it has one
+
+    Budgets come from a `query_budget` attribute on the view (see the
+    `query_budget` decorator), then from QUERY_BUDGET['VIEWS'] keyed by URL
+    name, then from QUERY_BUDGET['DEFAULT']. Going over budget logs a warning,
+    or raises QueryBudgetExceeded when QUERY_BUDGET['STRICT'] is on (only
+    ever in tests, e.g. with override_settings). Placed above RequestLoggingMiddleware, it also counts the
+    queries the chats middleware run.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        config = getattr(settings, 'QUERY_BUDGET', {})
+        self.default_budget = config.get('DEFAULT')
+        self.view_budgets = config.get('VIEWS', {})
+        self.strict = config.get('STRICT', False)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries, {stats.duplicates} duplicate", '
+            f'app;dur={total * 1000:.2f}'
+        )
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = self._budget_for(request)
+        query_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': stats.count,
+            'duplicates': stats.duplicates,
+            'db_ms': round(stats.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'budget': budget,
+        }))
+
+        if budget is not None and stats.count > budget:
+            repeated = [sql for sql, times in stats.statements.most_common(3) if times > 1]
+            message = (
+                f"{request.method} {request.path} ({view_name}) ran {stats.count} queries, "
+                f"over its budget of {budget}; most repeated: {repeated}"
+            )
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            query_logger.warning(message)
+
+        return response
+
+    def _budget_for(self, request: HttpRequest):
+        """The query budget of the view that served `request`, or None."""
+        match = request.resolver_match
+        if match is None:
+            return self.default_budget
+
+        view = match.func
+        budget = getattr(view, 'query_budget', None)
+        if budget is None:
+            budget = getattr(getattr(view, 'cls', None), 'query_budget', None)
+        if isinstance(budget, dict):
+            # Viewsets: as_view() records the HTTP method -> action mapping.
+            action = getattr(view, 'actions', {}).get(request.method.lower())
+            budget = budget.get(action)
+        if budget is None:
+            budget = self.view_budgets.get(match.url_name, self.default_budget)
+        return budget
+
+
+class MetricsMiddleware:
+    """
+    Middleware to record the latency of every request in the Prometheus
+    histograms served at /metrics (see chats.metrics).
+
+    Samples are labelled with the URL pattern that matched rather than the
+    raw path, so ids in URLs do not create a series per object; requests
+    that match no pattern share the route "unmatched". Responses returned by
+    other middleware before URL resolution are resolved here instead. Keep it at the top of
+    the stack so the time spent in the other middleware is included.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        response = self.get_response(request)
+        request_metrics.observe(
+            route=self.route(request),
+            method=request.method,
+            status=response.status_code,
+            seconds=time.perf_counter() - start
+        )
+        return response
+
+    def route(self, request: HttpRequest) -> str:
+        match = request.resolver_match
+        if match is None:
+            # Responses short-circuited by middleware (429, 403) never reached URL resolution.
+            try:
+                match = resolve(request.path_info, urlconf=getattr(request, 'urlconf', None))
+            except Resolver404:
+                return 'unmatched'
+        return match.route
+
+
 class RestrictAccessByTimeMiddleware:
     def __init__(self, get_response: Callable) -> None:
         # get_response is the next middleware or view; it will be called if access is allowed
@@ -207,7 +412,7 @@ class OffensiveLanguageMiddleware:
 
         Sets:
             - api_patterns: Regex pattern to match valid message POST endpoints.
-            - offensive_words: Regex to match specific offensive terms in a message.
+            - moderation: The word-list matcher (see chats.moderation), rebuilt when its file changes.
         """
         self.get_response = get_response
 
@@ -215,11 +420,8 @@ class OffensiveLanguageMiddleware:
         # /api/chats/conversations/123e4567-e89b-12d3-a456-426614174000/messages/
         self.api_patterns = re.compile(r'^/api/chats/conversations/[0-9a-fA-F-]+/messages/$')
 
-        # Offensive words pattern (case-insensitive)
-        self.offensive_words = re.compile(
-            r'\b(?:buddy|idiot|dude|nigga|stupid)\b',
-            re.IGNORECASE
-        )
+        # Offensive terms, leetspeak and repeated-letter variants included
+        self.moderation = get_moderation_list()
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
         """
@@ -227,9 +429,12 @@ class OffensiveLanguageMiddleware:
 
         Steps:
         1. Only evaluate POST requests that match the conversation message path.
-        2. Attempt to decode and parse the request body as JSON.
-        3. Search for offensive language in the 'message' field of the payload.
+        2. Decode the body and scan all of it in one pass; most messages end here,
+           without the JSON ever being parsed.
+        3. Only when that finds a term (or the body has JSON escapes that could hide
+           one), parse the JSON and check the 'message_body' field itself.
         4. If found, return 403 Forbidden with an error; else allow normal flow.
+        Malformed JSON in an otherwise clean body is left for the view to reject.
 
         Args:
             request (HttpRequest): The incoming HTTP request.
@@ -245,20 +450,22 @@ class OffensiveLanguageMiddleware:
             # Decode the raw body into a string (assuming UTF-8)
             body = request.body.decode('utf-8')
 
-            # Parse JSON payload into a Python dictionary
-            payload = json.loads(body) if body else {}
+            # Clean bodies without escape sequences need no parsing
+            if '\\' in body or self.moderation.contains(body):
+                # Parse JSON payload into a Python dictionary
+                payload = json.loads(body) if body else {}
 
-            # Extract message content, default to empty string if not found
-            message = payload.get("message_body", "") if isinstance(payload, dict) else ""
+                # Extract message content, default to empty string if not found
+                message = payload.get("message_body", "") if isinstance(payload, dict) else ""
 
-            # If the message contains offensive language, block the request
-            if self.offensive_words.search(message):
-                return HttpResponseForbidden(
-                    json.dumps({
-                        "Error": "Your message contains offensive language. Please edit !."
-                    }),
-                    content_type="application/json"
-                )
+                # If the message contains offensive language, block the request
+                if isinstance(message, str) and self.moderation.contains(message):
+                    return HttpResponseForbidden(
+                        json.dumps({
+                            "Error": "Your message contains offensive language. Please edit !."
+                        }),
+                        content_type="application/json"
+                    )
 
         except Exception as e:
             # If decoding or parsing fails, treat the message as invalid
@@ -274,7 +481,6 @@ class OffensiveLanguageMiddleware:
 
 import re
 from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
 class RolepermissionMiddleware:
     """
@@ -300,7 +506,6 @@ class RolepermissionMiddleware:
             get_response (callable): The next middleware or view to be called.
         """
         self.get_response = get_response
-        self.jwt_auth = JWTAuthentication()
         # Regex pattern to match /api/chats/conversations and nested messages endpoints
         self.api_pattern = re.compile(
             r'^/api/chats/conversations(?:/.+)?(?:/messages(?:/.+)?)?/?$'
@@ -310,33 +515,31 @@ class RolepermissionMiddleware:
         if request.method != 'DELETE' or not self.api_pattern.match(request.path):
             return self.get_response(request)
 
-        try:
-            token = request.META.get('HTTP_AUTHORIZATION', '').replace('Bearer ', '').strip()
-            validated_token = self.jwt_auth.get_validated_token(token)
-            user = self.jwt_auth.get_user(validated_token)
-
-            if not user.groups.filter(name__in=['admin', 'moderator']).exists():
-                logger.error(f"Blocked request: {json.dumps({'Error': 'You do not have the permission to perform this action'})}")
-                return HttpResponseForbidden(json.dumps({"Error": "You do not have the permission to perform this action"}), 
-                                                    content_type="application/json")
-        except Exception:
+        user, token = get_jwt_authentication(request)
+        if user is None:
             logger.error(f"Blocked request: {json.dumps({'error': 'Authentication required'})}")
             return HttpResponseForbidden(json.dumps({"error": "Authentication required"}), 
                                         content_type="application/json")
+
+        # Roles come from the token's claim while it is current, so usually without a query.
+        if not get_roles(user, token) & MODERATION_ROLES:
+            logger.error(f"Blocked request: {json.dumps({'Error': 'You do not have the permission to perform this action'})}")
+            return HttpResponseForbidden(json.dumps({"Error": "You do not have the permission to perform this action"}), 
+                                                content_type="application/json")
         return self.get_response(request)
 class RateLimitingMiddleware:
     """
     This middleware class Limits users to a maximum number of messages per minute for POSTs to /api/chats/conversations/<id>/messages/.
     The reason is to prevent abuse and ensures fair usage of the messaging API.
-    It Uses Redis to track message counts per user within a 1-minute sliding window.
-    It also restricts POST requests to /api/chats/conversations/<id>/messages/, returning JSON 429 errors if limit exceeded.
+    Hits are counted per user across conversations by a chats.ratelimit.RateLimiter built from
+    settings.RATE_LIMIT (algorithm, limit, window and the backend shared by the workers); the
+    check and the count are one atomic step, so concurrent requests cannot overshoot the limit.
+    Responses carry X-RateLimit-* headers, and 429 responses a Retry-After header.
     """
     def __init__(self, get_response):
         self.get_response = get_response
-        self.jwt_auth = JWTAuthentication()
         self.api_pattern = re.compile(r'^/api/chats/conversations/[0-9a-f-]+/messages/$')
-        self.rate_limit = 10  # Max messages per minute
-        self.window_seconds = 60  # 1-minute window
+        self.limiter = rate_limiter_from_settings()
 
     def __call__(self, request):
         # Skip non-POST requests or non-matching paths
@@ -344,58 +547,52 @@ class RateLimitingMiddleware:
             return self.get_response(request)
 
         # Extract user from JWT token
-        user = 'Anonymous'
-        try:
-            token = request.META.get('HTTP_AUTHORIZATION', '').replace('Bearer ', '')
-            validated_token = self.jwt_auth.get_validated_token(token)
-            user_obj = self.jwt_auth.get_user(validated_token)
-            user = user_obj.username
-        except Exception:
+        user_obj = get_jwt_user(request)
+        if user_obj is None:
             return HttpResponseForbidden(
-                {"error": "Authentication required"},
+                json.dumps({"error": "Authentication required"}),
                 content_type="application/json"
             )
+        user = user_obj.username
 
-        # Generate Redis key for user-specific rate limiting
-        cache_key = f"rate_limit:{user}:{request.path}"
-        current_count = cache.get(cache_key, 0)
+        try:
+            result = self.limiter.hit(f"messages:{user_obj.user_id}")
+        except Exception as e:
+            logger.error('', extra={
+                'user': user,
+                'path': request.path,
+                'status': f'Rate limiter error: {str(e)}'
+            })
+            return HttpResponse(
+                json.dumps({"error": "Internal server error"}),
+                status=500,
+                content_type="application/json"
+            )
 
         # Check rate limit
-        if current_count >= self.rate_limit:
+        if not result.allowed:
             logger.warning('', extra={
                 'user': user,
                 'path': request.path,
                 'status': 'Rate limit exceeded'
             })
-            return HttpResponse(
-                {"error": f"Rate limit exceeded: {self.rate_limit} messages per minute"},
+            response = HttpResponse(
+                json.dumps({
+                    "error": f"Rate limit exceeded: {self.limiter.limit} messages per "
+                             f"{self.limiter.window:g} seconds"
+                }),
                 status=429,
                 content_type="application/json"
             )
-
-        # Increment count and set expiry for sliding window
-        try:
-            if current_count == 0:
-                cache.set(cache_key, 1, timeout=self.window_seconds)
-            else:
-                cache.incr(cache_key)
-        except Exception as e:
-            logger.error('', extra={
+        else:
+            # Log successful request
+            logger.info('', extra={
                 'user': user,
                 'path': request.path,
-                'status': f'Cache error: {str(e)}'
+                'status': 'Request allowed'
             })
-            return HttpResponse(
-                {"error": "Internal server error"},
-                status=500,
-                content_type="application/json"
-            )
+            response = self.get_response(request)
 
-        # Log successful request
-        logger.info('', extra={
-            'user': user,
-            'path': request.path,
-            'status': 'Request allowed'
-        })
-
-        return self.get_response(request)
\ No newline at end of file
+        for header, value in result.headers().items():
+            response[header] = value
+        return response
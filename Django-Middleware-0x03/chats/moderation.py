@@ -0,0 +1,195 @@
+"""
+Offensive-language detection against large word lists.
+
+Terms are compiled once into an Aho-Corasick automaton, which finds every
+occurrence of every term in a single left-to-right pass: scanning costs
+time proportional to the text (plus the matches found), whatever the size
+of the dictionary.
+
+Text and terms go through the same normalization first, so common
+obfuscations still match: case is folded and leetspeak digits and symbols
+are mapped back to letters ("1d10t" -> "idiot"). Both are then matched run
+by run: a run of a repeated character in the text may be longer than the
+term's ("stuuuupid" matches "stupid") but never shorter ("as" does not
+match "ass", nor "but" "butt"). Matches must be whole words, so "classic"
+does not match "ass".
+
+The engine is built from a word-list file (one term per line, `#` starts a
+comment) named by settings.MODERATION['WORDLIST'], and rebuilt when that
+file changes (see ModerationList).
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+LEET = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '9': 'g',
+    '@': 'a', '$': 's', '+': 't',
+})
+RUNS = re.compile(r'(.)\1*', re.DOTALL)
+
+
+def normalize(text: str) -> str:
+    return text.lower().translate(LEET)
+
+
+def runs(text: str):
+    """Split `text` into its characters with repeats collapsed, and the length of each run."""
+    chars, counts = [], []
+    for match in RUNS.finditer(text):
+        chars.append(match.group(1))
+        counts.append(len(match.group()))
+    return ''.join(chars), counts
+
+
+class ModerationEngine:
+    """
+    An Aho-Corasick automaton over the collapsed form of a set of (normalized)
+    terms; each term keeps its run lengths to check a match against.
+    """
+
+    def __init__(self, terms):
+        # Node 0 is the root. goto: child per character; fail: longest proper
+        # suffix that is also a prefix of some term; output: the (term, run
+        # lengths) pairs ending here, or None; dict_link: nearest node on the
+        # fail chain with an output.
+        self.goto = [{}]
+        self.output = [None]
+        for term in terms:
+            term = term.strip()
+            key, counts = runs(normalize(term))
+            if not key:
+                continue
+            node = 0
+            for char in key:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.output.append(None)
+                node = child
+            # "as" and "ass" share a node; they differ only in run lengths.
+            if self.output[node] is None:
+                self.output[node] = []
+            if (term, tuple(counts)) not in self.output[node]:
+                self.output[node].append((term, tuple(counts)))
+        self.fail = [0] * len(self.goto)
+        self.dict_link = [-1] * len(self.goto)
+        self._link()
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                link = self.fail[child]
+                self.dict_link[child] = link if self.output[link] is not None else self.dict_link[link]
+
+    def __len__(self):
+        return sum(len(output) for output in self.output if output is not None)
+
+    def find(self, text: str, first_only=False) -> list:
+        """The dictionary terms occurring in `text` as whole words, in order of appearance."""
+        text, counts = runs(normalize(text))
+        goto, fail, output, dict_link = self.goto, self.fail, self.output, self.dict_link
+        found = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if output[node] is not None else dict_link[node]
+            while match != -1:
+                for term, term_counts in output[match]:
+                    start = end - len(term_counts)
+                    if (
+                        (start == 0 or not text[start - 1].isalnum())
+                        and (end == len(text) or not text[end].isalnum())
+                        and all(have >= need for have, need in zip(counts[start:end], term_counts))
+                    ):
+                        found.append(term)
+                        if first_only:
+                            return found
+                match = dict_link[match]
+        return found
+
+    def contains(self, text: str) -> bool:
+        return bool(self.find(text, first_only=True))
+
+
+def read_wordlist(path) -> list:
+    with open(path, encoding='utf-8') as wordlist:
+        return [line.split('#', 1)[0].strip() for line in wordlist if line.split('#', 1)[0].strip()]
+
+
+class ModerationList:
+    """
+    A ModerationEngine kept in step with a word-list file. At most every
+    `check_interval` seconds, a caller checks the file's modification time
+    and rebuilds the engine if it changed; readers keep using the previous
+    engine until the new one is swapped in.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = str(path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._engine = ModerationEngine([])
+        self.reload()
+
+    @property
+    def engine(self) -> ModerationEngine:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._engine
+
+    def reload(self, force=False) -> bool:
+        """Rebuild the engine if the file changed (or `force`); returns whether it was rebuilt."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return False
+            if mtime == self._mtime and not force:
+                return False
+            self._engine = ModerationEngine(read_wordlist(self.path))
+            self._mtime = mtime
+            return True
+
+    def contains(self, text: str) -> bool:
+        return self.engine.contains(text)
+
+    def find(self, text: str) -> list:
+        return self.engine.find(text)
+
+
+_moderation_list = None
+_moderation_list_lock = threading.Lock()
+
+
+def get_moderation_list() -> ModerationList:
+    """The process-wide ModerationList described by settings.MODERATION."""
+    global _moderation_list
+    if _moderation_list is None:
+        with _moderation_list_lock:
+            if _moderation_list is None:
+                config = getattr(settings, 'MODERATION', {})
+                _moderation_list = ModerationList(
+                    config.get('WORDLIST', os.path.join(os.path.dirname(__file__), 'moderation_words.txt')),
+                    check_interval=config.get('RELOAD_INTERVAL', 5.0),
+                )
+    return _moderation_list
@@ -0,0 +1,296 @@
+"""
+Rate limiting with atomic check-and-consume.
+
+Two algorithms:
+- token_bucket: a bucket of LIMIT tokens refilled continuously at
+  LIMIT/WINDOW tokens per second; each hit takes a token. Allows bursts of
+  up to LIMIT, then a steady rate.
+- sliding_log: the timestamps of accepted hits in the last WINDOW seconds;
+  a hit is accepted while fewer than LIMIT are logged. Exact, with no burst
+  at window edges.
+
+Each backend runs the whole read-decide-write step as one atomic
+operation, so concurrent requests can never both take the last slot:
+- InProcessBackend: a lock; limits are per process. Keys whose state has
+  run back to "no recent hits" are swept out periodically.
+- SQLiteBackend: a `BEGIN IMMEDIATE` transaction on a shared file, for
+  several workers on one machine.
+- RedisBackend: Lua scripts, for several machines.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+TOKEN_BUCKET = 'token_bucket'
+SLIDING_LOG = 'sliding_log'
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the limit is fully available again.
+    reset_after: float
+    # Seconds until the next hit can succeed; None when this one did.
+    retry_after: Optional[float]
+
+    def headers(self) -> dict:
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(math.ceil(self.reset_after)),
+        }
+        if self.retry_after is not None:
+            headers['Retry-After'] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class BaseBackend:
+    """
+    Backends implement both algorithms as single atomic steps:
+
+    token_bucket(key, capacity, rate, now) -> (allowed, tokens left)
+    sliding_log(key, limit, window, now) -> (allowed, hits in window, oldest hit or None, newest hit or None)
+    """
+
+    def token_bucket(self, key, capacity, rate, now):
+        raise NotImplementedError
+
+    def sliding_log(self, key, limit, window, now):
+        raise NotImplementedError
+
+
+class InProcessBackend(BaseBackend):
+    """
+    State in this process's memory; each worker enforces its own limits.
+
+    Every entry records when it becomes indistinguishable from an unseen
+    key (a full bucket, an empty log). At most every `sweep_interval`
+    seconds those entries are dropped, so keys that stop sending requests
+    do not accumulate.
+    """
+
+    def __init__(self, sweep_interval=60.0):
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        # key -> (tokens, updated, idle_at)
+        self._buckets = {}
+        # key -> (deque of hit times, idle_at)
+        self._logs = {}
+        self._next_sweep = 0.0
+
+    def _sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        for entries in (self._buckets, self._logs):
+            for key in [key for key, entry in entries.items() if entry[-1] <= now]:
+                del entries[key]
+
+    def token_bucket(self, key, capacity, rate, now):
+        with self._lock:
+            self._sweep(now)
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return allowed, tokens
+
+    def sliding_log(self, key, limit, window, now):
+        with self._lock:
+            self._sweep(now)
+            log = self._logs[key][0] if key in self._logs else deque()
+            while log and log[0] <= now - window:
+                log.popleft()
+            allowed = len(log) < limit
+            if allowed:
+                log.append(now)
+            if not log:
+                self._logs.pop(key, None)
+                return allowed, 0, None, None
+            self._logs[key] = (log, log[-1] + window)
+            return allowed, len(log), log[0], log[-1]
+
+
+class SQLiteBackend(BaseBackend):
+    """
+    State in a SQLite file every worker on the machine opens. Each step is a
+    `BEGIN IMMEDIATE` transaction, which takes the database's write lock
+    before reading, so steps from different processes run one at a time.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS token_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS sliding_log (key TEXT NOT NULL, at REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS sliding_log_key_at ON sliding_log (key, at);
+    """
+
+    def __init__(self, path=None, timeout=5.0):
+        self.path = str(path or os.path.join(settings.BASE_DIR, 'ratelimit.sqlite3'))
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and process; sqlite3 connections must not cross either.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(self.schema)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def _atomic(self, step):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = step(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def token_bucket(self, key, capacity, rate, now):
+        def step(connection):
+            row = connection.execute('SELECT tokens, updated FROM token_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute(
+                'INSERT INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now)
+            )
+            return allowed, tokens
+        return self._atomic(step)
+
+    def sliding_log(self, key, limit, window, now):
+        def step(connection):
+            connection.execute('DELETE FROM sliding_log WHERE key = ? AND at <= ?', (key, now - window))
+            count, oldest, newest = connection.execute(
+                'SELECT COUNT(*), MIN(at), MAX(at) FROM sliding_log WHERE key = ?', (key,)
+            ).fetchone()
+            allowed = count < limit
+            if allowed:
+                connection.execute('INSERT INTO sliding_log (key, at) VALUES (?, ?)', (key, now))
+                count += 1
+                oldest = now if oldest is None else oldest
+                newest = now
+            return allowed, count, oldest, newest
+        return self._atomic(step)
+
+
+class RedisBackend(BaseBackend):
+    """State in Redis; each step is one Lua script, which Redis runs atomically."""
+
+    token_bucket_script = """
+        local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = capacity
+        if state[1] then
+            tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+        end
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+        return {allowed, tostring(tokens)}
+    """
+
+    sliding_log_script = """
+        local limit, window, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+        local count = redis.call('ZCARD', KEYS[1])
+        local allowed = 0
+        if count < limit then
+            redis.call('ZADD', KEYS[1], now, ARGV[4])
+            count = count + 1
+            allowed = 1
+        end
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+        local newest = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+        redis.call('PEXPIRE', KEYS[1], math.ceil(window * 1000))
+        return {allowed, count, oldest[2] or '', newest[2] or ''}
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/2', prefix='ratelimit:'):
+        import redis  # Only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._token_bucket = self.client.register_script(self.token_bucket_script)
+        self._sliding_log = self.client.register_script(self.sliding_log_script)
+
+    def token_bucket(self, key, capacity, rate, now):
+        allowed, tokens = self._token_bucket(keys=[f'{self.prefix}tb:{key}'], args=[capacity, rate, repr(now)])
+        return bool(allowed), float(tokens)
+
+    def sliding_log(self, key, limit, window, now):
+        allowed, count, oldest, newest = self._sliding_log(
+            keys=[f'{self.prefix}sl:{key}'], args=[limit, window, repr(now), f'{now!r}:{uuid.uuid4().hex}']
+        )
+        return bool(allowed), int(count), float(oldest) if oldest else None, float(newest) if newest else None
+
+
+class RateLimiter:
+    """LIMIT hits per WINDOW seconds per key, enforced by `algorithm` on `backend`."""
+
+    def __init__(self, backend, algorithm=SLIDING_LOG, limit=10, window=60.0):
+        if algorithm not in (TOKEN_BUCKET, SLIDING_LOG):
+            raise ValueError(f"Unknown rate limiting algorithm {algorithm!r}")
+        self.backend = backend
+        self.algorithm = algorithm
+        self.limit = limit
+        self.window = float(window)
+
+    def hit(self, key, now=None) -> RateLimitResult:
+        """Count one hit against `key`; the result says whether it is allowed."""
+        # Wall-clock time, as the state may be shared between processes.
+        now = time.time() if now is None else now
+        if self.algorithm == TOKEN_BUCKET:
+            rate = self.limit / self.window
+            allowed, tokens = self.backend.token_bucket(key, self.limit, rate, now)
+            return RateLimitResult(
+                allowed=allowed,
+                limit=self.limit,
+                remaining=int(tokens),
+                reset_after=(self.limit - tokens) / rate,
+                retry_after=None if allowed else (1 - tokens) / rate,
+            )
+
+        allowed, hits, oldest, newest = self.backend.sliding_log(key, self.limit, self.window, now)
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.limit,
+            remaining=max(0, self.limit - hits),
+            # The whole limit is back once the newest hit leaves the window; a slot once the oldest does.
+            reset_after=newest + self.window - now if newest is not None else 0.0,
+            retry_after=None if allowed else oldest + self.window - now,
+        )
+
+
+def rate_limiter_from_settings() -> RateLimiter:
+    """Build the RateLimiter described by settings.RATE_LIMIT."""
+    config = getattr(settings, 'RATE_LIMIT', {})
+    backend = import_string(config.get('BACKEND', 'chats.ratelimit.InProcessBackend'))(**config.get('OPTIONS', {}))
+    return RateLimiter(
+        backend,
+        algorithm=config.get('ALGORITHM', SLIDING_LOG),
+        limit=config.get('LIMIT', 10),
+        window=config.get('WINDOW', 60),
+    )
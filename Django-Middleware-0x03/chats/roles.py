@@ -0,0 +1,63 @@
+"""
+Cached role (group name) lookups for authorization checks.
+
+Access tokens carry the user's group names in a `roles` claim, stamped with
+the user's roles version at the time they were issued (`roles_version`,
+see CustomTokenObtainPairSerializer.get_token). The version lives in the
+shared cache and is bumped whenever the user's groups change (see
+chats.signals), so a token's roles are trusted only while its version is
+still current. That check is one cache read and no database query.
+
+Stale tokens, and users without a token, fall back to group names cached
+per (user, version), and only then to the database.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Groups allowed to delete conversations and messages.
+MODERATION_ROLES = frozenset({'admin', 'moderator'})
+DEFAULT_TIMEOUT = 300
+
+
+def roles_version_key(user_id) -> str:
+    return f"roles-version:{user_id}"
+
+
+def get_roles_version(user_id) -> int:
+    """
+    The current roles version of `user_id`. A missing counter is started at the
+    current time in nanoseconds, so an evicted counter never comes back at a
+    value an old token was stamped with.
+    """
+    return cache.get_or_set(roles_version_key(user_id), time.time_ns, timeout=None)
+
+
+def bump_roles_version(user_ids) -> None:
+    """Invalidate the roles claims and cached roles of the given users."""
+    for user_id in user_ids:
+        key = roles_version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not cached: start a fresh counter instead.
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def load_roles(user) -> list:
+    return sorted(user.groups.values_list('name', flat=True))
+
+
+def get_roles(user, token=None) -> frozenset:
+    """The group names of `user`, from `token`'s claim when it is still current."""
+    version = get_roles_version(user.user_id)
+    if token is not None and 'roles' in token and token.get('roles_version') == version:
+        return frozenset(token['roles'])
+
+    key = f"roles:{user.user_id}:{version}"
+    roles = cache.get(key)
+    if roles is None:
+        roles = load_roles(user)
+        cache.set(key, roles, getattr(settings, 'ROLES_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return frozenset(roles)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import User, Conversation, Message
+from .moderation import get_moderation_list
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,6 +32,8 @@ class MessageSerializer(serializers.ModelSerializer):
     def validate_message_body(self, value):
         if not value.strip():
             raise serializers.ValidationError("Message Body Cannot Be Empty")
+        if get_moderation_list().contains(value):
+            raise serializers.ValidationError("Your message contains offensive language. Please edit !.")
         return value
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -0,0 +1,53 @@
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .models import User
+from .roles import bump_roles_version
+
+
+@receiver([post_save, post_delete], sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    """Drop a saved or deleted user from this process's JWT user cache."""
+    user_cache.delete(str(instance.user_id))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Bump the roles version of every user whose groups changed, from either
+    side (user.groups.add(...) or group.custom_users.add(...)).
+    """
+    if action == 'pre_clear':
+        # pk_set is None for clear(); remember who is about to be removed.
+        instance._cleared_role_users = (
+            {instance.pk} if not reverse else set(instance.custom_users.values_list('pk', flat=True))
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        user_ids = instance.__dict__.pop('_cleared_role_users', set())
+    else:
+        user_ids = {instance.pk} if not reverse else set(pk_set or ())
+    bump_after_commit(user_ids)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_roles(sender, instance, created=False, **kwargs):
+    """A renamed or deleted group changes the roles of all its members."""
+    if not created:
+        bump_after_commit(set(instance.custom_users.values_list('pk', flat=True)))
+
+
+def bump_after_commit(user_ids):
+    """
+    Bump now, so this transaction stops trusting old claims, and again on
+    commit: roles read by other requests before then are the old ones, and
+    may have been cached under the first bump's version.
+    """
+    bump_roles_version(user_ids)
+    transaction.on_commit(lambda: bump_roles_version(user_ids))
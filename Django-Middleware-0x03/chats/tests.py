@@ -1,3 +1,470 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .middleware import QueryBudgetExceeded
+from .models import Conversation, User
+
+
+def setUpModule():
+    """
+    Point everything the middleware writes to disk (the request log, the
+    rate-limit database and the metrics files) at a temporary directory, so
+    running the suite leaves the working tree untouched.
+    """
+    global _scratch, _scratch_settings
+    import tempfile
+    from pathlib import Path
+    from django.conf import settings
+
+    _scratch = tempfile.TemporaryDirectory()
+    scratch = Path(_scratch.name)
+    _scratch_settings = override_settings(
+        REQUEST_LOGGING={**settings.REQUEST_LOGGING, 'filename': str(scratch / 'requests.log')},
+        RATE_LIMIT={
+            **settings.RATE_LIMIT,
+            'BACKEND': 'chats.ratelimit.SQLiteBackend',
+            'OPTIONS': {'path': str(scratch / 'ratelimit.sqlite3')},
+        },
+        METRICS={'DIRECTORY': str(scratch / 'metrics')},
+    )
+    _scratch_settings.enable()
+
+
+def tearDownModule():
+    from . import middleware
+    from .metrics import request_metrics
+
+    if middleware.request_log_handler is not None:
+        middleware.request_log_handler.stop()
+    request_metrics._pid = None
+    _scratch_settings.disable()
+    _scratch.cleanup()
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    """
+    Every request reports its database work in a Server-Timing header, and
+    a view going over its query budget fails the request in strict mode.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', email='budget@test.com')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user)
+
+    def get_conversations(self):
+        # Middleware settings are read once per handler, so build the client here.
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.get('/api/chats/conversations/')
+
+    def test_server_timing_header(self):
+        response = self.get_conversations()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries, \d+ duplicate", app;dur=')
+
+    def test_budget_exceeded_in_strict_mode(self):
+        with override_settings(QUERY_BUDGET={'VIEWS': {'conversation-list': 0}, 'STRICT': True}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.get_conversations()
+
+    def test_budget_exceeded_logs_warning_by_default(self):
+        with override_settings(QUERY_BUDGET={'DEFAULT': 0}):
+            with self.assertLogs('db-queries', level='WARNING'):
+                self.get_conversations()
+
+
+class MetricsTests(TestCase):
+    """
+    Requests are counted and timed per route, method and status, and
+    /metrics sums the samples every worker process wrote.
+    """
+
+    def setUp(self):
+        import tempfile
+        from .metrics import request_metrics
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(METRICS={'DIRECTORY': self.directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Make the registry open a file in the temporary directory.
+        request_metrics._pid = None
+        self.addCleanup(setattr, request_metrics, '_pid', None)
+        self.user = User.objects.create_user(username='metered', email='metered@test.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_requests_are_counted_per_route(self):
+        self.client.get('/api/chats/conversations/')
+        self.client.get('/api/chats/conversations/')
+        self.client.get('/no-such-page/')
+        body = self.client.get('/metrics').content.decode()
+        route = 'api/chats/conversations/$'
+        self.assertIn(f'http_requests_total{{method="GET",route="{route}",status="200"}} 2', body)
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",route="{route}",status="200"}} 2', body)
+        self.assertIn(
+            f'http_request_duration_seconds_bucket{{method="GET",route="{route}",status="200",le="+Inf"}} 2', body
+        )
+        self.assertIn('http_requests_total{method="GET",route="unmatched",status="404"} 1', body)
+
+    def test_short_circuited_responses_keep_their_route(self):
+        import uuid
+        from django.urls import resolve
+
+        url = f'/api/chats/conversations/{uuid.uuid4()}/messages/'
+        # Refused by the offensive-language (or, out of hours, the time-restriction) middleware.
+        response = self.client.post(url, {'message_body': 'you idiot'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn(f'http_requests_total{{method="POST",route="{resolve(url).route}",status="403"}} 1', body)
+
+    def test_samples_of_all_workers_are_summed(self):
+        import json
+        import os
+        from .metrics import MmapValues, request_metrics
+
+        request_metrics.observe('chats', 'GET', 200, 0.02)
+        # What another worker process leaves behind: a file of its own.
+        other_worker = MmapValues(os.path.join(self.directory, 'requests_1.db'))
+        labels = {'route': 'chats', 'method': 'GET', 'status': '200'}
+        for _ in range(3):
+            other_worker.increment(json.dumps(['http_requests_total', labels]))
+        body = request_metrics.render()
+        self.assertIn('http_requests_total{method="GET",route="chats",status="200"} 4', body)
+
+
+class QueuedRequestLoggingTests(TestCase):
+    """
+    Request log records are queued and written by a background thread as
+    JSON lines; a full queue drops records instead of blocking.
+    """
+
+    def make_handler(self, **options):
+        import tempfile
+        from pathlib import Path
+        from .log_handlers import BatchRotatingFileHandler, BoundedQueueHandler, JSONLinesFormatter
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'requests.log'
+        file_handler = BatchRotatingFileHandler(self.path, delay=True)
+        file_handler.setFormatter(JSONLinesFormatter())
+        self.addCleanup(file_handler.close)
+        return BoundedQueueHandler(file_handler, **options)
+
+    def make_logger(self, handler):
+        import logging
+
+        logger = logging.getLogger(f'api-requests-test.{id(handler)}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        return logger
+
+    def test_records_are_written_as_json_lines(self):
+        import json
+
+        handler = self.make_handler()
+        handler.start()
+        logger = self.make_logger(handler)
+        for status in (200, 404):
+            logger.info('', extra={'user': 'alice', 'method': 'GET', 'path': '/api/chats/', 'status': status})
+        handler.stop()
+        lines = [json.loads(line) for line in self.path.read_text().splitlines()]
+        self.assertEqual([line['status'] for line in lines], [200, 404])
+        self.assertEqual(lines[0]['user'], 'alice')
+        self.assertEqual(lines[0]['logger'], logger.name)
+
+    def test_stop_flushes_a_full_queue(self):
+        handler = self.make_handler(queue_size=2, overflow='drop')
+        logger = self.make_logger(handler)
+        for _ in range(2):
+            logger.info('request')
+        # The stop marker has to wait for a free slot instead of failing on a full queue.
+        handler.start()
+        handler.stop()
+        self.assertFalse(handler.listener.running)
+        self.assertEqual(len(self.path.read_text().splitlines()), 2)
+
+    def test_full_queue_drops_records(self):
+        # The writer is not started, so nothing leaves the queue.
+        handler = self.make_handler(queue_size=2, overflow='drop')
+        logger = self.make_logger(handler)
+        for _ in range(5):
+            logger.info('request')
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(handler.queue.qsize(), 2)
+
+
+class JWTUserCacheTests(TestCase):
+    """
+    The Bearer token is validated once per request and its user is loaded
+    at most once, then served from the per-process user cache.
+    """
+
+    def setUp(self):
+        from .auth import CustomTokenObtainPairSerializer
+        from .authentication import user_cache
+
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(username='cached', email='cached@test.com')
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def user_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/chats/conversations/')
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "chats_user"' in query['sql']]
+
+    def test_one_user_lookup_then_none(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    def test_saving_the_user_evicts_it(self):
+        self.user_queries()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(len(self.user_queries()), 1)
+
+    def test_invalid_token_is_still_rejected(self):
+        response = APIClient(HTTP_AUTHORIZATION='Bearer not-a-token').get('/api/chats/conversations/')
+        self.assertEqual(response.status_code, 401)
+
+
+class RateLimiterTests(TestCase):
+    """
+    Both algorithms hold their limit on every backend, including under 64
+    concurrent clients, and the middleware reports it in response headers.
+    """
+
+    def backends(self):
+        import os
+        import tempfile
+        import uuid
+        from pathlib import Path
+        from .ratelimit import InProcessBackend, RedisBackend, SQLiteBackend
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        yield InProcessBackend()
+        yield SQLiteBackend(Path(directory.name) / 'ratelimit.sqlite3', timeout=30)
+        # Redis runs too when a server is available, e.g. redis://127.0.0.1:6379/15.
+        if os.environ.get('RATE_LIMIT_TEST_REDIS_URL'):
+            yield RedisBackend(os.environ['RATE_LIMIT_TEST_REDIS_URL'], prefix=f'ratelimit-test-{uuid.uuid4().hex}:')
+
+    def test_sliding_log(self):
+        from .ratelimit import RateLimiter
+
+        for backend in self.backends():
+            limiter = RateLimiter(backend, 'sliding_log', limit=3, window=10)
+            results = [limiter.hit('user', now=100 + i) for i in range(4)]
+            self.assertEqual([result.allowed for result in results], [True, True, True, False])
+            self.assertEqual(results[2].remaining, 0)
+            # The first hit leaves the window at 110, the last accepted one at 112.
+            self.assertEqual(results[3].retry_after, 7)
+            self.assertEqual(results[3].reset_after, 9)
+            self.assertTrue(limiter.hit('user', now=110.5).allowed)
+
+    def test_idle_keys_are_forgotten(self):
+        from .ratelimit import InProcessBackend, RateLimiter
+
+        for algorithm in ('sliding_log', 'token_bucket'):
+            backend = InProcessBackend(sweep_interval=5)
+            limiter = RateLimiter(backend, algorithm, limit=2, window=10)
+            for i in range(100):
+                limiter.hit(f'client-{i}', now=100)
+            limiter.hit('active', now=200)
+            self.assertEqual(set(backend._logs) | set(backend._buckets), {'active'})
+
+    def test_token_bucket(self):
+        from .ratelimit import RateLimiter
+
+        for backend in self.backends():
+            limiter = RateLimiter(backend, 'token_bucket', limit=2, window=10)
+            results = [limiter.hit('user', now=100) for _ in range(3)]
+            self.assertEqual([result.allowed for result in results], [True, True, False])
+            # One token comes back every 5 seconds.
+            self.assertEqual(results[2].retry_after, 5)
+            self.assertTrue(limiter.hit('user', now=105).allowed)
+
+    def test_limit_holds_under_64_concurrent_clients(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .ratelimit import RateLimiter
+
+        for backend in self.backends():
+            for algorithm in ('sliding_log', 'token_bucket'):
+                limiter = RateLimiter(backend, algorithm, limit=50, window=3600)
+                with ThreadPoolExecutor(max_workers=64) as pool:
+                    results = list(pool.map(lambda _: limiter.hit(f'stress-{algorithm}').allowed, range(64 * 4)))
+                self.assertEqual(sum(results), 50, (type(backend).__name__, algorithm))
+
+    def test_middleware_headers(self):
+        from .authentication import user_cache
+
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        user = User.objects.create_user(username='limited', email='limited@test.com')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(user)
+        from .auth import CustomTokenObtainPairSerializer
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        url = f'/api/chats/conversations/{conversation.conversation_id}/messages/'
+        rate_limit = {'BACKEND': 'chats.ratelimit.InProcessBackend', 'LIMIT': 2, 'WINDOW': 60}
+        with override_settings(RATE_LIMIT=rate_limit):
+            client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+            responses = [client.post(url, {'message_body': 'hello'}, format='json') for _ in range(3)]
+        self.assertEqual(responses[0]['X-RateLimit-Limit'], '2')
+        self.assertEqual(responses[0]['X-RateLimit-Remaining'], '1')
+        self.assertEqual(responses[2].status_code, 429)
+        self.assertEqual(responses[2]['X-RateLimit-Remaining'], '0')
+        self.assertGreaterEqual(int(responses[2]['Retry-After']), 59)
+
+
+class RoleClaimTests(TestCase):
+    """
+    Moderation checks read the roles claim of the access token while the
+    user's roles version is current, and go back to the groups once it is bumped.
+    """
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from .auth import CustomTokenObtainPairSerializer
+        from .authentication import user_cache
+
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.moderators = Group.objects.create(name='moderator')
+        self.user = User.objects.create_user(username='moderating', email='moderating@test.com')
+        self.user.groups.add(self.moderators)
+        self.token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client = APIClient(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def delete_conversation(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f'/api/chats/conversations/{conversation.conversation_id}/')
+        return response, [query['sql'] for query in queries if 'auth_group' in query['sql']]
+
+    def test_token_carries_roles(self):
+        self.assertEqual(self.token['roles'], ['moderator'])
+        response, group_queries = self.delete_conversation()
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(group_queries, [])
+
+    def test_group_change_makes_the_claim_stale(self):
+        self.user.groups.remove(self.moderators)
+        response, group_queries = self.delete_conversation()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(group_queries), 1)
+
+    def test_group_membership_changed_from_the_group_side(self):
+        from .roles import get_roles_version
+
+        version = get_roles_version(self.user.user_id)
+        self.moderators.custom_users.clear()
+        self.assertNotEqual(get_roles_version(self.user.user_id), version)
+
+    def test_roles_read_before_commit_are_retired(self):
+        from django.core.cache import cache
+        from .roles import get_roles, get_roles_version
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.moderators)
+            # A concurrent request that still sees the old groups caches them
+            # under the version bumped before the commit.
+            cache.set(f"roles:{self.user.user_id}:{get_roles_version(self.user.user_id)}", ['moderator'])
+        self.assertEqual(get_roles(self.user), frozenset())
+
+
+class ModerationTests(TestCase):
+    """
+    The word-list engine catches obfuscated terms as whole words only, picks
+    up word-list edits without a restart, and backs both the middleware and
+    the message serializer.
+    """
+
+    def test_obfuscations_and_whole_words(self):
+        from .moderation import ModerationEngine
+
+        engine = ModerationEngine(['stupid', 'idiot', 'dude', 'ass'])
+        self.assertEqual(engine.find('you are stuuuupid'), ['stupid'])
+        self.assertEqual(engine.find('what an 1d10t!'), ['idiot'])
+        self.assertEqual(engine.find('hey DUDE. stup1d'), ['dude', 'stupid'])
+        self.assertEqual(engine.find('a classic, dudes'), [])
+
+    def test_repeats_in_terms_are_kept(self):
+        from .moderation import ModerationEngine
+
+        engine = ModerationEngine(['ass', 'butt', 'boob', 'stupid'])
+        self.assertEqual(engine.find('as good as it gets, but Bob said so'), [])
+        self.assertEqual(engine.find('stuuupid aaasss buttt b00b'), ['stupid', 'ass', 'butt', 'boob'])
+
+    def test_overlapping_terms(self):
+        from .moderation import ModerationEngine
+
+        engine = ModerationEngine(['he', 'she', 'his', 'hers'])
+        self.assertEqual(engine.find('she said hers, not his'), ['she', 'hers', 'his'])
+
+    def test_wordlist_is_reloaded_when_it_changes(self):
+        import os
+        import tempfile
+        from pathlib import Path
+        from .moderation import ModerationList
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wordlist = Path(directory.name) / 'words.txt'
+        wordlist.write_text('# offensive terms\nstupid\n', encoding='utf-8')
+        moderation = ModerationList(wordlist, check_interval=0)
+        self.assertTrue(moderation.contains('stupid'))
+        self.assertFalse(moderation.contains('silly'))
+
+        wordlist.write_text('silly\n', encoding='utf-8')
+        stat = wordlist.stat()
+        os.utime(wordlist, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertTrue(moderation.contains('silly'))
+        self.assertFalse(moderation.contains('stupid'))
+
+    def test_messages_are_rejected(self):
+        import json
+        from .auth import CustomTokenObtainPairSerializer
+        from .authentication import user_cache
+        from .serializers import MessageSerializer
+
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        user = User.objects.create_user(username='moderated', email='moderated@test.com')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(user)
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {token}')
+        url = f'/api/chats/conversations/{conversation.conversation_id}/messages/'
+        message = {'conversation': str(conversation.conversation_id)}
+
+        self.assertEqual(client.post(url, {**message, 'message_body': 'you stuuup1d'}, format='json').status_code, 403)
+        # JSON escapes cannot hide a term from the middleware.
+        escaped = json.dumps({**message, 'message_body': '\\u0069diot'}).replace('\\\\', '\\')
+        self.assertEqual(client.post(url, escaped, content_type='application/json').status_code, 403)
+        # Clean messages get past moderation to the view.
+        response = client.post(url, {**message, 'message_body': 'as good as a classic, but'}, format='json')
+        self.assertNotEqual(response.status_code, 403)
+        self.assertNotIn('message_body', response.json())
+
+        serializer = MessageSerializer(data={'message_body': 'hey duuude'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('message_body', serializer.errors)
+        serializer = MessageSerializer(data={'message_body': 'as good as it gets, but'})
+        serializer.is_valid()
+        self.assertNotIn('message_body', serializer.errors)
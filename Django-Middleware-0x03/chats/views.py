@@ -10,6 +10,8 @@ from .filters import MessageFilter
 from .pagination import MessagePagination  # Import custom pagination class
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
+from .metrics import request_metrics
 
 class ConversationViewSet(viewsets.ModelViewSet):
     """
@@ -130,4 +132,12 @@ def get_me(request):
     """
     user = request.user
     serializer = UserSerializer(user)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+
+def metrics(request):
+    """
+    Request counters and latency histograms of all workers, in the
+    Prometheus text format. Plain Django view: scrapers send no JWT.
+    """
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
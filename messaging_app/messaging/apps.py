@@ -1,11 +1,15 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class MessagingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'messaging'
 
-    """
     def ready(self):
-        import messaging.signals 
-    """
\ No newline at end of file
+        import messaging.signals  # Connects the Message/ChatUser signal receivers
+        from messaging.search import install_sqlite_index
+        post_migrate.connect(install_sqlite_index, sender=self)  # SQLite full-text fallback
+        from messaging.cache import check_message_list_cache
+        checks.register(check_message_list_cache, checks.Tags.caches)
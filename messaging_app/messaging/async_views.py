@@ -0,0 +1,116 @@
+"""
+Async (ASGI-native) variants of the hot read endpoints.
+
+These are plain Django async views rather than DRF viewsets: DRF's request
+cycle is synchronous, so every DRF view holds a worker thread for the whole
+request under an ASGI server. Here authentication, permission checks and
+queries all go through Django's async ORM (afirst, aexists, aiterator), so a
+slow database call suspends the coroutine instead of pinning a thread.
+Response bodies match their synchronous counterparts.
+"""
+import functools
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import ChatUser, Conversation, Message, UnreadCounter
+from .pagination import InboxCursorPagination, MessageCursorPagination
+from .permissions import is_conversation_participant
+from .serializers import (
+    InboxConversationSerializer, MessageSerializer, UnreadCounterSerializer, UserSerializer
+)
+
+jwt_auth = JWTAuthentication()
+
+
+async def authenticate(request):
+    """
+    Resolve the caller from a Bearer JWT, falling back to the session.
+    Token validation is pure CPU; the only database access is one afirst().
+    """
+    raw_token = jwt_auth.get_raw_token(jwt_auth.get_header(request) or b'')
+    if raw_token is None:
+        auser = getattr(request, 'auser', None)
+        return await auser() if auser else AnonymousUser()
+    return await user_for_token(raw_token)
+
+
+async def user_for_token(raw_token):
+    """The active ChatUser a raw access token belongs to, or AnonymousUser."""
+    try:
+        validated_token = jwt_auth.get_validated_token(raw_token)
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return AnonymousUser()
+    user = await ChatUser.objects.filter(
+        **{jwt_settings.USER_ID_FIELD: user_id}, is_active=True
+    ).afirst()
+    return user or AnonymousUser()
+
+
+def async_api_view(view):
+    """
+    Authenticate the request, reject anonymous callers with 401 and turn DRF
+    exceptions (e.g. an invalid cursor) into JSON error responses.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await authenticate(request)
+        if not request.user.is_authenticated:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+    return wrapper
+
+
+@require_GET
+@async_api_view
+async def conversation_list(request):
+    """The caller's conversations by most recent activity (async inbox)."""
+    conversations = Conversation.objects.filter(
+        participants=request.user,
+        last_message_at__isnull=False
+    ).select_related('last_message__sender')
+    paginator = InboxCursorPagination()
+    page = await paginator.apaginate_queryset(conversations, request)
+    serializer = InboxConversationSerializer(page, many=True)
+    return JsonResponse(paginator.get_paginated_data(serializer.data))
+
+
+@require_GET
+@async_api_view
+async def conversation_messages(request, conversation_id):
+    """One cursor page of a conversation's messages, newest first."""
+    if not await is_conversation_participant(request.user, conversation_id):
+        return JsonResponse({"detail": "You are not a participant in this conversation."}, status=403)
+    messages = Message.objects.filter(conversation_id=conversation_id).select_related('sender')
+    paginator = MessageCursorPagination()
+    page = await paginator.apaginate_queryset(messages, request)
+    serializer = MessageSerializer(page, many=True)
+    return JsonResponse(paginator.get_paginated_data(serializer.data))
+
+
+@require_GET
+@async_api_view
+async def unread(request):
+    """Unread message counts per conversation, read from UnreadCounter."""
+    counters = [counter async for counter in UnreadCounter.objects.for_user(request.user).aiterator()]
+    serializer = UnreadCounterSerializer(counters, many=True)
+    return JsonResponse({
+        'total': sum(counter['unread_count'] for counter in serializer.data),
+        'conversations': serializer.data
+    })
+
+
+@require_GET
+@async_api_view
+async def get_me(request):
+    """The authenticated user's profile; no query beyond authentication."""
+    return JsonResponse(UserSerializer(request.user).data)
@@ -0,0 +1,148 @@
+"""
+Event-driven invalidation for cached conversation message lists.
+
+Every conversation has a version number in the cache. It is part of the
+cache key of every cached message-list page, and the Message post_save /
+post_delete signals bump it, so a write makes all cached pages for that
+conversation unreachable at once; orphaned entries simply expire.
+
+A bump only reaches the cache it is written to. With a shared cache (Redis,
+Memcached) pages can therefore be cached for hours without ever serving a
+stale list. With a per-process LocMemCache, bumps made by other workers or
+by management commands never reach a serving process, so its pages must
+expire quickly: settings.MESSAGE_LIST_CACHE_TIMEOUT stays short unless the
+default cache is shared, and check_message_list_cache() fails `manage.py
+check` otherwise.
+
+CountingCacheResponse additionally records cache hits and misses per
+endpoint, readable through get_cache_stats().
+"""
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from rest_framework_extensions.cache.decorators import CacheResponse
+from rest_framework_extensions.key_constructor.bits import KeyBitBase
+
+STATS_ENDPOINTS_KEY = 'cache-stats:endpoints'
+DEFAULT_MESSAGE_LIST_TIMEOUT = 60
+# Longest message-list timeout allowed on a cache that other processes cannot see.
+PROCESS_LOCAL_MAX_TIMEOUT = 60
+PROCESS_LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+def conversation_version_key(conversation_id) -> str:
+    return f"conversation-version:{conversation_id}"
+
+
+def get_conversation_version(conversation_id) -> int:
+    """
+    The current version of a conversation's message list.
+    A missing version (never written, or evicted) starts from the current
+    time in nanoseconds rather than 1, so it can never collide with a
+    version some still-cached page was stored under.
+    """
+    return cache.get_or_set(conversation_version_key(conversation_id), time.time_ns, timeout=None)
+
+
+def bump_conversation_version(conversation_id) -> None:
+    """Invalidate every cached message-list page of a conversation."""
+    key = conversation_version_key(conversation_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def message_list_timeout():
+    """Seconds a cached message-list page lives (settings.MESSAGE_LIST_CACHE_TIMEOUT)."""
+    return getattr(settings, 'MESSAGE_LIST_CACHE_TIMEOUT', DEFAULT_MESSAGE_LIST_TIMEOUT)
+
+
+def check_message_list_cache(app_configs, **kwargs):
+    """System check: long-lived message-list pages need a cache shared by every process."""
+    timeout = message_list_timeout()
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_BACKENDS and (timeout is None or timeout > PROCESS_LOCAL_MAX_TIMEOUT):
+        return [checks.Error(
+            f"MESSAGE_LIST_CACHE_TIMEOUT is {timeout}, but the default cache ({backend}) is per process.",
+            hint=(
+                "Conversation version bumps made by other workers and management commands never "
+                f"reach a per-process cache. Configure a shared cache or keep the timeout at "
+                f"{PROCESS_LOCAL_MAX_TIMEOUT} seconds or less."
+            ),
+            id='messaging.E001',
+        )]
+    return []
+
+
+class ConversationVersionKeyBit(KeyBitBase):
+    """
+    Key bit holding the version of the conversation named in the URL
+    (`conversation_id` on the flat route, `conversation_id_pk` when nested).
+    """
+    def get_data(self, params, view_instance, view_method, request, args, kwargs):
+        conversation_id = kwargs.get('conversation_id') or kwargs.get('conversation_id_pk')
+        if conversation_id is None:
+            return None
+        return str(get_conversation_version(conversation_id))
+
+
+def _increment(key) -> None:
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def record_cache_access(endpoint: str, hit: bool) -> None:
+    endpoints = cache.get(STATS_ENDPOINTS_KEY, set())
+    if endpoint not in endpoints:
+        cache.set(STATS_ENDPOINTS_KEY, endpoints | {endpoint}, timeout=None)
+    _increment(f"cache-stats:{endpoint}:{'hits' if hit else 'misses'}")
+
+
+def get_cache_stats() -> dict:
+    """Hit and miss counts for every endpoint served through CountingCacheResponse."""
+    stats = {}
+    for endpoint in sorted(cache.get(STATS_ENDPOINTS_KEY, set())):
+        hits = cache.get(f"cache-stats:{endpoint}:hits", 0)
+        misses = cache.get(f"cache-stats:{endpoint}:misses", 0)
+        stats[endpoint] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None
+        }
+    return stats
+
+
+class CountingCacheResponse(CacheResponse):
+    """
+    drf-extensions' cache_response that also counts hits and misses per
+    endpoint and labels each response with an `X-Cache: HIT|MISS` header.
+    A miss is detected by the view method actually being called.
+    """
+    def process_cache_response(self, view_instance, view_method, request, args, kwargs):
+        called = False
+
+        def counted_view_method(*view_args, **view_kwargs):
+            nonlocal called
+            called = True
+            return view_method(*view_args, **view_kwargs)
+
+        response = super().process_cache_response(
+            view_instance=view_instance,
+            view_method=counted_view_method,
+            request=request,
+            args=args,
+            kwargs=kwargs
+        )
+        endpoint = f"{view_instance.__class__.__name__}.{view_method.__name__}"
+        record_cache_access(endpoint, hit=not called)
+        response['X-Cache'] = 'MISS' if called else 'HIT'
+        return response
+
+
+counting_cache_response = CountingCacheResponse
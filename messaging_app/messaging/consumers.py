@@ -0,0 +1,93 @@
+"""
+WebSocket endpoint that pushes new messages to conversation participants.
+
+    ws://<host>/ws/conversations/<conversation_id>/?token=<access token>
+
+This is a plain ASGI application mounted next to Django in asgi.py, so no
+extra framework is needed. A client authenticates with its JWT access token
+(query string, since browsers cannot set headers on a WebSocket handshake,
+or an Authorization header), must be a participant of the conversation, and
+then receives one JSON frame per message created in it:
+
+    {"type": "message.created", "message": {...MessageSerializer data...}}
+
+Messages are fanned out by the broker configured in realtime.py.
+"""
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from .async_views import user_for_token
+from .permissions import is_conversation_participant
+from .realtime import conversation_channel, get_broker
+
+CONVERSATION_PATH = re.compile(r'^/ws/conversations/(?P<conversation_id>[0-9a-f-]{36})/?$')
+
+# Close codes in the 4000-4999 range are reserved for applications.
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+
+def get_raw_token(scope):
+    """The access token from ?token= or an `Authorization: Bearer` header."""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0] == 'Bearer':
+                return parts[1]
+    return None
+
+
+async def conversation_websocket(scope, receive, send):
+    """Accept a watcher for one conversation and stream its new messages."""
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    match = CONVERSATION_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    conversation_id = match['conversation_id']
+
+    raw_token = get_raw_token(scope)
+    user = await user_for_token(raw_token) if raw_token else None
+    allowed = user is not None and await is_conversation_participant(user, conversation_id)
+    # The handshake queries ran on a worker thread; release its connection
+    # rather than holding it for the lifetime of the socket.
+    await sync_to_async(close_old_connections)()
+    if user is None or not user.is_authenticated:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    if not allowed:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    subscription = await get_broker().subscribe(conversation_channel(conversation_id))
+    await send({'type': 'websocket.accept'})
+
+    async def push():
+        while True:
+            payload = await subscription.get()
+            await send({'type': 'websocket.send', 'text': json.dumps(payload, cls=DjangoJSONEncoder)})
+
+    async def wait_for_disconnect():
+        # The channel is push-only; anything the client sends is ignored.
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+
+    pusher = asyncio.create_task(push())
+    try:
+        await wait_for_disconnect()
+    finally:
+        pusher.cancel()
+        await subscription.close()
@@ -0,0 +1,153 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from messaging.models import ChatUser, Conversation, Message, UnreadCounter
+from messaging.views import ConversationViewSet, MessageSearchView, MessageViewSet
+
+# A full read of a table: "Seq Scan on t" in PostgreSQL, a bare "SCAN t" in SQLite
+# ("SCAN t USING INDEX i" walks an index and FTS5 lookups are "VIRTUAL TABLE" scans).
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\b(?:USING|VIRTUAL TABLE)\b)'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN (ANALYZE on PostgreSQL) the queries the messaging viewsets issue, "
+        "as they issue them, and flag sequential scans. Run against a seeded database "
+        "(see `manage.py seed`); the planner ignores indexes on tiny tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=None,
+            help="Username to run the queries as (default: the member of the most conversations)."
+        )
+        parser.add_argument(
+            '--conversation',
+            default=None,
+            help="Conversation id for the per-conversation queries (default: the user's busiest)."
+        )
+        parser.add_argument('--search', default='hello', help="Search term for the search query (default: hello).")
+        parser.add_argument(
+            '--disable-seqscan',
+            action='store_true',
+            help="PostgreSQL only: plan with enable_seqscan off, so any remaining Seq Scan means no usable index."
+        )
+        parser.add_argument(
+            '--fail-on-seq-scan',
+            action='store_true',
+            help="Exit with an error if any query reads a whole table (for CI)."
+        )
+        parser.add_argument(
+            '--refresh-stats',
+            action='store_true',
+            help="Run ANALYZE first so the planner sees the seeded data rather than stale statistics."
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQ_SCAN_PATTERNS:
+            raise CommandError(f"Query plans cannot be audited on {connection.vendor}.")
+        user = self.get_user(options['user'])
+        conversation = self.get_conversation(user, options['conversation'])
+        self.stdout.write(f"Auditing query plans as {user.username} in conversation {conversation.conversation_id}")
+        if options['refresh_stats']:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        # Scans of CTEs and subquery results are expected; only real tables count.
+        tables = set(connection.introspection.table_names())
+        flagged = []
+        for label, queryset in self.queries(user, conversation, options['search']):
+            plan = self.explain(queryset, options['disable_seqscan'])
+            scans = sorted({
+                match.group(1)
+                for line in plan.splitlines()
+                if (match := SEQ_SCAN_PATTERNS[connection.vendor].search(line)) and match.group(1) in tables
+            })
+            if scans:
+                flagged.append(label)
+                self.stdout.write(self.style.WARNING(f"{label}: sequential scan of {', '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{label}: ok"))
+            if scans or options['verbosity'] > 1:
+                self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+
+        if flagged and options['fail_on_seq_scan']:
+            raise CommandError(f"{len(flagged)} queries read a whole table: {', '.join(flagged)}")
+
+    def queries(self, user, conversation, search):
+        """(label, queryset) for every query shape the viewsets send, sliced the way their paginators slice it."""
+        cid = conversation.conversation_id
+        root = Message.objects.filter(conversation_id=cid, parent_message__isnull=True).first()
+
+        yield 'conversations.list', self.view_queryset(ConversationViewSet, user, '/', 'list')
+        yield 'conversations.inbox', self.view_queryset(ConversationViewSet, user, '/', 'inbox', paginate=True)
+        yield 'messages.list', self.view_queryset(
+            MessageViewSet, user, '/', 'list', paginate=True, conversation_id_pk=cid
+        )
+        yield 'messages.list (all conversations)', self.view_queryset(
+            MessageViewSet, user, '/', 'list', paginate=True
+        )
+        yield 'messages.unread', UnreadCounter.objects.for_user(user)
+        # The WHERE clause of mark_read's UPDATE.
+        yield 'messages.mark_read', Message.objects.filter(conversation_id=cid, receiver=user, read=False)
+        if root is not None:
+            yield 'messages.thread', Message.objects.thread(root.pk, MessageViewSet.thread_default_depth)
+        yield 'messages.search', self.view_queryset(
+            MessageSearchView, user, f'/?q={search}', 'list', paginate=True
+        )
+
+    def view_queryset(self, view_class, user, path, action, paginate=False, **kwargs):
+        """Build a view for a GET as `user` and return the queryset it would evaluate."""
+        request = Request(APIRequestFactory().get(path, HTTP_HOST='localhost'))
+        request.user = user
+        view = view_class()
+        view.setup(request, **kwargs)
+        view.action = action
+        view.format_kwarg = None
+        action_kwargs = getattr(getattr(view, action, None), 'kwargs', {})
+        pagination_class = action_kwargs.get('pagination_class', view.pagination_class)
+
+        queryset = view.filter_queryset(view.get_queryset())
+        if paginate and pagination_class is not None:
+            queryset = pagination_class()._window(queryset, request)
+        return queryset
+
+    def explain(self, queryset, disable_seqscan):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        with transaction.atomic():
+            if disable_seqscan:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain(analyze=True, buffers=True)
+
+    def get_user(self, username):
+        if username is not None:
+            user = ChatUser.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"No user named {username!r}.")
+            return user
+        user = ChatUser.objects.annotate(conversation_count=Count('conversations')).order_by(
+            '-conversation_count'
+        ).first()
+        if user is None:
+            raise CommandError("The database has no users; run `manage.py seed` first.")
+        return user
+
+    def get_conversation(self, user, conversation_id):
+        conversations = Conversation.objects.filter(participants=user)
+        if conversation_id is not None:
+            conversation = conversations.filter(conversation_id=conversation_id).first()
+        else:
+            conversation = conversations.annotate(messages_seen=Count('messages')).order_by('-messages_seen').first()
+        if conversation is None:
+            raise CommandError(f"{user.username} takes part in no matching conversation.")
+        return conversation
@@ -0,0 +1,91 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from messaging.models import ChatUser, Conversation, Message, Notification, NotificationOutbox
+from messaging.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark group-chat notification fan-out: send messages into one large "
+        "conversation at a fixed rate, then drain the outbox. All rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=25, help="Conversation size (default: 25).")
+        parser.add_argument('--rate', type=float, default=100.0, help="Messages sent per second (default: 100).")
+        parser.add_argument('--seconds', type=float, default=10.0, help="Length of the send phase (default: 10).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Outbox events per drain batch (default: 500).")
+
+    def handle(self, *args, **options):
+        # The drain phase processes the whole outbox, so pending real events
+        # would be turned into notifications and skew the measurement.
+        pending = NotificationOutbox.objects.count()
+        if pending:
+            raise CommandError(
+                f"The notification outbox has {pending} pending events; run "
+                f"process_notification_outbox --once before benchmarking."
+            )
+        with transaction.atomic():
+            conversation, members = self.create_conversation(options['participants'])
+            send_latencies = self.send_phase(conversation, members, options['rate'], options['seconds'])
+            drained, notifications, elapsed = self.drain_phase(options['batch_size'])
+            transaction.set_rollback(True)
+
+        sent = len(send_latencies)
+        send_latencies.sort()
+        self.stdout.write(
+            f"send path:  {sent} messages at a target {options['rate']:.0f}/s, "
+            f"p50 {statistics.median(send_latencies):.2f} ms, "
+            f"p99 {send_latencies[min(sent - 1, int(sent * 0.99))]:.2f} ms"
+        )
+        capacity = drained / elapsed if elapsed else float('inf')
+        self.stdout.write(
+            f"fan-out:    {drained} messages -> {notifications} notifications in {elapsed:.2f} s "
+            f"({capacity:.0f} messages/s, {notifications / elapsed if elapsed else 0:.0f} notifications/s)"
+        )
+        verdict = self.style.SUCCESS("keeps up") if capacity >= options['rate'] else self.style.ERROR("falls behind")
+        self.stdout.write(f"one worker {verdict} with {options['rate']:.0f} messages/s "
+                          f"({capacity / options['rate']:.1f}x headroom).")
+
+    def create_conversation(self, size):
+        members = ChatUser.objects.bulk_create([
+            ChatUser(username=f'fanout-bench-{i}', email=f'fanout-bench-{i}@example.com')
+            for i in range(size)
+        ])
+        conversation = Conversation.objects.create()
+        conversation.participants.set(members)
+        return conversation, members
+
+    def send_phase(self, conversation, members, rate, seconds):
+        """Create messages on a fixed schedule; returns per-send latencies in ms."""
+        latencies = []
+        interval = 1.0 / rate
+        started = time.perf_counter()
+        for i in range(int(rate * seconds)):
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sender = members[i % len(members)]
+            receiver = members[(i + 1) % len(members)]
+            sent_at = time.perf_counter()
+            Message.objects.create(
+                conversation=conversation,
+                sender=sender,
+                receiver=receiver,
+                message_content=f"fan-out benchmark {i}"
+            )
+            latencies.append((time.perf_counter() - sent_at) * 1000)
+        return latencies
+
+    def drain_phase(self, batch_size):
+        """Process the whole outbox; returns (events, notifications created, seconds)."""
+        before = Notification.objects.count()
+        drained = 0
+        started = time.perf_counter()
+        while count := NotificationService.process_outbox_batch(batch_size):
+            drained += count
+        elapsed = time.perf_counter() - started
+        return drained, Notification.objects.count() - before, elapsed
@@ -0,0 +1,102 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from messaging.auth import CustomTokenObtainPairSerializer
+from messaging.models import ChatUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of the sync (DRF) and async (ASGI-native) read endpoints "
+        "against a running server, e.g. `uvicorn messaging_app.asgi:application`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Server to benchmark.")
+        parser.add_argument('--username', required=True, help="Existing user to mint an access token for.")
+        parser.add_argument('--conversation', default=None, help="Conversation id for the messages/unread pairs.")
+        parser.add_argument('--concurrency', type=int, default=500, help="Concurrent connections (default: 500).")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per endpoint (default: 5000).")
+
+    def handle(self, *args, **options):
+        user = ChatUser.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']!r}.")
+        token = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+
+        # (label, sync path, async path)
+        pairs = [
+            ('conversation list', '/api/chats/conversations/inbox/', '/api/chats/async/conversations/'),
+            ('me', '/api/users/me/', '/api/chats/async/me/'),
+        ]
+        conversation = options['conversation']
+        if conversation:
+            pairs += [
+                ('conversation messages',
+                 f'/api/chats/conversations/{conversation}/messages/',
+                 f'/api/chats/async/conversations/{conversation}/messages/'),
+                ('unread',
+                 f'/api/chats/conversations/{conversation}/messages/unread/',
+                 '/api/chats/async/unread/'),
+            ]
+
+        target = urlsplit(options['base_url'])
+        self.stdout.write(
+            f"{'endpoint':<24}{'mode':<7}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for label, sync_path, async_path in pairs:
+            for mode, path in (('sync', sync_path), ('async', async_path)):
+                result = asyncio.run(run_load(
+                    target.hostname, target.port or 80, path, token,
+                    options['concurrency'], options['requests']
+                ))
+                self.stdout.write(
+                    f"{label:<24}{mode:<7}{result['rps']:>10.1f}{result['p50']:>10.1f}"
+                    f"{result['p99']:>10.1f}{result['errors']:>8}"
+                )
+
+
+async def fetch(host, port, path, token):
+    """One GET over a fresh connection; returns the HTTP status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n"
+        f"Connection: close\r\n\r\n".encode('ascii')
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()  # Drain the body until the server closes the connection
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def run_load(host, port, path, token, concurrency, total):
+    """Keep `concurrency` requests in flight until `total` have completed."""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                status = await fetch(host, port, path, token)
+            except (OSError, ValueError, IndexError):
+                status = None
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'errors': errors,
+    }
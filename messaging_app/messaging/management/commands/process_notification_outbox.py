@@ -0,0 +1,77 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from messaging.services import NotificationService
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain the notification outbox with a pool of worker threads, creating "
+        "notifications in bulk. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Worker threads (default: 4).")
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Outbox events claimed and turned into notifications per transaction (default: 500)."
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help="Seconds an idle worker waits before checking the outbox again (default: 1.0)."
+        )
+        parser.add_argument('--once', action='store_true', help="Exit once the outbox is empty.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        workers = options['workers']
+        self.stdout.write(f"Draining the notification outbox with {workers} workers...")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox') as pool:
+            futures = [
+                pool.submit(self.work, stop, options['batch_size'], options['poll_interval'], options['once'])
+                for _ in range(workers)
+            ]
+            try:
+                processed = sum(future.result() for future in futures)
+            except KeyboardInterrupt:
+                stop.set()
+                processed = sum(future.result() for future in futures)
+            finally:
+                # Whatever ended the wait (a worker's error included), stop the other
+                # workers so the pool can shut down and the error propagates.
+                stop.set()
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} outbox events."))
+
+    def work(self, stop, batch_size, poll_interval, once):
+        """
+        One worker: claim and process batches until told to stop, sleeping
+        while the outbox is empty. Each thread has its own DB connection,
+        closed on exit.
+        """
+        processed = 0
+        try:
+            while not stop.is_set():
+                try:
+                    count = NotificationService.process_outbox_batch(batch_size)
+                except DatabaseError:
+                    # The batch rolled back and its events stay queued; back off and retry.
+                    logger.exception("Failed to process a notification outbox batch")
+                    stop.wait(poll_interval)
+                    continue
+                processed += count
+                if count < batch_size:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+        finally:
+            connection.close()
+        return processed
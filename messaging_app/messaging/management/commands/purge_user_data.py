@@ -0,0 +1,62 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from messaging.models import ChatUser
+from messaging.services import UserCleanUpService
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete a user's messages, notifications and message history in small "
+        "primary-key-ordered batches. Safe to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help="Username or user_id of the user to purge.")
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Rows deleted per transaction (default: 1000)."
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches to leave room for other writers (default: 0)."
+        )
+        parser.add_argument(
+            '--delete-user',
+            action='store_true',
+            help="Delete the account itself once its data is gone."
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        self.stdout.write(f"Purging data of {user.username} ({user.user_id})...")
+
+        def progress(step, deleted):
+            self.stdout.write(f"  {step}: {deleted} deleted")
+
+        service = UserCleanUpService(
+            user.user_id,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=progress
+        )
+        totals = service.delete_user() if options['delete_user'] else service.purge()
+
+        summary = ", ".join(f"{count} {model}" for model, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {summary}; refreshed {len(service.affected_conversations)} conversations."
+        ))
+
+    def get_user(self, identifier):
+        try:
+            lookup = {'user_id': uuid.UUID(identifier)}
+        except ValueError:
+            lookup = {'username': identifier}
+        user = ChatUser.objects.filter(**lookup).first()
+        if user is None:
+            raise CommandError(f"No user matching {identifier!r}.")
+        return user
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from messaging.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized UnreadCounter table from the unread rows in Message"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Number of counter rows written per INSERT (default: 1000)."
+        )
+
+    def handle(self, *args, **options):
+        deleted, written = UnreadCounter.objects.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt unread counters: removed {deleted}, wrote {written}."
+        ))
@@ -3,15 +3,52 @@ import uuid
 from datetime import timedelta
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
-from django.core.management.base import BaseCommand
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from messaging.models import ChatUser, Conversation, Message, Notification, MessageHistory
 
 
 class Command(BaseCommand):
     help = "Seed the database with realistic ChatUser, Conversation, and Message data"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=550, help="Number of users to create (default: 550).")
+        parser.add_argument('--conversations', type=int, default=300, help="Number of conversations to create (default: 300).")
+        parser.add_argument(
+            '--messages-per-conversation',
+            type=int,
+            default=None,
+            help="Messages per conversation (default: random 150-300, plus occasional replies)."
+        )
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible datasets.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk INSERT (default: 5000).")
+
     def handle(self, *args, **options):
-        seed_data()
+        if options['users'] < 2:
+            raise CommandError("--users must be at least 2: every conversation needs two participants.")
+        if options['conversations'] < 0:
+            raise CommandError("--conversations cannot be negative.")
+        if options['messages_per_conversation'] is not None and options['messages_per_conversation'] < 0:
+            raise CommandError("--messages-per-conversation cannot be negative.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        # Usernames and, with --seed, primary keys repeat between runs, so a
+        # second run would fail part-way on a unique constraint.
+        if ChatUser.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}").exists():
+            raise CommandError(
+                "The database already holds seeded users; run `manage.py flush` before seeding again."
+            )
+        seed_data(
+            users=options['users'],
+            conversations=options['conversations'],
+            messages_per_conversation=options['messages_per_conversation'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+SEED_EMAIL_DOMAIN = "kenya.co.ke"
+
 # Extensive lists of unique, natural-sounding first names with Kenyan/African influence
 first_names = [
     "John", "Allan", "Peter", "David", "James", "Mary", "Jane", "Sarah", "Joseph", "Grace",
@@ -47,120 +84,188 @@ landmarks = ["Nairobi National Park", "Diani Beach", "Lake Nakuru", "Mount Kenya
 teams = ["Gor Mahia", "AFC Leopards", "Harambee Stars", "Sofapaka", "Tusker FC", "Mathare United", "Bandari FC"]
 foods = ["nyama choma", "ugali", "sukuma wiki", "mandazi", "chapati", "githeri", "pilau", "mutura", "kuku choma", "viazi karai", "samosa"]
 
-# Generate 550 users with detailed profiles
-def create_users():
+
+def new_uuid():
+    """uuid4 drawn from the seeded RNG, so --seed also reproduces primary keys."""
+    return uuid.UUID(int=random.getrandbits(128), version=4)
+
+def bulk_insert(model, rows, batch_size):
+    """Insert rows with one INSERT per batch, skipping signals and save()."""
+    if rows:
+        model.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+# Generate users with detailed profiles
+def create_users(count, batch_size):
+    # Hash once and reuse: PBKDF2 per user dominates the runtime otherwise.
+    # bulk_create skips ChatUser.save(), so the hash is stored as-is.
+    password = make_password("testPass123")  # Uniform password for testing
+    today = timezone.now().date()
     users = []
-    for i in range(550):
+    for i in range(count):
         unique_first = first_names[i % len(first_names)]
         unique_last = last_names[i % len(last_names)]
-        user = ChatUser(
+        users.append(ChatUser(
+            user_id=new_uuid(),
             username=f"user{i+1}_{unique_first}{unique_last}",
-            email=f"user{i+1}_{unique_first}{unique_last}@kenya.co.ke",
+            email=f"user{i+1}_{unique_first}{unique_last}@{SEED_EMAIL_DOMAIN}",
             first_name=unique_first,
             last_name=unique_last,
             phone_number=f"+2547{random.randint(0,9)}{random.randint(0,9)}{random.randint(100000,999999)}",
-            bio=f"Jambo! I’m {unique_first} {unique_last} from {random.choice(counties)}, a {random.choice(occupations)}. I love eating {random.choice(foods)} and visiting {random.choice(landmarks)}. Born on {timezone.now().date() - timedelta(days=random.randint(365*18, 365*70))}. I’m a die-hard {random.choice(teams)} fan and work {random.choice(['remotely', 'in Nairobi', 'in the field', 'from Mombasa', 'in Kisumu', 'in Nakuru'])}. My hobbies include {random.choice(['running', 'dancing', 'reading', 'cooking', 'swimming', 'painting'])}, and I dream of traveling to {random.choice(['Jinja', 'Dar es Salaam', 'Cape Town', 'Kigali', 'Addis Ababa'])}.",
-            password=make_password("testPass123")  # Uniform password for testing
-        )
-        user.save()
-        users.append(user)
+            bio=f"Jambo! I’m {unique_first} {unique_last} from {random.choice(counties)}, a {random.choice(occupations)}. I love eating {random.choice(foods)} and visiting {random.choice(landmarks)}. Born on {today - timedelta(days=random.randint(365*18, 365*70))}. I’m a die-hard {random.choice(teams)} fan and work {random.choice(['remotely', 'in Nairobi', 'in the field', 'from Mombasa', 'in Kisumu', 'in Nakuru'])}. My hobbies include {random.choice(['running', 'dancing', 'reading', 'cooking', 'swimming', 'painting'])}, and I dream of traveling to {random.choice(['Jinja', 'Dar es Salaam', 'Cape Town', 'Kigali', 'Addis Ababa'])}.",
+            password=password
+        ))
+    bulk_insert(ChatUser, users, batch_size)
     return users
 
-# Create 300 conversations with diverse participants
-def create_conversations(users):
+# Create conversations with diverse participants
+def create_conversations(users, count, batch_size):
     conversations = []
-    for _ in range(300):
-        participants = random.sample(users, k=random.randint(2, 25))  # 2 to 25 participants
-        conversation = Conversation.objects.create()
-        conversation.participants.set(participants)
+    members = {}  # conversation_id -> participant users, reused when generating messages
+    memberships = []
+    Membership = Conversation.participants.through
+    for _ in range(count):
+        conversation = Conversation(conversation_id=new_uuid())
+        participants = random.sample(users, k=random.randint(2, min(25, len(users))))  # 2 to 25 participants
+        members[conversation.conversation_id] = participants
         conversations.append(conversation)
-    return conversations
-
-# Generate 150-300 messages per conversation with lengthy, detailed content
-def create_messages(users, conversations):
-    messages = []
-    greetings = ["Jambo", "Habari", "Sasa", "Karibu", "Asante", "Moin", "Salamu", "Heshima", "Shikamoo", "Mambo"]
-    topics = [
-        "How’s the matatu traffic today on Uhuru Highway?", "Let’s plan a nyama choma outing this weekend near Masai Mara!",
-        "Nairobi rains are causing floods, stay safe everyone!", "Who’s got the latest Safcom bundles or Airtel deals?",
-        "BBI debate is heating up, what’s your opinion?", "Matatu fares are up again, should we switch to boda bodas?",
-        "Let’s visit Diani Beach for a team getaway!", "Ugali recipe swap—share your best tips!",
-        "Kenyan music hits this week—check out Nameless’s new track!", "Power outage in Eldoret, any updates?"
-    ]
-    for conversation in conversations:
-        participants = conversation.participants.all()
-        for _ in range(random.randint(150, 300)):  # 150 to 300 messages per conversation
+        memberships.extend(
+            Membership(conversation_id=conversation.conversation_id, chatuser_id=user.user_id)
+            for user in participants
+        )
+    bulk_insert(Conversation, conversations, batch_size)
+    bulk_insert(Membership, memberships, batch_size)
+    return members
+
+greetings = ["Jambo", "Habari", "Sasa", "Karibu", "Asante", "Moin", "Salamu", "Heshima", "Shikamoo", "Mambo"]
+topics = [
+    "How’s the matatu traffic today on Uhuru Highway?", "Let’s plan a nyama choma outing this weekend near Masai Mara!",
+    "Nairobi rains are causing floods, stay safe everyone!", "Who’s got the latest Safcom bundles or Airtel deals?",
+    "BBI debate is heating up, what’s your opinion?", "Matatu fares are up again, should we switch to boda bodas?",
+    "Let’s visit Diani Beach for a team getaway!", "Ugali recipe swap—share your best tips!",
+    "Kenyan music hits this week—check out Nameless’s new track!", "Power outage in Eldoret, any updates?"
+]
+
+def message_text(sender, receiver):
+    return f"{random.choice(greetings)}, {receiver.first_name} {receiver.last_name} and all! {random.choice(topics)} " \
+        f"I’m currently at {random.choice(counties)} near {random.choice(landmarks)}, enjoying {random.choice(foods)} with my family. " \
+        f"The weather is {random.choice(['sunny', 'rainy', 'cloudy', 'windy'])} with a temperature around {random.randint(15, 30)}°C. " \
+        f"I’ve been working on {random.choice(['a software project', 'a farm expansion', 'a business proposal'])} and need your input on {random.choice(['budgeting', 'marketing strategies', 'logistics planning'])}. " \
+        f"Last time we met, we discussed {random.choice(teams)}’s last match—their defense was weak! " \
+        f"Please call me at {sender.phone_number[-8:]} to brainstorm solutions. Looking forward to your detailed feedback! - {sender.first_name} {sender.last_name}"
+
+def reply_text(parent_sender, replier):
+    return f"Reply to {parent_sender.first_name} {parent_sender.last_name}: Thanks for the update! I’m in {random.choice(counties)} now, " \
+        f"and things are {random.choice(['calm', 'chaotic', 'busy'])}. I agree on {random.choice(['budgeting', 'marketing strategies', 'logistics planning'])}— " \
+        f"let’s meet at {random.choice(landmarks)} to finalize plans. Weather here is {random.choice(['sunny', 'rainy', 'cloudy'])}. - {replier.first_name}"
+
+# Generate messages per conversation, streamed to the database in batches
+def create_messages(members, messages_per_conversation, batch_size, log):
+    """
+    Build messages, notifications and edit history in memory and flush them
+    with bulk_create every `batch_size` messages, so memory stays bounded
+    however large the dataset is. Messages are flushed before the rows that
+    reference them.
+    """
+    now = timezone.now()
+    pending_messages, pending_notifications, pending_history = [], [], []
+    total = 0
+
+    def flush():
+        nonlocal total
+        total += bulk_insert(Message, pending_messages, batch_size)
+        bulk_insert(Notification, pending_notifications, batch_size)
+        bulk_insert(MessageHistory, pending_history, batch_size)
+        pending_messages.clear()
+        pending_notifications.clear()
+        pending_history.clear()
+        log(f"  ...{total} messages written")
+
+    for conversation_id, participants in members.items():
+        thread = []  # (message, sender) pairs of this conversation, candidates for replies
+        count = messages_per_conversation
+        if count is None:
+            count = random.randint(150, 300)  # 150 to 300 messages per conversation
+        for _ in range(count):
             sender = random.choice(participants)
             receiver = random.choice([p for p in participants if p != sender])
-            message_content = f"{random.choice(greetings)}, {receiver.first_name} {receiver.last_name} and all! {random.choice(topics)} " \
-                            f"I’m currently at {random.choice(counties)} near {random.choice(landmarks)}, enjoying {random.choice(foods)} with my family. " \
-                            f"The weather is {random.choice(['sunny', 'rainy', 'cloudy', 'windy'])} with a temperature around {random.randint(15, 30)}°C. " \
-                            f"I’ve been working on {random.choice(['a software project', 'a farm expansion', 'a business proposal'])} and need your input on {random.choice(['budgeting', 'marketing strategies', 'logistics planning'])}. " \
-                            f"Last time we met, we discussed {random.choice(teams)}’s last match—their defense was weak! " \
-                            f"Please call me at {sender.phone_number[-8:]} to brainstorm solutions. Looking forward to your detailed feedback! - {sender.first_name} {sender.last_name}"
             message = Message(
-                message_id=uuid.uuid4(),
-                conversation=conversation,
-                sender=sender,
-                receiver=receiver,
-                message_content=message_content,
-                timestamp=timezone.now() - timedelta(days=random.randint(1, 365), minutes=random.randint(0, 1440)),
+                message_id=new_uuid(),
+                conversation_id=conversation_id,
+                sender_id=sender.user_id,
+                receiver_id=receiver.user_id,
+                message_content=message_text(sender, receiver),
+                timestamp=now - timedelta(days=random.randint(1, 365), minutes=random.randint(0, 1440)),
                 read=random.choice([True, False, False, False, False])  # Mostly unread
             )
-            message.save()
-            messages.append(message)
+            message.thread_root_id = message.message_id
+            pending_messages.append(message)
+            thread.append((message, sender))
             # Create notification
-            Notification.objects.create(
-                notification_id=uuid.uuid4(),
-                user=receiver,
-                message=message
-            )
+            pending_notifications.append(Notification(
+                notification_id=new_uuid(),
+                user_id=receiver.user_id,
+                message_id=message.message_id,
+                created_at=message.timestamp
+            ))
             # Randomly edit some messages with history
             if random.choice([True, False, False, False, False]):
                 old_content = message.message_content[:250]  # Truncate to max_length=250 for MessageHistory
                 message.edited = True
-                message.message_content += f" (Edited: Added {random.choice(['urgent', 'fun', 'sad', 'happy', 'important'])} note at {timezone.now().time()})"
-                message.save()
-                MessageHistory.objects.create(
-                    message_history_id=uuid.uuid4(),
-                    message=message,
+                message.message_content += f" (Edited: Added {random.choice(['urgent', 'fun', 'sad', 'happy', 'important'])} note at {now.time()})"
+                pending_history.append(MessageHistory(
+                    message_history_id=new_uuid(),
+                    message_id=message.message_id,
                     old_content=old_content,
-                    edited_by=sender
-                )
+                    edited_by_id=sender.user_id
+                ))
             # Randomly add replies with detailed content
             if random.choice([True, False, False, False]):
-                parent = random.choice(messages)
-                reply_content = f"Reply to {parent.sender.first_name} {parent.sender.last_name}: Thanks for the update! I’m in {random.choice(counties)} now, " \
-                              f"and things are {random.choice(['calm', 'chaotic', 'busy'])}. I agree on {random.choice(['budgeting', 'marketing strategies', 'logistics planning'])}— " \
-                              f"let’s meet at {random.choice(landmarks)} to finalize plans. Weather here is {random.choice(['sunny', 'rainy', 'cloudy'])}. - {receiver.first_name}"
+                parent, parent_sender = random.choice(thread)
                 reply = Message(
-                    message_id=uuid.uuid4(),
-                    conversation=conversation,
-                    sender=receiver,
-                    receiver=sender,
-                    message_content=reply_content,
+                    message_id=new_uuid(),
+                    conversation_id=conversation_id,
+                    sender_id=receiver.user_id,
+                    receiver_id=sender.user_id,
+                    message_content=reply_text(parent_sender, receiver),
                     timestamp=message.timestamp + timedelta(minutes=random.randint(1, 120)),
-                    parent_message=parent,
+                    parent_message_id=parent.message_id,
+                    thread_root_id=parent.thread_root_id,
+                    depth=parent.depth + 1,
                     read=random.choice([True, False])
                 )
-                reply.save()
-                messages.append(reply)
-                Notification.objects.create(
-                    notification_id=uuid.uuid4(),
-                    user=sender,
-                    message=reply
-                )
-    return messages
+                pending_messages.append(reply)
+                thread.append((reply, receiver))
+                pending_notifications.append(Notification(
+                    notification_id=new_uuid(),
+                    user_id=sender.user_id,
+                    message_id=reply.message_id,
+                    created_at=reply.timestamp
+                ))
+            if len(pending_messages) >= batch_size:
+                flush()
+    flush()
+    return total
 
 # Seed the database with large-scale, bulky data
-def seed_data():
-    print("Seeding 550 users...")
-    users = create_users()
-    print("Seeding 300 conversations...")
-    conversations = create_conversations(users)
-    print("Seeding 45000-90000 messages...")
-    create_messages(users, conversations)
-    print(f"Seeding complete! Total users: {ChatUser.objects.count()}, Conversations: {Conversation.objects.count()}, Messages: {Message.objects.count()}")
+def seed_data(users=550, conversations=300, messages_per_conversation=None, seed=None, batch_size=5000, log=print):
+    """
+    Seed everything inside one transaction with chunked bulk_create calls.
+    bulk_create bypasses the Message signals, so the denormalized conversation
+    activity and unread counters are rebuilt from the inserted rows at the end.
+    """
+    random.seed(seed)
+    with transaction.atomic():
+        log(f"Seeding {users} users...")
+        user_rows = create_users(users, batch_size)
+        log(f"Seeding {conversations} conversations...")
+        members = create_conversations(user_rows, conversations, batch_size)
+        log("Seeding messages...")
+        create_messages(members, messages_per_conversation, batch_size, log)
+        log("Rebuilding conversation activity and unread counters...")
+        Conversation.objects.refresh_activity()
+        call_command('rebuild_unread_counters', batch_size=batch_size)
+    log(f"Seeding complete! Total users: {ChatUser.objects.count()}, Conversations: {Conversation.objects.count()}, Messages: {Message.objects.count()}")
 
 if __name__ == "__main__":
-    seed_data()
\ No newline at end of file
+    seed_data()
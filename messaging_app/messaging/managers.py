@@ -1,4 +1,10 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
 class UnreadMessagesManager(models.Manager):
     """
     Custom model manager for filtering unread messages for a specific user.
@@ -30,3 +36,195 @@ class UnreadMessagesManager(models.Manager):
         ).select_related(
             'sender'  # Optimize query: fetch sender info in same DB call
         )
+
+
+class MessageManager(models.Manager):
+    """
+    Default Message manager with reply-thread retrieval.
+    Every message stores its `thread_root` and `depth` (set on creation by the
+    assign_thread_position signal), so a whole thread is an indexed equality
+    lookup and any sub-thread is one recursive CTE.
+    """
+
+    def thread_by_root(self, root_id):
+        """Every message of the thread started by `root_id`, oldest first."""
+        return self.get_queryset().filter(thread_root_id=root_id).order_by('timestamp', 'message_id')
+
+    def thread(self, message_id, max_depth=None):
+        """
+        A message and its replies down to `max_depth` levels below it, oldest
+        first, in a single statement: a recursive CTE walking parent_message
+        feeds an IN subquery, so the rows come back as ordinary model instances.
+        """
+        table = self.model._meta.db_table
+        root_id = self.model._meta.pk.get_db_prep_value(message_id, connection)
+        depth_limit = "WHERE thread.level < %s" if max_depth is not None else ""
+        params = (root_id, max_depth) if max_depth is not None else (root_id,)
+        subtree = RawSQL(
+            f"""
+            WITH RECURSIVE thread(message_id, level) AS (
+                SELECT message_id, 0 FROM {table} WHERE message_id = %s
+                UNION ALL
+                SELECT reply.message_id, thread.level + 1
+                FROM {table} reply JOIN thread ON reply.parent_message_id = thread.message_id
+                {depth_limit}
+            )
+            SELECT message_id FROM thread
+            """,
+            params
+        )
+        return self.get_queryset().filter(pk__in=subtree).order_by('timestamp', 'message_id')
+
+
+class UnreadCounterManager(models.Manager):
+    """
+    Manager for the materialized per-(user, conversation) unread counters.
+
+    Every write is a single set-based UPDATE using F() expressions, so
+    concurrent senders never lose an increment to a read-modify-write race.
+    """
+
+    def increment(self, user_id, conversation_id, by=1):
+        """
+        Add `by` unread messages to the user's counter for a conversation,
+        creating the counter row the first time it is needed.
+        """
+        updated = self.filter(user_id=user_id, conversation_id=conversation_id).update(
+            count=F('count') + by, updated_at=timezone.now()
+        )
+        if updated:
+            return
+        try:
+            # Savepoint so a lost creation race doesn't poison the outer transaction.
+            with transaction.atomic():
+                self.create(user_id=user_id, conversation_id=conversation_id, count=by)
+        except IntegrityError:
+            self.filter(user_id=user_id, conversation_id=conversation_id).update(
+                count=F('count') + by, updated_at=timezone.now()
+            )
+
+    def decrement(self, user_id, conversation_id, by=1):
+        """
+        Remove `by` unread messages from the counter, never going below zero.
+        """
+        if by <= 0:
+            return
+        self.filter(user_id=user_id, conversation_id=conversation_id).update(
+            count=Greatest(F('count') - by, 0), updated_at=timezone.now()
+        )
+
+    def rebuild(self, conversation_ids=None, batch_size=1000):
+        """
+        Recount the counters from the unread rows in Message with one GROUP BY
+        and swap them in inside a single transaction, so readers never see a
+        half-built table. Limited to `conversation_ids` when given.
+        Returns (counters removed, counters written).
+        """
+        from .models import Message
+
+        unread = Message.objects.filter(read=False)
+        counters = self.get_queryset()
+        if conversation_ids is not None:
+            unread = unread.filter(conversation_id__in=conversation_ids)
+            counters = counters.filter(conversation_id__in=conversation_ids)
+        unread = unread.values('receiver', 'conversation').annotate(unread_count=Count('message_id')).order_by()
+        with transaction.atomic():
+            deleted, _ = counters.delete()
+            written = self.bulk_create(
+                (
+                    self.model(user_id=row['receiver'], conversation_id=row['conversation'], count=row['unread_count'])
+                    for row in unread.iterator(chunk_size=batch_size)
+                ),
+                batch_size=batch_size
+            )
+        return deleted, len(written)
+
+    def for_user(self, user):
+        """
+        Return the user's non-zero counters, most recently changed first.
+        One row per conversation, so this is O(conversations) rather than O(messages).
+        """
+        return self.get_queryset().filter(user=user, count__gt=0).order_by('-updated_at')
+
+
+class ConversationManager(models.Manager):
+    """
+    Manager that maintains each conversation's denormalized activity summary
+    (last_message, last_message_at, message_count) with single UPDATEs.
+    """
+
+    def record_message(self, message):
+        """
+        Count a newly created message and move the last-message pointer to it
+        unless the conversation already has a newer one (e.g. backfilled history).
+        """
+        is_newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.timestamp)
+        self.filter(pk=message.conversation_id).update(
+            message_count=F('message_count') + 1,
+            last_message=Case(When(is_newer, then=Value(message.pk)), default=F('last_message')),
+            last_message_at=Case(When(is_newer, then=Value(message.timestamp)), default=F('last_message_at')),
+        )
+
+    def record_message_deleted(self, message):
+        """
+        Uncount a deleted message. If it was the last message, its pointer has
+        already been nulled by SET_NULL, so repoint it to the newest survivor.
+        """
+        newest = self._newest_message(OuterRef('pk'))
+        self.filter(pk=message.conversation_id).update(
+            message_count=Case(When(message_count__gt=0, then=F('message_count') - 1), default=Value(0))
+        )
+        self.filter(pk=message.conversation_id, last_message__isnull=True).update(
+            last_message=Subquery(newest.values('pk')[:1]),
+            last_message_at=Subquery(newest.values('timestamp')[:1]),
+        )
+
+    def refresh_activity(self, conversation_ids=None):
+        """
+        Recompute the activity summary of every conversation (or only those in
+        `conversation_ids`) from the message table in one UPDATE. Used after
+        bulk loads and purges that bypass the signals.
+        """
+        from .models import Message
+
+        newest = self._newest_message(OuterRef('pk'))
+        counts = (
+            Message.objects.filter(conversation=OuterRef('pk'))
+            .order_by()
+            .values('conversation')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        conversations = self.get_queryset()
+        if conversation_ids is not None:
+            conversations = conversations.filter(pk__in=conversation_ids)
+        return conversations.update(
+            last_message=Subquery(newest.values('pk')[:1]),
+            last_message_at=Subquery(newest.values('timestamp')[:1]),
+            message_count=Coalesce(Subquery(counts), 0),
+        )
+
+    def _newest_message(self, conversation):
+        from .models import Message
+
+        return Message.objects.filter(conversation=conversation).order_by('-timestamp', '-message_id')
+
+
+class NotificationOutboxManager(models.Manager):
+    """
+    Manager for the notification outbox written by the Message post_save signal
+    and drained by `manage.py process_notification_outbox`.
+    """
+
+    def claim_batch(self, batch_size):
+        """
+        Lock the oldest pending events for the calling worker, skipping rows
+        other workers already hold so they never block on each other.
+        Must run inside a transaction; returns
+        (outbox_id, message_id, sender_id, receiver_id, conversation_id) tuples.
+        """
+        return self.get_queryset().order_by('created_at').select_for_update(
+            skip_locked=True, of=('self',)
+        ).values_list(
+            'outbox_id', 'message_id', 'message__sender_id', 'message__receiver_id', 'message__conversation_id'
+        )[:batch_size]
@@ -0,0 +1,51 @@
+"""
+Cached conversation membership per user.
+
+Each user's conversation ids are cached as one compact value (16 raw bytes
+per conversation) for MEMBERSHIP_CACHE_TIMEOUT seconds. Authorization checks
+then become a cache read plus a set lookup: IsParticipantOfConversation,
+MessageViewSet.get_queryset and create_message all go through
+is_member/get_conversation_ids. Adding or removing participants sends
+m2m_changed, which drops the cached sets of the users concerned (see
+signals.invalidate_membership).
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Conversation
+
+DEFAULT_TIMEOUT = 300
+
+
+def membership_key(user_id) -> str:
+    return f"conversation-membership:{user_id}"
+
+
+def get_conversation_ids(user_id) -> frozenset:
+    """The UUIDs of every conversation `user_id` takes part in."""
+    key = membership_key(user_id)
+    packed = cache.get(key)
+    if packed is None:
+        ids = Conversation.participants.through.objects.filter(
+            chatuser_id=user_id
+        ).values_list('conversation_id', flat=True)
+        packed = b''.join(conversation_id.bytes for conversation_id in ids)
+        cache.set(key, packed, getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return frozenset(uuid.UUID(bytes=packed[i:i + 16]) for i in range(0, len(packed), 16))
+
+
+def is_member(user_id, conversation_id) -> bool:
+    """Whether `user_id` participates in `conversation_id`; malformed ids are never members."""
+    if not isinstance(conversation_id, uuid.UUID):
+        try:
+            conversation_id = uuid.UUID(str(conversation_id))
+        except ValueError:
+            return False
+    return conversation_id in get_conversation_ids(user_id)
+
+
+def invalidate(user_ids) -> None:
+    """Forget the cached membership of the given users."""
+    cache.delete_many([membership_key(user_id) for user_id in user_ids])
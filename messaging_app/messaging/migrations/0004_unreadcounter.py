@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:46
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_alter_chatuser_groups_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('unread_counter_id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of unread messages for this user in this conversation.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('conversation', models.ForeignKey(help_text='The conversation the unread messages belong to.', on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='messaging.conversation')),
+                ('user', models.ForeignKey(help_text='The user these unread messages are addressed to.', on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'conversation'), name='unique_unread_counter')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_conversation_activity(apps, schema_editor):
+    """Populate the new activity columns from the existing messages."""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    newest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-timestamp', '-message_id')
+    counts = (
+        Message.objects.filter(conversation=OuterRef('pk'))
+        .order_by()
+        .values('conversation')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Conversation.objects.update(
+        last_message=Subquery(newest.values('pk')[:1]),
+        last_message_at=Subquery(newest.values('timestamp')[:1]),
+        message_count=Coalesce(Subquery(counts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, help_text='The most recent message in this conversation.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, help_text='Timestamp of the most recent message, used to order the inbox.', null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of messages in this conversation.'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-last_message_at', '-conversation_id'], name='messaging_c_last_me_590225_idx'),
+        ),
+        migrations.RunPython(backfill_conversation_activity, migrations.RunPython.noop),
+    ]
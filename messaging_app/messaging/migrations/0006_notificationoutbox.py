@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:02
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_conversation_last_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('outbox_id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('message', models.ForeignKey(help_text='The newly created message to notify about.', on_delete=django.db.models.deletion.CASCADE, related_name='outbox_events', to='messaging.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='messaging_n_created_46ea73_idx')],
+            },
+        ),
+    ]
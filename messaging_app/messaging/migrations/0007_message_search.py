@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:13
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The search trigger and GIN index are PostgreSQL-only, so they are created
+# here instead of in Meta.indexes. The SQLite FTS5 fallback is installed after
+# every migrate by messaging.search.install_sqlite_index instead: SQLite
+# rebuilds the whole table on most ALTERs, which drops its triggers.
+SEARCH_CONFIG = 'english'
+
+POSTGRES_INSTALL = [
+    f"""
+    CREATE OR REPLACE FUNCTION messaging_message_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.message_content, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER messaging_message_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF message_content ON messaging_message
+    FOR EACH ROW EXECUTE FUNCTION messaging_message_search_vector_update()
+    """,
+    f"UPDATE messaging_message SET search_vector = to_tsvector('{SEARCH_CONFIG}', coalesce(message_content, ''))",
+    "CREATE INDEX messaging_message_search_vector_gin ON messaging_message USING gin (search_vector)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS messaging_message_search_vector_gin",
+    "DROP TRIGGER IF EXISTS messaging_message_search_vector_trigger ON messaging_message",
+    "DROP FUNCTION IF EXISTS messaging_message_search_vector_update()",
+]
+
+
+def install_search(apps, schema_editor):
+    """Create the PostgreSQL search trigger and GIN index."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in POSTGRES_INSTALL:
+        schema_editor.execute(statement)
+
+
+def uninstall_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in POSTGRES_UNINSTALL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0006_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_thread_position(apps, schema_editor):
+    """
+    Fill thread_root/depth one reply level at a time: roots first, then every
+    message whose parent is already placed, until a pass changes nothing.
+    """
+    Message = apps.get_model('messaging', 'Message')
+    Message.objects.filter(parent_message__isnull=True).update(thread_root=F('pk'), depth=0)
+    parent = Message.objects.filter(pk=OuterRef('parent_message'))
+    while Message.objects.filter(
+        thread_root__isnull=True,
+        parent_message__thread_root__isnull=False
+    ).update(
+        thread_root=Subquery(parent.values('thread_root')[:1]),
+        depth=Subquery(parent.values('depth')[:1]) + 1,
+    ):
+        pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of replies between this message and its thread root.'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='thread_root',
+            field=models.ForeignKey(blank=True, editable=False, help_text='The top-level message of the thread this message belongs to.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_messages', to='messaging.message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread_root', 'timestamp'], name='messaging_m_thread__3ff12b_idx'),
+        ),
+        migrations.RunPython(backfill_thread_position, migrations.RunPython.noop),
+    ]
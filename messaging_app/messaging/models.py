@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.hashers import make_password
 import uuid
 from django.utils import timezone
-from .managers import UnreadMessagesManager
+from .managers import (
+    MessageManager, UnreadMessagesManager, UnreadCounterManager, ConversationManager, NotificationOutboxManager
+)
 
 class ChatUser(AbstractUser):
     """
@@ -77,6 +80,34 @@ class Conversation(models.Model):
         related_name = 'conversations'
     )  # Users involved in this conversation
 
+    # Denormalized activity summary, maintained by the Message signals so the
+    # inbox can sort conversations without touching the message table.
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="The most recent message in this conversation."
+    )
+    last_message_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Timestamp of the most recent message, used to order the inbox."
+    )
+    message_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of messages in this conversation."
+    )
+
+    objects = ConversationManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-last_message_at', '-conversation_id']),
+            # Matches the inbox ordering so each page is an index range scan.
+        ]
+
     def __str__(self):
         """
         Returns a readable name for admin or debugging.
@@ -150,16 +181,73 @@ class Message(models.Model):
         help_text="If this message is a reply, link it to the original message here."
     )
 
+    # Denormalized thread position, set when the message is created: the
+    # message that started the thread (itself for a top-level message) and
+    # how many replies deep this one sits.
+    thread_root = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='thread_messages',
+        help_text="The top-level message of the thread this message belongs to."
+    )
+    depth = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of replies between this message and its thread root."
+    )
+
+    # Full-text search document for message_content. Maintained by a database
+    # trigger and GIN-indexed on PostgreSQL (see search.py); unused on SQLite,
+    # which searches an FTS5 table instead.
+    search_vector = SearchVectorField(null=True, editable=False)
+
     # Attaches the custom queryset for convenient querying (e.g., unread messages).
-    objects = models.Manager()  # Default manager
+    objects = MessageManager()  # Default manager, with thread retrieval
     unread = UnreadMessagesManager()
 
+    # Fields whose database values are remembered so edits can be detected without a re-fetch.
+    tracked_fields = ('message_content',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Snapshot the tracked fields as loaded, so the edit-history signals can
+        compare against them instead of fetching the row again before each save.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_tracked_fields()
+        return instance
+
+    def snapshot_tracked_fields(self):
+        """Remember the current values of the tracked fields (deferred ones are skipped)."""
+        loaded = self.get_deferred_fields()
+        self._loaded_values = {
+            name: getattr(self, name) for name in self.tracked_fields if name not in loaded
+        }
+
+    def get_loaded_value(self, name, default=None):
+        """The value `name` had when this instance was loaded or last saved."""
+        return getattr(self, '_loaded_values', {}).get(name, default)
+
     class Meta:
         ordering = ['timestamp']  # Newer messages appear after older ones.
 
         indexes = [
             models.Index(fields=['sender', 'receiver', 'timestamp']),
             # Example: speeds up looking for all messages between two users over time.
+            models.Index(fields=['thread_root', 'timestamp']),
+            # Fetches a whole reply thread, in order, by equality on its root.
+            models.Index(fields=['conversation', '-timestamp', '-message_id'], name='message_conv_recent_idx'),
+            # A conversation's messages newest first: every keyset page is one range scan.
+            models.Index(
+                fields=['receiver', 'conversation'],
+                condition=models.Q(read=False),
+                name='message_unread_idx'
+            ),
+            # Partial index over unread messages only: mark-read and counter rebuilds.
         ]
 
 
@@ -217,4 +305,71 @@ class MessageHistory(models.Model):
     edited_by = models.ForeignKey(ChatUser, on_delete=models.SET_NULL, null=True, blank=True)
     class Meta:
         ordering = ['-edited_at']
-        indexes = [models.Index(fields=['message', 'edited_at'])]
\ No newline at end of file
+        indexes = [models.Index(fields=['message', 'edited_at'])]
+
+
+class UnreadCounter(models.Model):
+    """
+    Denormalized count of unread messages per (user, conversation).
+    The Message post_save signal increments it and marking messages as read
+    decrements it, so the /unread endpoint reads one row per conversation
+    instead of scanning the message table.
+    Rebuild from scratch with `manage.py rebuild_unread_counters`.
+    """
+    unread_counter_id = models.UUIDField(
+        primary_key=True,
+        default= uuid.uuid4
+    )
+    user = models.ForeignKey(
+        ChatUser,
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+        help_text="The user these unread messages are addressed to."
+    )
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+        help_text="The conversation the unread messages belong to."
+    )
+    count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of unread messages for this user in this conversation."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UnreadCounterManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='unique_unread_counter'),
+            # One counter row per user and conversation; increments rely on it.
+        ]
+
+
+class NotificationOutbox(models.Model):
+    """
+    Message-created events waiting to be turned into notifications.
+    Sending a message costs a single insert here; the
+    `process_notification_outbox` worker later creates the notifications in
+    bulk and deletes the events in the same transaction.
+    """
+    outbox_id = models.UUIDField(
+        primary_key=True,
+        default= uuid.uuid4
+    )
+    message = models.ForeignKey(
+        Message,
+        on_delete=models.CASCADE,
+        related_name='outbox_events',
+        help_text="The newly created message to notify about."
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = NotificationOutboxManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            # Workers claim the oldest events first.
+        ]
@@ -1,5 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import uuid
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from django.utils.functional import cached_property
 from django.core.paginator import Paginator
 
@@ -47,4 +54,212 @@ class CustomPagination(PageNumberPagination):
             },
             'count': self.paginator.count,  # Triggers count only when needed
             'results': data
-        })
\ No newline at end of file
+        })
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a (timestamp, id) sort key, newest first.
+
+    Pages are addressed by the sort key of a boundary row instead of an
+    OFFSET, so page N costs the same single indexed range scan as page 1
+    and no COUNT(*) is ever issued. Subclasses name the two key fields.
+
+    Usage examples in API queries:
+    - ?before=<cursor>  -> rows older than the cursor (scrolling back)
+    - ?after=<cursor>   -> rows newer than the cursor (catching up)
+    - ?page_size=50
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    before_query_param = 'before'
+    after_query_param = 'after'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # The id field breaks ties between rows sharing a timestamp.
+    timestamp_field = None
+    id_field = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return one page of rows around the requested cursor.
+        One extra row is fetched to learn whether another page exists.
+        """
+        window = self._window(queryset, request)
+        return self._page_from_rows(list(window))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async twin of paginate_queryset for Django async views; the page is
+        read with aiterator() so no worker thread is held during the query.
+        """
+        window = self._window(queryset, request)
+        return self._page_from_rows([row async for row in window.aiterator()])
+
+    def _window(self, queryset, request):
+        """Apply the cursor bound, keyset ordering and page_size + 1 limit."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        ts, pk = self.timestamp_field, self.id_field
+
+        # Plain Django requests (async views) have GET but no DRF query_params.
+        params = getattr(request, 'query_params', request.GET)
+        before = self.decode_cursor(params.get(self.before_query_param))
+        after = self.decode_cursor(params.get(self.after_query_param))
+        self.walking_forward = after is not None
+        self.has_newer = before is not None
+
+        if after is not None:
+            # Walk forward in time from the cursor, then flip back to newest first.
+            timestamp, row_id = after
+            queryset = queryset.filter(
+                Q(**{f'{ts}__gt': timestamp}) | Q(**{ts: timestamp, f'{pk}__gt': row_id})
+            ).order_by(ts, pk)
+        else:
+            if before is not None:
+                timestamp, row_id = before
+                queryset = queryset.filter(
+                    Q(**{f'{ts}__lt': timestamp}) | Q(**{ts: timestamp, f'{pk}__lt': row_id})
+                )
+            queryset = queryset.order_by(f'-{ts}', f'-{pk}')
+        return queryset[:self.page_size + 1]
+
+    def _page_from_rows(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.walking_forward:
+            self.has_newer = has_more
+            self.has_older = True
+            rows.reverse()
+        else:
+            self.has_older = has_more
+        self.page = rows
+        return self.page
+
+    def get_page_size(self, request):
+        """Honour ?page_size= up to max_page_size, falling back to the default."""
+        try:
+            return _positive_int(
+                getattr(request, 'query_params', request.GET)[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def format_key(self, value):
+        """Serialize the leading sort key for a cursor."""
+        return value.isoformat()
+
+    def parse_key(self, raw):
+        """Parse the leading sort key back from a cursor; None if malformed."""
+        return parse_datetime(raw)
+
+    def parse_id(self, raw):
+        """Parse the tie-breaking id back from a cursor; raises ValueError if malformed."""
+        return uuid.UUID(raw)
+
+    def encode_cursor(self, row):
+        """Build an opaque, URL-safe cursor from a row's sort key."""
+        timestamp = getattr(row, self.timestamp_field)
+        raw = f"{self.format_key(timestamp)}|{getattr(row, self.id_field)}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, encoded):
+        """
+        Turn a cursor back into a (timestamp, id) pair.
+        Returns None when no cursor was supplied and raises 404 for garbage.
+        """
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+            timestamp, row_id = raw.split('|', 1)
+            parsed = self.parse_key(timestamp)
+            row_id = self.parse_id(row_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if parsed is None:
+            raise NotFound(self.invalid_cursor_message)
+        return parsed, row_id
+
+    def get_next_link(self):
+        """Link to the next (older) page, or None when there is nothing older."""
+        if not self.has_older or not self.page:
+            return None
+        url = remove_query_param(self.base_url, self.after_query_param)
+        return replace_query_param(url, self.before_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        """Link to the previous (newer) page, or None when already at the newest row."""
+        if not self.has_newer or not self.page:
+            return None
+        url = remove_query_param(self.base_url, self.before_query_param)
+        return replace_query_param(url, self.after_query_param, self.encode_cursor(self.page[0]))
+
+    def get_paginated_data(self, data):
+        """Same envelope as CustomPagination, minus the expensive count."""
+        return {
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'results': data
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'links': {
+                    'type': 'object',
+                    'properties': {
+                        'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                        'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                    },
+                },
+                'results': schema,
+            },
+        }
+
+
+class MessageCursorPagination(KeysetCursorPagination):
+    """
+    Messages newest first, keyed on (timestamp, message_id) so the
+    timestamp index drives every page.
+    """
+    timestamp_field = 'timestamp'
+    id_field = 'message_id'
+
+
+class InboxCursorPagination(KeysetCursorPagination):
+    """
+    Conversations by most recent activity, keyed on the denormalized
+    (last_message_at, conversation_id) pair.
+    """
+    timestamp_field = 'last_message_at'
+    id_field = 'conversation_id'
+
+
+class SearchRankCursorPagination(KeysetCursorPagination):
+    """
+    Full-text search results, most relevant first, keyed on the annotated
+    (rank, message_id) pair. `?before=` walks towards weaker matches.
+    """
+    timestamp_field = 'rank'
+    id_field = 'message_id'
+
+    def format_key(self, value):
+        # repr() round-trips a float exactly, so equal ranks compare equal again.
+        return repr(float(value))
+
+    def parse_key(self, raw):
+        try:
+            return float(raw)
+        except ValueError:
+            return None
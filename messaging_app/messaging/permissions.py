@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .membership import is_member
 from .models import Conversation, Message
 from rest_framework.permissions import BasePermission
 
@@ -21,20 +22,21 @@ class IsParticipantOfConversation(permissions.BasePermission):
         - Allows GET, HEAD, OPTIONS (safe methods) for participants to view.
         - Allows PUT, PATCH, DELETE only for participants to update/delete.
         - Supports both Conversation and Message objects.
+        Membership comes from the per-user cached conversation set, so a warm
+        cache answers without touching the database.
         """
         # Deny access if user is not authenticated
         if not request.user.is_authenticated:
             return False
-        # Allow access if user is not authenticated
+        # Use the raw foreign key so a Message never loads its conversation
         if isinstance(obj, Conversation):
-            conversation = obj
+            conversation_id = obj.conversation_id
         elif  isinstance(obj, Message):
-            message = obj
-            conversation = message.conversation 
+            conversation_id = obj.conversation_id
         else:
             return False
         # Check if user is a participant in the conversation
-        is_participant = conversation.participants.filter(user_id=request.user.user_id).exists()
+        is_participant = is_member(request.user.user_id, conversation_id)
         # Allow safe methods (GET, HEAD, OPTIONS) for participants
         if request.method in permissions.SAFE_METHODS:
             return is_participant
@@ -44,5 +46,17 @@ class IsParticipantOfConversation(permissions.BasePermission):
 
         # Allow POST for creating messages if user is a participant
         return is_participant
-    
-    
\ No newline at end of file
+
+
+async def is_conversation_participant(user, conversation_id) -> bool:
+    """
+    Async participant check for the ASGI read views.
+    Same rule as IsParticipantOfConversation, answered with one aexists()
+    query so the event loop is never blocked on a synchronous ORM call.
+    """
+    if not user.is_authenticated:
+        return False
+    return await Conversation.objects.filter(
+        conversation_id=conversation_id,
+        participants=user
+    ).aexists()
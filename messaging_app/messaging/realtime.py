@@ -0,0 +1,197 @@
+"""
+Pluggable pub/sub fan-out for real-time message delivery.
+
+The Message post_save signal publishes every new message to its conversation
+channel when anyone is watching it; WebSocket connections (see consumers.py) subscribe to the channels of
+the conversations they watch. The backend is chosen in settings:
+
+    MESSAGING_REALTIME = {
+        'BACKEND': 'messaging.realtime.InProcessBroker',   # tests, single node
+        # 'BACKEND': 'messaging.realtime.RedisBroker',     # several nodes
+        'OPTIONS': {'url': 'redis://127.0.0.1:6379/2'},
+    }
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+
+def conversation_channel(conversation_id) -> str:
+    return f"conversation:{conversation_id}"
+
+
+class Subscription:
+    """
+    A bounded queue of payloads for one subscriber on one channel.
+    A subscriber that falls `max_pending` messages behind starts dropping
+    the oldest ones rather than growing without limit.
+    """
+
+    def __init__(self, broker, channel, max_pending=100):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def offer(self, payload) -> None:
+        """Enqueue a payload; must run on the subscriber's event loop."""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self) -> None:
+        await self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    """
+    Interface every fan-out backend implements.
+    publish() is called from synchronous request threads; subscribe() and
+    unsubscribe() from the event loop serving WebSocket connections.
+    """
+
+    def publish(self, channel: str, payload: dict) -> None:
+        raise NotImplementedError
+
+    def has_subscribers(self, channel: str) -> bool:
+        """Whether anyone is subscribed to `channel`; lets publishers skip building payloads."""
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str) -> Subscription:
+        raise NotImplementedError
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """
+    Fan-out inside a single process. Publishing hands each payload to the
+    subscriber's event loop with call_soon_threadsafe, so it is safe to call
+    from any request thread. Suitable for tests and single-node deployments.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, payload)
+            except RuntimeError:
+                # The subscriber's loop has shut down; it will unsubscribe itself.
+                pass
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return channel in self._subscribers
+
+    async def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.max_pending)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class RedisBroker(BaseBroker):
+    """
+    Fan-out across processes and nodes through Redis PUBLISH/SUBSCRIBE.
+    All subscriptions in the process share one pub/sub connection: a channel
+    is subscribed on Redis when its first local subscriber arrives and
+    unsubscribed when its last one leaves, and a single reader task hands
+    each incoming message to the local subscribers of its channel. The
+    connection belongs to the event loop of the first subscriber.
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', max_pending=100):
+        import redis  # Imported lazily: only needed when this backend is configured
+
+        self.url = url
+        self.max_pending = max_pending
+        self._client = redis.Redis.from_url(url)
+        self._subscribers = defaultdict(set)
+        self._pubsub = None
+        self._reader = None
+        self._lock = None
+
+    def publish(self, channel, payload):
+        self._client.publish(channel, json.dumps(payload, cls=DjangoJSONEncoder))
+
+    def has_subscribers(self, channel):
+        # Counts subscribers on every node, not just this process.
+        [(_, count)] = self._client.pubsub_numsub(channel)
+        return count > 0
+
+    async def subscribe(self, channel):
+        import redis.asyncio as aioredis
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        subscription = Subscription(self, channel, self.max_pending)
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = aioredis.Redis.from_url(self.url, decode_responses=True).pubsub()
+            if channel not in self._subscribers:
+                await self._pubsub.subscribe(channel)
+            self._subscribers[channel].add(subscription)
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        async with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.channel]
+                await self._pubsub.unsubscribe(subscription.channel)
+
+    async def _read(self):
+        while True:
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None or message['type'] != 'message':
+                continue
+            payload = json.loads(message['data'])
+            for subscription in list(self._subscribers.get(message['channel'], ())):
+                subscription.offer(payload)
+
+
+@lru_cache(maxsize=None)
+def get_broker() -> BaseBroker:
+    """The process-wide broker configured by settings.MESSAGING_REALTIME."""
+    config = getattr(settings, 'MESSAGING_REALTIME', {})
+    backend = import_string(config.get('BACKEND', 'messaging.realtime.InProcessBroker'))
+    return backend(**config.get('OPTIONS', {}))
+
+
+def has_watchers(conversation_id) -> bool:
+    """Whether any WebSocket is subscribed to the conversation's channel."""
+    return get_broker().has_subscribers(conversation_channel(conversation_id))
+
+
+def publish_message(conversation_id, payload: dict) -> None:
+    """Push a serialized message to everyone watching its conversation."""
+    get_broker().publish(conversation_channel(conversation_id), {'type': 'message.created', 'message': payload})
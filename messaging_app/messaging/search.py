@@ -0,0 +1,97 @@
+"""
+Full-text search over message_content.
+
+PostgreSQL keeps `Message.search_vector` (a tsvector) up to date with a
+BEFORE INSERT/UPDATE trigger and indexes it with GIN; queries use
+websearch_to_tsquery and rank with ts_rank; both are installed by migration
+0007. SQLite has no tsvector, so an external-content FTS5 table kept in sync
+by triggers and ranked with bm25() stands in for it. SQLite recreates a table
+(dropping its triggers) on most schema changes, so that index is
+(re)installed by install_sqlite_index after every migrate instead.
+
+search_messages() annotates matching rows with a `rank` where higher is
+better on every backend, so callers can order and paginate identically.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'messaging_message_fts'
+
+SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        message_content, content='messaging_message', content_rowid='rowid'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON messaging_message BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, message_content) VALUES (new.rowid, new.message_content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON messaging_message BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_content)
+        VALUES ('delete', old.rowid, old.message_content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF message_content ON messaging_message BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_content)
+        VALUES ('delete', old.rowid, old.message_content);
+        INSERT INTO {FTS_TABLE}(rowid, message_content) VALUES (new.rowid, new.message_content);
+    END
+    """,
+    # Rowids change when SQLite rebuilds the message table, so re-index from scratch.
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def install_sqlite_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate receiver: make sure the FTS5 table and its sync triggers
+    exist on SQLite and match the current message table.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite' or 'messaging_message' not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in SQLITE_INSTALL:
+            cursor.execute(statement)
+
+
+def fts5_query(text):
+    """
+    Quote every word of the user's input so FTS5 operators and stray quotes
+    in it cannot break the MATCH expression; the words are ANDed together.
+    """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+def search_messages(queryset, text):
+    """
+    Narrow a Message queryset to rows matching `text`, annotated with `rank`
+    (higher is more relevant).
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        # ts_rank() is a float4; cast it to float8 so a cursor's rank (a Python
+        # float) compares equal to the rows it was read from.
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+        return queryset.filter(search_vector=query).annotate(rank=rank)
+
+    if connection.vendor == 'sqlite':
+        # bm25() is lower for better matches, so negate it; rows without a match get NULL.
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = messaging_message.rowid",
+            (fts5_query(text),)
+        )
+        return queryset.annotate(rank=rank).filter(rank__isnull=False)
+
+    raise NotImplementedError(f"Full-text search is not available on {connection.vendor}.")
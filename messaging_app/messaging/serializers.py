@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import ChatUser, Conversation, Message
+from .models import ChatUser, Conversation, Message, UnreadCounter
+
+# How many participants/messages a conversation embeds in list responses.
+PREVIEW_LIMIT = 10
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatUser
@@ -31,6 +35,33 @@ class MessageSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Message Body Cannot Be Empty")
         return value
 
+class MessageSearchResultSerializer(MessageSerializer):
+    """A message matched by full-text search, with its relevance score."""
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ('rank',)
+
+class ThreadMessageSerializer(MessageSerializer):
+    """
+    A message with its replies nested beneath it. The view loads the whole
+    tree in one query and passes it as context['children'] (parent id ->
+    replies), so nesting never touches the database.
+    """
+    depth = serializers.SerializerMethodField()
+    replies = serializers.SerializerMethodField()
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ('depth', 'replies')
+
+    def get_depth(self, obj):
+        """Depth relative to the message the thread was requested for."""
+        return obj.depth - self.context['root_depth']
+
+    def get_replies(self, obj):
+        replies = self.context['children'].get(obj.pk, [])
+        return ThreadMessageSerializer(replies, many=True, context=self.context).data
+
 class ConversationSerializer(serializers.ModelSerializer):
     participants = serializers.SerializerMethodField()
     messages = serializers.SerializerMethodField()
@@ -43,6 +74,50 @@ class ConversationSerializer(serializers.ModelSerializer):
             'messages'
             )
     def get_participants(self, obj):
-        return UserSerializer(obj.participants.all()[:10], many = True).data
+        # Use the window-limited Prefetch from ConversationViewSet when present;
+        # slicing obj.participants.all() would bypass it and query per row.
+        participants = getattr(obj, 'preview_participants', None)
+        if participants is None:
+            participants = obj.participants.all()[:PREVIEW_LIMIT]
+        return UserSerializer(participants, many = True).data
     def get_messages(self, obj):
-        return MessageSerializer(obj.messages.all()[:10], many = True).data
\ No newline at end of file
+        messages = getattr(obj, 'preview_messages', None)
+        if messages is None:
+            messages = obj.messages.select_related('sender').order_by('-timestamp')[:PREVIEW_LIMIT]
+        return MessageSerializer(messages, many = True).data
+
+class InboxConversationSerializer(serializers.ModelSerializer):
+    last_message = MessageSerializer(read_only=True)
+    class Meta:
+        model = Conversation
+        fields = (
+            'conversation_id',
+            'last_message_at',
+            'message_count',
+            'last_message'
+            )
+
+class UnreadCounterSerializer(serializers.ModelSerializer):
+    conversation_id = serializers.UUIDField(read_only=True)
+    unread_count = serializers.IntegerField(source='count', read_only=True)
+    class Meta:
+        model = UnreadCounter
+        fields = (
+            'conversation_id',
+            'unread_count',
+            'updated_at'
+            )
+
+class MarkReadSerializer(serializers.Serializer):
+    """
+    Optional upper bound for the bulk mark-read action. Give either a
+    pagination cursor (inclusive of that message) or a timestamp; with
+    neither, every unread message in the conversation is marked read.
+    """
+    cursor = serializers.CharField(required=False, allow_blank=False)
+    timestamp = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'cursor' in attrs and 'timestamp' in attrs:
+            raise serializers.ValidationError("Provide either cursor or timestamp, not both.")
+        return attrs
@@ -0,0 +1,202 @@
+import time
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+
+from .cache import bump_conversation_version
+from .models import ChatUser, Conversation, Message, MessageHistory, Notification, NotificationOutbox, UnreadCounter
+
+
+class NotificationService:
+    """
+    Creates user notifications for new messages.
+    The request that sends a message only records an outbox event; the
+    notifications themselves are written in bulk by a background worker.
+    Every participant except the sender is notified, so group chats fan out
+    to all their members rather than to the single `Message.receiver`.
+    """
+
+    @staticmethod
+    def enqueue(message):
+        """Record a message-created event; the only write on the send path."""
+        return NotificationOutbox.objects.create(message=message)
+
+    @staticmethod
+    def participants_by_conversation(conversation_ids):
+        """Participant ids of each conversation, read with one query for the whole batch."""
+        members = defaultdict(set)
+        rows = Conversation.participants.through.objects.filter(
+            conversation_id__in=set(conversation_ids)
+        ).values_list('conversation_id', 'chatuser_id')
+        for conversation_id, user_id in rows:
+            members[conversation_id].add(user_id)
+        return members
+
+    @staticmethod
+    def build_notifications(message_id, sender_id, receiver_id, participant_ids):
+        """
+        Unsaved notifications for everyone in the conversation but the sender.
+        Falls back to the message's receiver for a conversation without participants.
+        """
+        recipients = (participant_ids - {sender_id}) or {receiver_id}
+        return [Notification(user_id=user_id, message_id=message_id) for user_id in recipients]
+
+    @classmethod
+    def fan_out(cls, message):
+        """Notify every other participant of `message` with a single bulk_create."""
+        members = cls.participants_by_conversation([message.conversation_id])
+        return Notification.objects.bulk_create(cls.build_notifications(
+            message.message_id, message.sender_id, message.receiver_id, members[message.conversation_id]
+        ))
+
+    @classmethod
+    def process_outbox_batch(cls, batch_size=500):
+        """
+        Turn up to `batch_size` pending outbox events into notifications.
+        Claiming, reading the participants, the bulk insert and deleting the
+        claimed events happen in one transaction, so every event yields its
+        notifications exactly once even with several workers draining
+        concurrently. Returns the number of events processed.
+        """
+        with transaction.atomic():
+            events = list(NotificationOutbox.objects.claim_batch(batch_size))
+            if not events:
+                return 0
+            members = cls.participants_by_conversation(event[4] for event in events)
+            notifications = []
+            for _, message_id, sender_id, receiver_id, conversation_id in events:
+                notifications.extend(cls.build_notifications(
+                    message_id, sender_id, receiver_id, members[conversation_id]
+                ))
+            Notification.objects.bulk_create(notifications, batch_size=1000)
+            NotificationOutbox.objects.filter(outbox_id__in=[event[0] for event in events]).delete()
+        return len(events)
+
+
+def raw_delete(model, field_name, values):
+    """
+    Delete the rows of `model` whose `field_name` is in `values` with one
+    `DELETE ... WHERE <column> IN (...)` statement. Unlike QuerySet.delete()
+    nothing is loaded into Python to emulate cascades or send signals, so
+    callers must clear dependent rows first. Returns the number of rows deleted.
+    """
+    if not values:
+        return 0
+    field = model._meta.pk if field_name == 'pk' else model._meta.get_field(field_name)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    params = [field.get_db_prep_value(value, connection) for value in values]
+    sql = 'DELETE FROM {} WHERE {} IN ({})'.format(
+        quote(model._meta.db_table), quote(field.column), ', '.join(['%s'] * len(params))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+class UserCleanUpService:
+    """
+    Removes everything a user has written or received, in bounded batches.
+    Each batch is its own short transaction over at most `batch_size` rows
+    picked in primary-key order, so memory use and lock time stay flat for
+    users with any number of messages. Deleted rows are gone for good, so
+    re-running an interrupted purge simply carries on where it stopped.
+    """
+
+    def __init__(self, user_id, batch_size=1000, pause=0.0, progress=None):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress = progress or (lambda step, deleted: None)
+        self.affected_conversations = set()
+
+    def purge(self):
+        """Run every step; returns the number of rows deleted per model."""
+        # Includes conversations an interrupted earlier run already emptied of this user's messages.
+        self.affected_conversations.update(
+            Conversation.participants.through.objects.filter(
+                chatuser_id=self.user_id
+            ).values_list('conversation_id', flat=True)
+        )
+        totals = {
+            'Notification': self._in_batches(
+                'Notification', Notification.objects.filter(user_id=self.user_id), self._delete_notifications
+            ),
+            'Message': self._in_batches(
+                'Message',
+                Message.objects.filter(Q(sender_id=self.user_id) | Q(receiver_id=self.user_id)),
+                self._delete_messages
+            ),
+            'MessageHistory': self._in_batches(
+                'MessageHistory', MessageHistory.objects.filter(edited_by_id=self.user_id), self._delete_histories
+            ),
+        }
+        self._refresh_conversations()
+        return totals
+
+    def delete_user(self):
+        """
+        Purge the user's data, then delete the account itself.
+        With the messages already gone the ORM cascade has nothing large to
+        collect, so the final delete is a handful of queries.
+        """
+        totals = self.purge()
+        ChatUser.objects.filter(pk=self.user_id).delete()
+        return totals
+
+    def _in_batches(self, step, queryset, delete_batch):
+        """Feed primary keys of `queryset` to `delete_batch` until none are left."""
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+                if not ids:
+                    return deleted
+                delete_batch(ids)
+            deleted += len(ids)
+            self.progress(step, deleted)
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _delete_notifications(self, ids):
+        raw_delete(Notification, 'pk', ids)
+
+    def _delete_histories(self, ids):
+        raw_delete(MessageHistory, 'pk', ids)
+
+    def _delete_messages(self, ids):
+        """
+        Delete one batch of messages and the rows that point at them.
+        Other users' replies are detached rather than deleted and become the
+        roots of their own threads; conversation pointers to the batch are
+        cleared and recomputed at the end.
+        """
+        self.affected_conversations.update(
+            Message.objects.filter(pk__in=ids).values_list('conversation_id', flat=True).distinct()
+        )
+        raw_delete(MessageHistory, 'message', ids)
+        raw_delete(Notification, 'message', ids)
+        raw_delete(NotificationOutbox, 'message', ids)
+        detached = list(
+            Message.objects.filter(parent_message_id__in=ids).exclude(pk__in=ids).values_list('pk', 'depth')
+        )
+        Message.objects.filter(parent_message_id__in=ids).update(parent_message=None)
+        for reply_id, depth in detached:
+            # The reply now starts its own thread; move its subtree under it.
+            Message.objects.thread(reply_id).update(thread_root_id=reply_id, depth=F('depth') - depth)
+        Conversation.objects.filter(last_message_id__in=ids).update(last_message=None)
+        raw_delete(Message, 'pk', ids)
+
+    def _refresh_conversations(self):
+        """
+        The raw deletes skipped the Message post_delete signals, so recompute
+        what they would have maintained for every conversation touched.
+        """
+        conversation_ids = list(self.affected_conversations)
+        if not conversation_ids:
+            return
+        Conversation.objects.refresh_activity(conversation_ids)
+        UnreadCounter.objects.rebuild(conversation_ids, batch_size=self.batch_size)
+        for conversation_id in conversation_ids:
+            transaction.on_commit(lambda conversation_id=conversation_id: bump_conversation_version(conversation_id))
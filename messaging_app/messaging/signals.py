@@ -1,55 +1,188 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
 from django.dispatch import receiver 
-from django.db.models import Q
-from .models import Message, MessageHistory, ChatUser, Notification
+from django.db import transaction
+from . import membership
+from .cache import bump_conversation_version
+from .models import Message, MessageHistory, ChatUser, Notification, UnreadCounter, Conversation
+from .realtime import has_watchers, publish_message
+from .serializers import MessageSerializer
+from .services import NotificationService
 
 @receiver(post_save, sender=Message)
 def create_notification(sender, instance, created, **kwargs):
     """
-        Creates a notification for the receiver when a new message is created.
+        Queues a notification for the receiver when a new message is created.
+        Only an outbox event is written here; `process_notification_outbox`
+        creates the notification rows in bulk outside the request.
     Args:
         sender (Model): The model class (Message).
         instance (Message): The specific Message instance being saved.
         created (bool): Indicates whether the instance was newly created.
     """
     if created:
-        user=instance.receiver,
-        message=instance,
-        read=False
+        NotificationService.enqueue(instance)
+
+@receiver(post_save, sender=Message)
+def increment_unread_counter(sender, instance, created, **kwargs):
+    """
+    Bumps the receiver's materialized unread counter for the conversation
+    when a new unread message is created.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being saved.
+        created (bool): Indicates whether the instance was newly created.
+    """
+    if created and not instance.read:
+        UnreadCounter.objects.increment(instance.receiver_id, instance.conversation_id)
+
+@receiver(post_delete, sender=Message)
+def decrement_unread_counter(sender, instance, **kwargs):
+    """
+    Keeps the receiver's unread counter in step when an unread message is deleted.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being deleted.
+    """
+    if not instance.read:
+        UnreadCounter.objects.decrement(instance.receiver_id, instance.conversation_id)
+
+@receiver(post_save, sender=Message)
+def update_conversation_activity(sender, instance, created, **kwargs):
+    """
+    Moves the conversation's last-message pointer and bumps its message count
+    in one atomic UPDATE when a new message is created.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being saved.
+        created (bool): Indicates whether the instance was newly created.
+    """
+    if created:
+        Conversation.objects.record_message(instance)
+
+@receiver(post_delete, sender=Message)
+def rewind_conversation_activity(sender, instance, **kwargs):
+    """
+    Keeps the conversation's activity summary correct when a message is deleted.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being deleted.
+    """
+    Conversation.objects.record_message_deleted(instance)
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_conversation_cache(sender, instance, **kwargs):
+    """
+    Retires every cached message-list page of the message's conversation
+    by bumping its cache version whenever a message is written or deleted.
+    The bump waits for commit so a concurrent read cannot re-cache the old
+    rows under the new version.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being saved or deleted.
+    """
+    conversation_id = instance.conversation_id
+    transaction.on_commit(lambda: bump_conversation_version(conversation_id))
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    """
+    Publishes a newly created message to everyone watching its conversation
+    over WebSockets, once the surrounding transaction has committed. The
+    message is only serialized when the conversation has watchers.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being saved.
+        created (bool): Indicates whether the instance was newly created.
+    """
+    if created:
+        def push():
+            if has_watchers(instance.conversation_id):
+                publish_message(instance.conversation_id, MessageSerializer(instance).data)
+        transaction.on_commit(push)
+
+@receiver(pre_save, sender=Message)
+def assign_thread_position(sender, instance, **kwargs):
+    """
+    Places a new message in its reply thread: a top-level message is its
+    own thread root, a reply inherits its parent's root one level deeper.
+    Args:
+        sender (Model): The model class (Message).
+        instance (Message): The specific Message instance being saved.
+    """
+    if not instance._state.adding:
+        return
+    if instance.parent_message_id is None:
+        instance.thread_root_id = instance.pk
+        instance.depth = 0
+    else:
+        parent = instance.parent_message
+        instance.thread_root_id = parent.thread_root_id or parent.pk
+        instance.depth = parent.depth + 1
 
 @receiver(pre_save, sender = Message)
-def log_edits(sender, instance, **kwargs):
+def log_edits(sender, instance, update_fields=None, **kwargs):
     """
-    Log the old content of a message before it ’s updated ( Task 1).
+    Flags a message as edited when its content changes (Task 1).
+    The old content comes from the snapshot taken when the message was
+    loaded, so no extra SELECT is issued and `edited` is written by the same
+    UPDATE as the new content.
     Args :
     sender : The model class ( Message )
     instance : The Message instance being saved
+    update_fields : The fields being saved, or None for all of them
+    """
+    if update_fields is not None and 'message_content' not in update_fields:
+        return
+    old_content = instance.get_loaded_value('message_content')
+    if old_content is None or old_content == instance.message_content:
+        return
+    instance.edited = True
+    instance._edited_from = old_content
+
+@receiver(post_save, sender = Message)
+def record_edit_history(sender, instance, **kwargs):
+    """
+    Stores the previous content of an edited message in MessageHistory
+    once the edit is saved, then refreshes the instance's snapshot so a
+    later save compares against what is now in the database.
+    Args :
+    sender : The model class ( Message )
+    instance : The Message instance that was saved
+    """
+    old_content = instance.__dict__.pop('_edited_from', None)
+    if old_content is not None:
+        MessageHistory.objects.create(
+            message = instance,
+            old_content = old_content,
+            edited_by_id = instance.sender_id
+        )
+    instance.snapshot_tracked_fields()
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops the cached conversation membership of every user whose
+    participation changed, both immediately and again on commit so a read
+    racing the transaction cannot re-cache the old membership.
+    Args:
+        sender (Model): The participants through model.
+        instance (Conversation | ChatUser): The side of the relation being changed.
+        action (str): The m2m_changed action, e.g. "post_add".
+        reverse (bool): True when changed from the ChatUser side.
+        pk_set (set | None): Primary keys added or removed; None when clearing.
     """
-    if instance.message_id:
-        try:
-            old_message = Message.objects.get(message_id = instance.message_id)
-            if old_message:
-                instance.edited = True
-            MessageHistory.objects.create(
-                message = instance, 
-                old_content = old_message,
-                edited_by = instance.sender
-            )
-        except Exception as e:
-            pass
-
-@receiver(post_delete, sender = ChatUser)      
-def delete_user_data(sender, instance, **kwargs):
-    """
-    Cleans up messages, notifications, and message history when a user is deleted (Task 2).
-    Args:
-    sender (Model): The model class (ChatUser).
-    instance (ChatUser): The specific ChatUser instance being deleted.
-    """
-    # Delete messages where the user is the sender or receiver
-    Message.objects.filter(
-        Q(sender = instance)|Q(receiver = instance)
-        ).delete()
-    Notification.objects.filter(user = instance).delete()
-    MessageHistory.objects.filter(edited_by =  instance).delete()
-    
\ No newline at end of file
+    if action == 'pre_clear':
+        # pk_set is None for clear(); remember who is about to be removed.
+        instance._cleared_participants = (
+            {instance.pk} if reverse else set(instance.participants.values_list('pk', flat=True))
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        user_ids = instance.__dict__.pop('_cleared_participants', set())
+    else:
+        user_ids = {instance.pk} if reverse else set(pk_set)
+    membership.invalidate(user_ids)
+    transaction.on_commit(lambda: membership.invalidate(user_ids))
@@ -1,6 +1,31 @@
-from django.test import TestCase
-from .models import ChatUser, Message, Notification, MessageHistory
+import base64
+import asyncio
+import io
+import json
+import threading
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .auth import CustomTokenObtainPairSerializer
+from .cache import check_message_list_cache, get_cache_stats
+from .consumers import CLOSE_FORBIDDEN, conversation_websocket
+from .membership import get_conversation_ids, is_member
+from .models import ChatUser, Conversation, Message, MessageHistory, Notification, NotificationOutbox, UnreadCounter
+from .permissions import IsParticipantOfConversation
+from .services import NotificationService, UserCleanUpService, raw_delete
+
 
 
 class NotificationSignalTests(TestCase):
@@ -172,4 +197,835 @@ class ThreadedConversationTests(TestCase):
         user2_msgs = Message.objects.for_user(self.user2) # type: ignore
 
         self.assertEqual(user1_msgs.count(), 3)
-        self.assertEqual(user2_msgs.count(), 3)
\ No newline at end of file
+        self.assertEqual(user2_msgs.count(), 3)
+
+
+def create_conversation(*usernames):
+    """Create a user per username and one conversation they all take part in; returns (*users, conversation)."""
+    users = [
+        ChatUser.objects.create_user(username=username, email=f'{username}@test.com', password='pass')
+        for username in usernames
+    ]
+    conversation = Conversation.objects.create()
+    conversation.participants.set(users)
+    return (*users, conversation)
+
+
+class ConversationTestCase(TestCase):
+    """
+    Base for tests around one conversation between `user` and `other`,
+    created once per class. `client` is an APIClient authenticated as `user`,
+    and send() adds a message to the conversation (from `other` to `user`
+    unless told otherwise).
+    """
+    usernames = ('member', 'peer')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other, cls.conversation = create_conversation(*cls.usernames)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @classmethod
+    def send(cls, content, sender=None, receiver=None, **fields):
+        return Message.objects.create(
+            conversation=cls.conversation,
+            sender=sender or cls.other,
+            receiver=receiver or cls.user,
+            message_content=content,
+            **fields
+        )
+
+
+class MessageCursorPaginationTests(ConversationTestCase):
+    """
+    Tests for keyset pagination on the nested conversation messages endpoint.
+    Pages must be stable, gap-free and must never issue a COUNT(*).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Pairs of messages share a timestamp so the message_id tie-breaker is exercised.
+        base = timezone.now()
+        for i in range(25):
+            cls.send(f"message {i}", sender=cls.user, receiver=cls.other, timestamp=base + timedelta(seconds=i // 2))
+        cls.url = reverse('conversation-messages-list', args=[cls.conversation.conversation_id])
+
+    def test_pages_walk_backwards_without_gaps_or_count(self):
+        seen = []
+        url = f"{self.url}?page_size=10"
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('count', response.data)
+                seen.extend(item['message_id'] for item in response.data['results'])
+                url = response.data['links']['next']
+
+        expected = list(
+            Message.objects.order_by('-timestamp', '-message_id').values_list('message_id', flat=True)
+        )
+        self.assertEqual(seen, [str(message_id) for message_id in expected])
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in ctx.captured_queries))
+
+    def test_after_cursor_returns_newer_messages(self):
+        first_page = self.client.get(f"{self.url}?page_size=10").data
+        second_page = self.client.get(first_page['links']['next']).data
+        newer = self.client.get(second_page['links']['previous']).data
+        self.assertEqual(
+            [item['message_id'] for item in newer['results']],
+            [item['message_id'] for item in first_page['results']]
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f"{self.url}?before=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_garbage_id_is_rejected(self):
+        cursor = base64.urlsafe_b64encode(b"2024-01-01T00:00:00+00:00|notauuid").decode('ascii')
+        response = self.client.get(self.url, {'before': cursor})
+        self.assertEqual(response.status_code, 404)
+
+
+class UnreadCounterTests(ConversationTestCase):
+    """
+    Tests for the materialized per-(user, conversation) unread counters.
+    """
+
+    def _send(self, count):
+        for i in range(count):
+            self.send(f"unread {i}")
+
+    def test_new_messages_increment_counter(self):
+        self._send(3)
+        counter = UnreadCounter.objects.get(user=self.user, conversation=self.conversation)
+        self.assertEqual(counter.count, 3)
+        self.assertFalse(UnreadCounter.objects.filter(user=self.other).exists())
+
+    def test_unread_endpoint_reads_counters(self):
+        self._send(2)
+        url = reverse('conversation-messages-unread', args=[self.conversation.conversation_id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(response.data['conversations'][0]['conversation_id'], str(self.conversation.conversation_id))
+
+    def test_rebuild_command_restores_counters(self):
+        self._send(4)
+        Message.objects.filter(pk=Message.objects.first().pk).update(read=True)
+        UnreadCounter.objects.all().delete()
+        call_command('rebuild_unread_counters', stdout=io.StringIO())
+        counter = UnreadCounter.objects.get(user=self.user, conversation=self.conversation)
+        self.assertEqual(counter.count, 3)
+
+
+class MarkReadTests(ConversationTestCase):
+    """
+    Tests for the bulk mark-read action: one UPDATE, no per-row signals.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.base = timezone.now()
+        cls.messages = [cls.send(f"to read {i}", timestamp=cls.base + timedelta(minutes=i)) for i in range(5)]
+        cls.url = reverse('conversation-messages-mark-read', args=[cls.conversation.conversation_id])
+
+    def test_marks_up_to_timestamp_in_one_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'timestamp': (self.base + timedelta(minutes=2)).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['marked_read'], 3)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "messaging_message"')]
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(MessageHistory.objects.exists())
+        self.assertEqual(Message.objects.filter(read=False).count(), 2)
+        self.assertEqual(UnreadCounter.objects.get(user=self.user).count, 2)
+
+    def test_cursor_with_garbage_id_is_rejected(self):
+        cursor = base64.urlsafe_b64encode(b"2024-01-01T00:00:00+00:00|notauuid").decode('ascii')
+        response = self.client.post(self.url, {'cursor': cursor}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+        self.assertEqual(Message.objects.filter(read=False).count(), 5)
+
+    def test_sender_marks_nothing(self):
+        self.client.force_authenticate(self.other)
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.data['marked_read'], 0)
+
+
+class ConversationListQueryCountTests(TestCase):
+    """
+    Regression test for the N+1 queries in ConversationSerializer.
+    Listing conversations must cost the same number of queries regardless
+    of how many conversations, participants or messages there are.
+    """
+
+    def setUp(self):
+        self.user = ChatUser.objects.create_user(username='lister', email='lister@test.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('conversation-list')
+
+    def _create_conversations(self, count):
+        for i in range(count):
+            other = ChatUser.objects.create_user(
+                username=f'peer{i}_{Conversation.objects.count()}',
+                email=f'peer{i}_{Conversation.objects.count()}@test.com',
+                password='pass'
+            )
+            conversation = Conversation.objects.create()
+            conversation.participants.set([self.user, other])
+            for j in range(12):
+                Message.objects.create(
+                    conversation=conversation,
+                    sender=other,
+                    receiver=self.user,
+                    message_content=f"preview {j}"
+                )
+
+    def test_query_count_is_constant(self):
+        self._create_conversations(2)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 2)
+
+        self._create_conversations(8)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(len(response.data[0]['messages']), 10)
+
+        # conversations + participants prefetch + messages (with sender) prefetch
+        self.assertEqual(len(small.captured_queries), 3)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+
+class InboxTests(ConversationTestCase):
+    """
+    Tests for the denormalized last-message pointer and the inbox endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.base = timezone.now()
+        cls.conversations = [cls.conversation]
+        for _ in range(2):
+            conversation = Conversation.objects.create()
+            conversation.participants.set([cls.user, cls.other])
+            cls.conversations.append(conversation)
+        # Activity order, newest first: conversations[1], conversations[0], conversations[2]
+        for conversation, minutes in ((cls.conversations[2], 1), (cls.conversations[0], 2), (cls.conversations[1], 3)):
+            Message.objects.create(
+                conversation=conversation,
+                sender=cls.other,
+                receiver=cls.user,
+                message_content="latest",
+                timestamp=cls.base + timedelta(minutes=minutes)
+            )
+
+    def test_pointer_tracks_newest_message(self):
+        conversation = self.conversations[0]
+        older = self.send("backfilled", sender=self.user, receiver=self.other, timestamp=self.base - timedelta(days=1))
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 2)
+        self.assertNotEqual(conversation.last_message_id, older.pk)
+
+        conversation.last_message.delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 1)
+        self.assertEqual(conversation.last_message_id, older.pk)
+
+    def test_inbox_orders_by_activity_with_cursor(self):
+        url = reverse('conversation-inbox')
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.client.get(f"{url}?page_size=2").data
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(
+            [item['conversation_id'] for item in first['results']],
+            [str(self.conversations[1].pk), str(self.conversations[0].pk)]
+        )
+        second = self.client.get(first['links']['next']).data
+        self.assertEqual([item['conversation_id'] for item in second['results']], [str(self.conversations[2].pk)])
+        self.assertIsNone(second['links']['next'])
+
+
+class MessageExportTests(ConversationTestCase):
+    """
+    Tests for the streaming NDJSON export of a conversation's history.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outsider = ChatUser.objects.create_user(username='outsider', email='outsider@test.com', password='pass')
+        for i in range(5):
+            cls.send(f"archived {i}", sender=cls.user, receiver=cls.other)
+        cls.url = reverse('conversation-messages-export', args=[cls.conversation.conversation_id])
+
+    def test_export_streams_ndjson_in_one_query(self):
+        get_conversation_ids(self.user.user_id)  # Warm the membership cache the access check reads
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+            body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([line['message_content'] for line in lines], [f"archived {i}" for i in range(5)])
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_outsider_is_forbidden(self):
+        self.client.force_authenticate(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_unknown_conversation_is_not_found(self):
+        url = reverse('conversation-messages-export', args=[uuid.uuid4()])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AsyncReadPathTests(TransactionTestCase):
+    """
+    Tests for the ASGI-native read endpoints, driven through AsyncClient.
+    """
+
+    def setUp(self):
+        self.user, self.other, self.conversation = create_conversation('async_reader', 'async_writer')
+        for i in range(3):
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.other,
+                receiver=self.user,
+                message_content=f"async {i}"
+            )
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    async def test_async_endpoints(self):
+        client = AsyncClient()
+        messages_url = reverse('async-conversation-messages', args=[self.conversation.conversation_id])
+        response = await client.get(f"{messages_url}?page_size=2", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['message_content'] for item in response.json()['results']], ['async 2', 'async 1'])
+
+        response = await client.get(reverse('async-unread'), headers=self.headers)
+        self.assertEqual(response.json()['total'], 3)
+
+        response = await client.get(reverse('async-conversation-list'), headers=self.headers)
+        self.assertEqual(response.json()['results'][0]['message_count'], 3)
+
+        response = await client.get(reverse('async-user-me'))
+        self.assertEqual(response.status_code, 401)
+
+
+class RealtimeDeliveryTests(TransactionTestCase):
+    """
+    New messages are pushed over the WebSocket endpoint through the
+    in-process broker once the creating transaction commits.
+    """
+
+    def setUp(self):
+        self.user, self.other, self.conversation = create_conversation('ws_reader', 'ws_writer')
+        self.outsider = ChatUser.objects.create_user(username='ws_outsider', email='wso@test.com', password='pass')
+        self.token = str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+        self.outsider_token = str(CustomTokenObtainPairSerializer.get_token(self.outsider).access_token)
+
+    async def connect(self, token):
+        """Start the ASGI handler; returns (inbound queue, outbound queue, task)."""
+        inbound, outbound = asyncio.Queue(), asyncio.Queue()
+        scope = {
+            'type': 'websocket',
+            'path': f'/ws/conversations/{self.conversation.conversation_id}/',
+            'query_string': f'token={token}'.encode(),
+            'headers': [],
+        }
+        await inbound.put({'type': 'websocket.connect'})
+        task = asyncio.create_task(conversation_websocket(scope, inbound.get, outbound.put))
+        return inbound, outbound, task
+
+    async def test_participant_receives_new_messages(self):
+        inbound, outbound, task = await self.connect(self.token)
+        self.assertEqual((await asyncio.wait_for(outbound.get(), 5))['type'], 'websocket.accept')
+
+        await sync_to_async(Message.objects.create)(
+            conversation=self.conversation,
+            sender=self.other,
+            receiver=self.user,
+            message_content="pushed"
+        )
+        frame = await asyncio.wait_for(outbound.get(), 5)
+        payload = json.loads(frame['text'])
+        self.assertEqual(payload['type'], 'message.created')
+        self.assertEqual(payload['message']['message_content'], "pushed")
+
+        await inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(task, 5)
+
+    def test_unwatched_conversation_is_not_serialized(self):
+        with mock.patch('messaging.signals.MessageSerializer') as serializer, \
+                mock.patch('messaging.signals.publish_message') as publish:
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.other,
+                receiver=self.user,
+                message_content="nobody is watching"
+            )
+        serializer.assert_not_called()
+        publish.assert_not_called()
+
+    async def test_non_participant_is_rejected(self):
+        _, outbound, task = await self.connect(self.outsider_token)
+        frame = await asyncio.wait_for(outbound.get(), 5)
+        self.assertEqual(frame, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        await asyncio.wait_for(task, 5)
+
+
+class ConversationMessagesCacheTests(ConversationTestCase):
+    """
+    Cached conversation message pages are retired by message writes rather
+    than by a short expiry, and hits and misses are counted per endpoint.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.send("first")
+        conversation_id = self.conversation.conversation_id
+        self.url = reverse(
+            'conversation-messages-get-conversation-messages',
+            kwargs={'conversation_id_pk': conversation_id, 'conversation_id': conversation_id}
+        )
+
+    def send(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return super().send(content)
+
+    def contents(self, response):
+        return [item['message_content'] for item in response.json()['results']]
+
+    def test_new_message_invalidates_cached_page(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self.contents(first), ["first"])
+
+        second = self.client.get(self.url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+
+        self.send("second")
+        third = self.client.get(self.url)
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual(self.contents(third), ["second", "first"])
+
+        stats = get_cache_stats()['MessageViewSet.get_conversation_messages']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_mark_read_invalidates_cached_page(self):
+        self.client.get(self.url)
+        mark_read_url = reverse('conversation-messages-mark-read', args=[self.conversation.conversation_id])
+        self.client.post(mark_read_url, {}, format='json')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['results'][0]['read'])
+
+    def test_long_timeout_needs_a_shared_cache(self):
+        self.assertEqual(check_message_list_cache(None), [])
+        with override_settings(MESSAGE_LIST_CACHE_TIMEOUT=60 * 60 * 6):
+            self.assertEqual([error.id for error in check_message_list_cache(None)], ['messaging.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(MESSAGE_LIST_CACHE_TIMEOUT=60 * 60 * 6, CACHES=redis):
+            self.assertEqual(check_message_list_cache(None), [])
+
+
+class NotificationOutboxTests(ConversationTestCase):
+    """
+    Sending a message only writes an outbox event; notifications are
+    created in bulk when the outbox is drained.
+    """
+
+    def test_send_only_enqueues(self):
+        message = self.send("queued")
+        self.assertEqual(list(NotificationOutbox.objects.values_list('message_id', flat=True)), [message.message_id])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_outbox_is_drained_in_batches(self):
+        messages = [self.send(f"queued {i}") for i in range(5)]
+        # Claim, participants, bulk insert and delete, wrapped in the test transaction's savepoint pair.
+        with self.assertNumQueries(6):
+            self.assertEqual(NotificationService.process_outbox_batch(batch_size=3), 3)
+        self.assertEqual(NotificationService.process_outbox_batch(batch_size=3), 2)
+        self.assertEqual(NotificationService.process_outbox_batch(batch_size=3), 0)
+
+        self.assertFalse(NotificationOutbox.objects.exists())
+        self.assertEqual(
+            set(Notification.objects.filter(user=self.user).values_list('message_id', flat=True)),
+            {message.message_id for message in messages}
+        )
+
+    def test_group_messages_notify_every_other_participant(self):
+        members = [
+            ChatUser.objects.create_user(username=f'group_member_{i}', email=f'gm{i}@test.com')
+            for i in range(23)
+        ]
+        self.conversation.participants.add(*members)
+        message = self.send("hello everyone")
+
+        NotificationService.process_outbox_batch()
+        notified = set(Notification.objects.filter(message=message).values_list('user_id', flat=True))
+        self.assertEqual(notified, {self.user.user_id} | {member.user_id for member in members})
+
+    def test_fan_out_is_one_insert_per_message(self):
+        members = [
+            ChatUser.objects.create_user(username=f'fan_member_{i}', email=f'fm{i}@test.com')
+            for i in range(4)
+        ]
+        self.conversation.participants.add(*members)
+        message = self.send("fan out")
+        with self.assertNumQueries(2):
+            notifications = NotificationService.fan_out(message)
+        self.assertEqual(len(notifications), 5)
+
+    def test_benchmark_refuses_a_pending_outbox(self):
+        self.send("real event")
+        with self.assertRaisesMessage(CommandError, "1 pending events"):
+            call_command('benchmark_notification_fanout', seconds=0.01, stdout=io.StringIO())
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_worker_error_stops_the_command(self):
+        # The first batch fails with an unexpected error; the other worker keeps finding nothing.
+        errors = [RuntimeError("boom")]
+
+        def process_outbox_batch(batch_size):
+            try:
+                raise errors.pop()
+            except IndexError:
+                return 0
+
+        outcome = {}
+
+        def run():
+            try:
+                call_command('process_notification_outbox', workers=2, poll_interval=0.01, stdout=io.StringIO())
+            except RuntimeError as error:
+                outcome['error'] = error
+
+        with mock.patch('messaging.services.NotificationService.process_outbox_batch', process_outbox_batch):
+            command = threading.Thread(target=run, daemon=True)
+            command.start()
+            command.join(timeout=10)
+        self.assertFalse(command.is_alive())
+        self.assertEqual(str(outcome['error']), "boom")
+
+
+class MessageEditHistoryTests(ConversationTestCase):
+    """
+    Editing a message records the old content from the snapshot taken at
+    load time: one UPDATE for the message and one INSERT for its history.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.message_id = cls.send("original").message_id
+
+    def test_edit_costs_two_statements(self):
+        message = Message.objects.get(message_id=self.message_id)
+        message.message_content = "edited"
+        with self.assertNumQueries(2):
+            message.save()
+
+        message.refresh_from_db()
+        self.assertTrue(message.edited)
+        history = MessageHistory.objects.get(message=message)
+        self.assertEqual(history.old_content, "original")
+        self.assertEqual(history.edited_by, self.other)
+
+    def test_save_without_content_change_records_nothing(self):
+        message = Message.objects.get(message_id=self.message_id)
+        message.read = True
+        with self.assertNumQueries(1):
+            message.save()
+        self.assertFalse(MessageHistory.objects.exists())
+        self.assertFalse(Message.objects.get(message_id=self.message_id).edited)
+
+    def test_successive_edits_compare_against_last_save(self):
+        message = Message.objects.get(message_id=self.message_id)
+        for content in ("second", "third"):
+            message.message_content = content
+            message.save()
+        self.assertEqual(
+            list(MessageHistory.objects.order_by('edited_at').values_list('old_content', flat=True)),
+            ["original", "second"]
+        )
+
+
+class UserPurgeTests(ConversationTestCase):
+    """
+    The batched purge removes a user's messages and everything hanging off
+    them, leaves other users' data intact and repairs the denormalized
+    conversation and unread summaries the raw deletes bypassed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.sent = [cls.send(f"sent {i}", sender=cls.user, receiver=cls.other) for i in range(5)]
+        cls.received = cls.send("received")
+        cls.kept = cls.send("kept", receiver=cls.other)
+        cls.reply = cls.send("reply", receiver=cls.other, parent_message=cls.sent[0])
+        Notification.objects.create(user=cls.user, message=cls.kept)
+        MessageHistory.objects.create(message=cls.kept, old_content="old", edited_by=cls.user)
+
+    def test_purge_in_batches(self):
+        steps = []
+        totals = UserCleanUpService(
+            self.user.user_id, batch_size=2, progress=lambda step, deleted: steps.append((step, deleted))
+        ).purge()
+
+        self.assertEqual(totals, {'Notification': 1, 'Message': 6, 'MessageHistory': 1})
+        self.assertEqual([deleted for step, deleted in steps if step == 'Message'], [2, 4, 6])
+        self.assertFalse(Message.objects.filter(sender=self.user).exists())
+        self.assertFalse(Message.objects.filter(receiver=self.user).exists())
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+        self.assertFalse(MessageHistory.objects.filter(edited_by=self.user).exists())
+
+        self.reply.refresh_from_db()
+        self.assertIsNone(self.reply.parent_message)
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        self.assertEqual(conversation.message_count, 2)
+        self.assertEqual(conversation.last_message_id, self.reply.message_id)
+        self.assertEqual(
+            list(UnreadCounter.objects.filter(count__gt=0).values_list('user_id', 'count')),
+            [(self.other.user_id, 2)]
+        )
+
+    def test_raw_delete_removes_only_the_given_rows(self):
+        ids = [message.message_id for message in self.sent[1:3]]
+        with CaptureQueriesContext(connection) as ctx:
+            raw_delete(NotificationOutbox, 'message', ids)
+            deleted = raw_delete(Message, 'pk', ids)
+        self.assertEqual(deleted, 2)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertTrue(all(q['sql'].startswith('DELETE FROM') for q in ctx.captured_queries))
+        self.assertFalse(Message.objects.filter(pk__in=ids).exists())
+        self.assertEqual(Message.objects.filter(sender=self.user).count(), 3)
+        self.assertEqual(raw_delete(Message, 'pk', []), 0)
+
+    def test_account_deletion_goes_through_the_purge(self):
+        url = reverse('user-detail', args=[self.user.user_id])
+        with mock.patch.object(UserCleanUpService, 'purge', autospec=True, side_effect=UserCleanUpService.purge) as purge:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        purge.assert_called_once()
+        self.assertFalse(ChatUser.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Message.objects.filter(message_id__in=[m.message_id for m in self.sent]).exists())
+        self.assertTrue(Message.objects.filter(pk=self.reply.pk, parent_message=None).exists())
+
+
+class MembershipCacheTests(ConversationTestCase):
+    """
+    Conversation membership is cached per user, answers authorization
+    checks without queries once warm, and is invalidated by m2m_changed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.message = cls.send("members only")
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_warm_cache_authorizes_without_queries(self):
+        request = SimpleNamespace(user=self.user, method='GET')
+        permission = IsParticipantOfConversation()
+        message = Message.objects.get(pk=self.message.pk)
+        self.assertTrue(permission.has_object_permission(request, None, message))
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_object_permission(request, None, message))
+            self.assertTrue(permission.has_object_permission(request, None, self.conversation))
+
+    def test_participant_changes_invalidate(self):
+        newcomer = ChatUser.objects.create_user(username='member_new', email='member_new@test.com')
+        self.assertFalse(is_member(newcomer.user_id, self.conversation.conversation_id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.add(newcomer)
+        self.assertTrue(is_member(newcomer.user_id, self.conversation.conversation_id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.conversations.remove(self.conversation)
+        self.assertFalse(is_member(newcomer.user_id, self.conversation.conversation_id))
+
+        self.assertTrue(is_member(self.user.user_id, self.conversation.conversation_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            Conversation.objects.get(pk=self.conversation.pk).participants.clear()
+        self.assertFalse(is_member(self.user.user_id, self.conversation.conversation_id))
+
+    def test_outsider_cannot_post(self):
+        outsider = ChatUser.objects.create_user(username='member_outsider', email='member_outsider@test.com')
+        self.client.force_authenticate(outsider)
+        url = reverse('conversation-messages-message-create', args=[self.conversation.conversation_id])
+        response = self.client.post(url, {'message_content': "let me in"}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class MessageSearchTests(ConversationTestCase):
+    """
+    Full-text search covers only the caller's conversations, ranks better
+    matches first and pages with (rank, message_id) cursors.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        hidden = Conversation.objects.create()
+        hidden.participants.set([cls.other])
+
+        contents = [
+            "pizza pizza pizza tonight",
+            "pizza or pasta for lunch",
+            "the deployment finished",
+        ] + [f"pizza place number {i}" for i in range(4)]
+        for content in contents:
+            cls.send(content)
+        Message.objects.create(conversation=hidden, sender=cls.other, receiver=cls.other,
+                               message_content="secret pizza")
+        cls.url = reverse('message-search')
+
+    def test_ranked_results_from_own_conversations(self):
+        response = self.client.get(self.url, {'q': 'pizza'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        contents = [item['message_content'] for item in results]
+        self.assertEqual(len(contents), 6)
+        self.assertNotIn("secret pizza", contents)
+        self.assertEqual(contents[0], "pizza pizza pizza tonight")
+        ranks = [item['rank'] for item in results]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_cursor_pages_are_gap_free(self):
+        seen = []
+        url = f"{self.url}?q=pizza&page_size=4"
+        while url:
+            body = self.client.get(url).json()
+            seen += [item['message_id'] for item in body['results']]
+            url = body['links']['next']
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+    def test_pages_through_tied_ranks(self):
+        # The "pizza place number N" rows all rank the same; with one row per
+        # page every cursor lands on a tie. On PostgreSQL this also checks that
+        # the float4 ts_rank is compared at the precision the cursor holds.
+        seen = []
+        url = f"{self.url}?q=place&page_size=1"
+        while url:
+            body = self.client.get(url).json()
+            seen += [item['message_id'] for item in body['results']]
+            url = body['links']['next']
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_edits_are_searchable_and_operators_are_inert(self):
+        message = Message.objects.get(message_content="the deployment finished")
+        message.message_content = "the rollout finished"
+        message.save()
+        contents = [item['message_content'] for item in self.client.get(self.url, {'q': 'rollout'}).json()['results']]
+        self.assertEqual(contents, ["the rollout finished"])
+
+        self.assertEqual(self.client.get(self.url, {'q': '"pizza AND ('}).status_code, 200)
+        self.assertEqual(self.client.get(self.url, {'q': '  '}).status_code, 400)
+
+
+class ThreadRetrievalTests(ConversationTestCase):
+    """
+    Replies carry their thread root and depth, and a whole reply tree is
+    loaded with one recursive query and returned pre-nested.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.root = cls.post("root")
+        cls.first = cls.post("first reply", parent=cls.root)
+        cls.second = cls.post("second reply", parent=cls.root)
+        cls.nested = cls.post("nested reply", parent=cls.first)
+        cls.deepest = cls.post("deepest reply", parent=cls.nested)
+
+    @classmethod
+    def post(cls, content, parent=None):
+        return cls.send(content, sender=cls.user, receiver=cls.other, parent_message=parent)
+
+    def test_thread_position_is_denormalized(self):
+        self.assertEqual(self.root.thread_root_id, self.root.pk)
+        self.assertEqual((self.nested.thread_root_id, self.nested.depth), (self.root.pk, 2))
+        self.assertEqual(Message.objects.thread_by_root(self.root.pk).count(), 5)
+
+    def test_thread_is_one_query(self):
+        with self.assertNumQueries(1):
+            contents = [message.message_content for message in Message.objects.thread(self.first.pk)]
+        self.assertEqual(contents, ["first reply", "nested reply", "deepest reply"])
+        self.assertEqual(Message.objects.thread(self.root.pk, max_depth=1).count(), 3)
+
+    def test_thread_endpoint_returns_nested_tree(self):
+        url = reverse('conversation-messages-thread', args=[self.conversation.conversation_id, self.root.pk])
+        body = self.client.get(url, {'max_depth': 2}).json()
+        self.assertEqual(body['message_content'], "root")
+        self.assertEqual([reply['message_content'] for reply in body['replies']], ["first reply", "second reply"])
+        nested = body['replies'][0]['replies']
+        self.assertEqual([(reply['message_content'], reply['depth']) for reply in nested], [("nested reply", 2)])
+        self.assertEqual(nested[0]['replies'], [])
+
+
+class QueryPlanAuditTests(ConversationTestCase):
+    """
+    audit_query_plans explains the queries the viewsets send; the
+    per-conversation message list and mark-read hit the composite indexes.
+    """
+    usernames = ('planner', 'planned')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(3):
+            cls.send(f"plan {i}")
+
+    def test_audit_reports_every_query(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('audit_query_plans', user='planner', verbosity=2, stdout=out, stderr=err)
+        output = out.getvalue()
+        self.assertIn("Auditing query plans as planner", output)
+        for label in ('conversations.inbox', 'messages.list', 'messages.mark_read', 'messages.thread'):
+            self.assertIn(f"{label}:", output)
+        self.assertEqual(err.getvalue(), "")
+        # PostgreSQL rightly seq-scans tables this small, so only SQLite's choice of index is stable.
+        if connection.vendor == 'sqlite':
+            self.assertIn("message_conv_recent_idx", output)
+
+
+class SeedCommandTests(TestCase):
+    """
+    seed rejects datasets it cannot build, refuses to run twice over the
+    same database and honours an explicit zero.
+    """
+
+    def test_rejects_fewer_than_two_users(self):
+        with self.assertRaises(CommandError):
+            call_command('seed', users=1, conversations=1, stdout=io.StringIO())
+
+    def test_zero_messages_per_conversation(self):
+        call_command('seed', users=2, conversations=3, messages_per_conversation=0, seed=1, stdout=io.StringIO())
+        self.assertEqual(Conversation.objects.count(), 3)
+        self.assertFalse(Message.objects.exists())
+
+    def test_second_run_is_refused_up_front(self):
+        call_command('seed', users=2, conversations=1, messages_per_conversation=0, seed=1, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "already holds seeded users"):
+            call_command('seed', users=2, conversations=1, messages_per_conversation=0, seed=1, stdout=io.StringIO())
+        self.assertEqual(ChatUser.objects.count(), 2)
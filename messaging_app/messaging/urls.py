@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework import routers
 from rest_framework_nested.routers import NestedDefaultRouter
-from . import views
+from . import views, async_views
 
 # Base router for top-level endpoints
 router = routers.DefaultRouter()
@@ -18,8 +18,15 @@ user_router.register(r'conversations', views.ConversationViewSet, basename='user
 
 # Consolidated urlpatterns
 urlpatterns = [
+    path('messages/search/', views.MessageSearchView.as_view(), name='message-search'),  # Full-text search across the user's conversations
     path('', include(router.urls)),  # Include base router URLs (e.g., /users/, /conversations/)
     path('', include(conversations_router.urls)),  # Include nested router URLs for /conversations/<conversation_id>/messages/
     path('', include(user_router.urls)),  # Include nested router URLs for /users/<user_id>/conversations/
+    # Async (ASGI-native) variants of the hot read endpoints
+    path('async/conversations/', async_views.conversation_list, name='async-conversation-list'),
+    path('async/conversations/<uuid:conversation_id>/messages/', async_views.conversation_messages, name='async-conversation-messages'),
+    path('async/unread/', async_views.unread, name='async-unread'),
+    path('async/me/', async_views.get_me, name='async-user-me'),
+    path('cache-stats/', views.cache_stats, name='cache-stats'),
 ]
 
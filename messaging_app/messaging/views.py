@@ -1,32 +1,74 @@
+import json
 import logging
+import re
+import uuid
+from collections import defaultdict
 from typing import Optional
 
-from django.db.models import QuerySet
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Prefetch, Q, QuerySet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
-from rest_framework import viewsets, filters, status, serializers
+from rest_framework import generics, viewsets, filters, status, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import ValidationError
-from rest_framework_extensions.cache.decorators import cache_response
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework_extensions.key_constructor.constructors import DefaultKeyConstructor
+from rest_framework_extensions.key_constructor.bits import KeyBitBase, KwargsKeyBit, QueryParamsKeyBit
 
-from .models import ChatUser, Message, Conversation
-from .serializers import UserSerializer, MessageSerializer, ConversationSerializer
+from .cache import (
+    ConversationVersionKeyBit, bump_conversation_version, counting_cache_response, get_cache_stats, message_list_timeout
+)
+from .membership import get_conversation_ids, is_member
+from .models import ChatUser, Message, Conversation, UnreadCounter
+from .serializers import (
+    UserSerializer, MessageSerializer, ConversationSerializer, UnreadCounterSerializer, MarkReadSerializer,
+    InboxConversationSerializer, MessageSearchResultSerializer, ThreadMessageSerializer, PREVIEW_LIMIT
+)
 from .permissions import IsParticipantOfConversation
 from .filters import MessageFilter
-from .pagination import CustomPagination
+from .pagination import CustomPagination, MessageCursorPagination, InboxCursorPagination, SearchRankCursorPagination
+from .search import search_messages
+from .services import UserCleanUpService
 
 
 logger = logging.getLogger(__name__)
 
+
+class ChatUserKeyBit(KeyBitBase):
+    """
+    Like drf-extensions' UserKeyBit, but keyed on ChatUser's UUID primary key
+    (UserKeyBit reads `user.id`, which ChatUser does not have).
+    """
+    def get_data(self, params, view_instance, view_method, request, args, kwargs):
+        if request.user.is_authenticated:
+            return str(request.user.pk)
+        return 'anonymous'
+
+
+class ConversationMessagesKeyConstructor(DefaultKeyConstructor):
+    """
+    Cache key for paginated conversation message lists.
+    The default key ignores the URL kwargs and query string, so every
+    conversation and every cursor would otherwise share a single cache entry.
+    The conversation's version is bumped on every message write, which
+    retires all of its cached pages at once.
+    """
+    kwargs = KwargsKeyBit()
+    version = ConversationVersionKeyBit()
+    query_params = QueryParamsKeyBit()
+    user = ChatUserKeyBit()
+
+
 def health_check(request):
     return JsonResponse({"status": "healthy"}, status=200)
 
 class ConversationViewSet(viewsets.ModelViewSet):
-    queryset = Conversation.objects.all().prefetch_related('participants')
+    queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['participants__first_name', 'participants__last_name']
@@ -35,14 +77,46 @@ class ConversationViewSet(viewsets.ModelViewSet):
     pagination_class = CustomPagination
     
     def get_queryset(self):
+        """
+        Conversations the user takes part in, with their participant and latest
+        message previews prefetched. The sliced Prefetch querysets are limited
+        per conversation with ROW_NUMBER() window functions, so listing any
+        number of conversations costs a fixed number of queries.
+        """
         if not self.request.user.is_authenticated:
             return Conversation.objects.none()
-        return self.queryset.filter(participants=self.request.user)
+        return Conversation.objects.filter(participants=self.request.user).prefetch_related(
+            Prefetch(
+                'participants',
+                queryset=ChatUser.objects.order_by('username')[:PREVIEW_LIMIT],
+                to_attr='preview_participants'
+            ),
+            Prefetch(
+                'messages',
+                queryset=Message.objects.select_related('sender').order_by('-timestamp', '-message_id')[:PREVIEW_LIMIT],
+                to_attr='preview_messages'
+            ),
+        )
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], pagination_class=InboxCursorPagination)
+    def inbox(self, request, **kwargs):
+        """
+        The user's conversations, most recently active first, cursor-paginated.
+        Served from the denormalized last_message/last_message_at columns in a
+        single indexed query, without scanning or counting messages.
+        """
+        conversations = Conversation.objects.filter(
+            participants=request.user,
+            last_message_at__isnull=False
+        ).select_related('last_message__sender')
+        page = self.paginate_queryset(conversations)
+        serializer = InboxConversationSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
         
 
 class MessageViewSet(viewsets.ModelViewSet):
@@ -52,42 +126,67 @@ class MessageViewSet(viewsets.ModelViewSet):
     """
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    # No OrderingFilter here: the cursor paginator owns the (timestamp, message_id) ordering.
+    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['sender__first_name', 'sender__last_name']
-    ordering_fields = ['timestamp']
     permission_classes = [IsParticipantOfConversation]
     filterset_class = MessageFilter
-    pagination_class = CustomPagination
+    pagination_class = MessageCursorPagination
+    # Reply levels returned by the thread action unless ?max_depth= asks for fewer or more.
+    thread_default_depth = 10
+    thread_max_depth = 50
+    # Cached message-list pages are invalidated by version bumps; the timeout only
+    # bounds staleness where bumps cannot reach (see cache.py).
+    message_list_cache_timeout = property(lambda self: message_list_timeout())
+    # Rows fetched per round-trip by the server-side cursor behind the NDJSON export.
+    export_chunk_size = 2000
+    export_fields = (
+        'message_id', 'sender_id', 'receiver_id', 'parent_message_id',
+        'message_content', 'timestamp', 'read', 'edited'
+    )
 
     def get_queryset(self) -> QuerySet:
         """
         Customize queryset to filter messages based on conversation_id or user_id.
+        The queryset is left unsliced; MessageCursorPagination applies the
+        (timestamp, message_id) keyset so deep pages cost the same as the first.
         """
-        conversation_id = self.kwargs.get('conversation_id')
+        conversation_id = self.kwargs.get('conversation_id') or self.kwargs.get('conversation_id_pk')
         user_id = self.kwargs.get('user_id')
-        conversation_id = self.kwargs.get('conversation_id')
+        if not self.request.user.is_authenticated:
+            return Message.objects.none()
+        # The cached membership set replaces a join through the participants table.
         if conversation_id:
+            if not is_member(self.request.user.user_id, conversation_id):
+                return Message.objects.none()
             return Message.objects.filter(
-                conversation__conversation_id = conversation_id,
-                conversation__participants= self.request.user
-            ).order_by('-timestamp')[:10]
+                conversation_id = conversation_id
+            ).select_related('sender').order_by('-timestamp', '-message_id')
 
+        conversation_ids = get_conversation_ids(self.request.user.user_id)
         if user_id:
             return Message.objects.filter(
                 sender__user_id=user_id,
-                conversation__participants=self.request.user
-            ).order_by('-timestamp')
+                conversation_id__in=conversation_ids
+            ).select_related('sender').order_by('-timestamp', '-message_id')
 
         return Message.objects.filter(
-            conversation__participants=self.request.user
-        ).order_by('-timestamp')
+            conversation_id__in=conversation_ids
+        ).select_related('sender').order_by('-timestamp', '-message_id')
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
-    def unread(self, request):
-        """List unread messages for the authenticated user."""
-        messages = Message.unread.unread_for_user(self.request.user)
-        serializer = self.get_serializer(messages, many=True)
-        return Response(serializer.data)
+    def unread(self, request, **kwargs):
+        """
+        Unread message counts per conversation for the authenticated user.
+        Reads the materialized UnreadCounter rows, one per conversation,
+        instead of scanning the message table.
+        """
+        counters = UnreadCounter.objects.for_user(request.user)
+        serializer = UnreadCounterSerializer(counters, many=True)
+        return Response({
+            'total': sum(counter['unread_count'] for counter in serializer.data),
+            'conversations': serializer.data
+        })
 
     @action(
         detail=False,
@@ -95,18 +194,118 @@ class MessageViewSet(viewsets.ModelViewSet):
         permission_classes=[IsParticipantOfConversation],
         url_path='conversation/(?P<conversation_id>[^/.]+)'
     )
-    @cache_response(60)
-    def get_conversation_messages(self, request, conversation_id: Optional[str] = None):
-        """List messages in a conversation, cached for 60 seconds."""
-        messages = Message.objects.filter(
-            conversation__conversation_id=conversation_id,
-            conversation__participants=self.request.user
-        ).select_related('sender').only(
-            'message_id', 'sender__username', 'message_body', 'timestamp'
-        ).order_by('timestamp')
-        serializer = self.get_serializer(messages, many=True)
+    @counting_cache_response('message_list_cache_timeout', key_func=ConversationMessagesKeyConstructor())
+    def get_conversation_messages(self, request, conversation_id: Optional[str] = None, **kwargs):
+        """
+        List messages in a conversation one cursor page at a time.
+        Pages are cached until the conversation's next message write.
+        """
+        messages = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(messages)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='thread', url_name='thread')
+    def thread(self, request, pk=None, **kwargs) -> Response:
+        """
+        A message and its replies as a nested tree, down to ?max_depth= levels.
+        The whole tree is loaded with one recursive-CTE query and nested in memory.
+        """
+        root = self.get_object()
+        try:
+            max_depth = min(int(request.query_params.get('max_depth', self.thread_default_depth)), self.thread_max_depth)
+        except ValueError:
+            raise ValidationError({"max_depth": "Must be an integer."})
+        if max_depth < 0:
+            raise ValidationError({"max_depth": "Must not be negative."})
+
+        messages = list(Message.objects.thread(root.pk, max_depth).select_related('sender'))
+        children = defaultdict(list)
+        for message in messages:
+            if message.pk == root.pk:
+                root = message
+            else:
+                children[message.parent_message_id].append(message)
+        serializer = ThreadMessageSerializer(root, context={
+            **self.get_serializer_context(), 'children': children, 'root_depth': root.depth
+        })
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='export', url_name='export')
+    def export(self, request, conversation_id_pk: Optional[str] = None) -> StreamingHttpResponse:
+        """
+        Stream a conversation's full message history as newline-delimited JSON.
+        A values() projection read through .iterator() uses a server-side cursor,
+        so the export is one query and constant memory however long the history is.
+        Access is checked first against the cached membership set: non-participants
+        get 403, and 404 if the conversation does not exist.
+        """
+        try:
+            uuid.UUID(str(conversation_id_pk))
+        except ValueError:
+            raise ValidationError({"detail": "Invalid conversation_id format."})
+
+        if not is_member(request.user.user_id, conversation_id_pk):
+            if not Conversation.objects.filter(conversation_id=conversation_id_pk).exists():
+                raise NotFound({"detail": "Conversation not found."})
+            logger.warning(f"User {request.user.user_id} attempted to export unauthorized conversation {conversation_id_pk}")
+            raise PermissionDenied({"detail": "You are not a participant in this conversation."})
+
+        rows = Message.objects.filter(
+            conversation_id=conversation_id_pk
+        ).order_by('timestamp', 'message_id').values(*self.export_fields)
+
+        def ndjson_lines():
+            for row in rows.iterator(chunk_size=self.export_chunk_size):
+                yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+        response = StreamingHttpResponse(ndjson_lines(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="conversation-{conversation_id_pk}.ndjson"'
+        logger.info(f"User {request.user.user_id} started export of conversation {conversation_id_pk}")
+        return response
+
+    @action(detail=False, methods=['post'], url_path='mark-read', url_name='mark-read')
+    def mark_read(self, request, conversation_id_pk: Optional[str] = None) -> Response:
+        """
+        Mark the caller's unread messages in a conversation as read, up to an
+        optional cursor or timestamp, with one set-based UPDATE.
+        QuerySet.update() bypasses the per-row pre_save/post_save signals,
+        so the unread counter is adjusted here by the number of rows affected.
+        """
+        try:
+            uuid.UUID(str(conversation_id_pk))
+        except ValueError:
+            logger.error(f"Invalid conversation_id format: {conversation_id_pk}")
+            raise ValidationError({"detail": "Invalid conversation_id format."})
+        params = MarkReadSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        messages = Message.objects.filter(
+            conversation_id=conversation_id_pk,
+            receiver=request.user,
+            read=False
+        )
+        if 'cursor' in params.validated_data:
+            try:
+                timestamp, message_id = self.paginator.decode_cursor(params.validated_data['cursor'])
+            except NotFound:
+                raise ValidationError({"cursor": "Invalid cursor."})
+            messages = messages.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, message_id__lte=message_id)
+            )
+        elif 'timestamp' in params.validated_data:
+            messages = messages.filter(timestamp__lte=params.validated_data['timestamp'])
+
+        with transaction.atomic():
+            marked = messages.update(read=True)
+            UnreadCounter.objects.decrement(request.user.user_id, conversation_id_pk, by=marked)
+        if marked:
+            # update() sends no post_save, so retire the cached pages here.
+            bump_conversation_version(conversation_id_pk)
+
+        logger.info(f"User {request.user.user_id} marked {marked} messages read in conversation {conversation_id_pk}")
+        return Response({"marked_read": marked}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'], url_path='create', url_name='message-create')
     def create_message(self, request, conversation_id_pk: Optional[str] = None) -> Response:
         """
@@ -122,7 +321,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             logger.error(f"Invalid conversation_id format: {conversation_id_pk}")
             raise ValidationError({"detail": "Invalid conversation_id format."})
 
-        if request.user not in conversation.participants.all():
+        if not is_member(request.user.user_id, conversation.conversation_id):
             logger.warning(f"User {request.user.user_id} attempted to post to unauthorized conversation {conversation_id_pk}")
             return Response(
                 {"detail": "You are not a participant in this conversation."},
@@ -161,7 +360,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         """
         instance = self.get_object()
         if not Message.objects.filter(
-            id=instance.message_id,
+            message_id=instance.message_id,
             conversation__participants=self.request.user
         ).exists():
             logger.warning(f"Unauthorized update attempt on message {instance.message_id} by user {request.user.user_id}")
@@ -171,6 +370,18 @@ class MessageViewSet(viewsets.ModelViewSet):
             )
         return super().update(request, *args, **kwargs)
 
+    def perform_update(self, serializer) -> None:
+        """
+        Save the message and keep the receiver's unread counter in step
+        when the update flips the `read` flag.
+        """
+        was_read = serializer.instance.read
+        message = serializer.save()
+        if message.read and not was_read:
+            UnreadCounter.objects.decrement(message.receiver_id, message.conversation_id)
+        elif was_read and not message.read:
+            UnreadCounter.objects.increment(message.receiver_id, message.conversation_id)
+
     def destroy(self, request, *args, **kwargs) -> Response:
         """
         Delete an existing message with authorization check.
@@ -187,6 +398,26 @@ class MessageViewSet(viewsets.ModelViewSet):
             )
         return super().destroy(request, *args, **kwargs)
 
+class MessageSearchView(generics.ListAPIView):
+    """
+    Full-text search over the messages in all of the caller's conversations.
+    GET /messages/search/?q=<terms> returns matches most relevant first,
+    cursor-paginated on (rank, message_id). Uses the GIN-indexed tsvector on
+    PostgreSQL and the FTS5 table on SQLite (see search.py).
+    """
+    serializer_class = MessageSearchResultSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = SearchRankCursorPagination
+
+    def get_queryset(self) -> QuerySet:
+        query = self.request.query_params.get('q', '').strip()
+        if not re.search(r'\w', query):
+            raise ValidationError({"q": "Provide at least one word to search for."})
+        messages = Message.objects.filter(
+            conversation_id__in=get_conversation_ids(self.request.user.user_id)
+        ).select_related('sender')
+        return search_messages(messages, query)
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing user data.
@@ -195,6 +426,13 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = ChatUser.objects.all()
     serializer_class = UserSerializer
     pagination_class = CustomPagination
+
+    def perform_destroy(self, instance):
+        """
+        Purge the account's messages in batches before deleting it, instead
+        of letting the ORM cascade load every related row in one go.
+        """
+        UserCleanUpService(instance.pk).delete_user()
     
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -204,4 +442,13 @@ def get_me(request):
     """
     user = request.user
     serializer = UserSerializer(user)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Cache hit and miss counters per cached endpoint.
+    """
+    return Response(get_cache_stats())
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messaging_app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up: the handler touches models and settings.
+from messaging.consumers import conversation_websocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Serve WebSocket connections from messaging.consumers, everything else from Django."""
+    if scope['type'] == 'websocket':
+        await conversation_websocket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -145,4 +145,21 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
     }
-}
\ No newline at end of file
+}
+# Real-time fan-out for the WebSocket endpoint (messaging/consumers.py).
+# Use messaging.realtime.RedisBroker with OPTIONS={'url': ...} when running several nodes.
+MESSAGING_REALTIME = {
+    'BACKEND': env("MESSAGING_REALTIME_BACKEND", default='messaging.realtime.InProcessBroker'),  # type: ignore
+    'OPTIONS': {},
+}
+
+# Seconds a cached conversation message-list page (messaging/cache.py) lives. Writes
+# retire pages at once, but only in the cache they run against: raise this only with a
+# shared default cache (Redis, Memcached). `manage.py check` rejects a long timeout on
+# the per-process LocMemCache, where other workers' bumps never arrive.
+MESSAGE_LIST_CACHE_TIMEOUT = env.int("MESSAGE_LIST_CACHE_TIMEOUT", default=60)  # type: ignore
+
+# Seconds a user's cached conversation membership (messaging/membership.py) lives.
+# Participant changes invalidate it at once in the cache they run against; the TTL
+# bounds staleness when each worker process has its own LocMemCache.
+MEMBERSHIP_CACHE_TIMEOUT = 300
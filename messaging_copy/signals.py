@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import *
 from .services import *
@@ -103,43 +103,6 @@ def handle_message_edits(sender, instance, **kwargs):
             # In that case, we do nothing.
             pass 
 
-##For this, we can also use a service layer or bypass it. 
-
-#Option 1 for using service layer
-""" 
-@receiver(post_delete, sender = User)       
-def handle_user_deletion(sender, instance, **kwargs):
-    try:
-        UserCleanUpService.clean_user_data(instance)
-    except Exception:
-        pass
-"""
-## Option 2, by-passing it
-
-@receiver(post_delete, sender=User)
-def delete_user_data(sender, instance, **kwargs):
-    """
-    Deletes all related data when a User is removed:
-    - Messages sent or received by the user
-    - Notifications addressed to the user
-    - Message history entries for messages sent by the user
-    - Message history entries edited by the user
-    """
-    try:
-        # Delete messages where the user is the sender
-        Message.objects.filter(sender=instance).delete()
-
-        # Delete messages where the user is the receiver
-        Message.objects.filter(receiver=instance).delete()
-
-        # Delete notifications related to the user
-        Notification.objects.filter(user=instance).delete()
-
-        # Delete message history where the message was sent by the user
-        MessageHistory.objects.filter(message__sender=instance).delete()
-
-        # Delete message history entries that were edited by the user
-        MessageHistory.objects.filter(edited_by=instance).delete()
-    except Exception:
-        pass
-
+# User data is not cleaned up from a post_delete receiver: by then the
+# ORM cascade has already loaded every related row. Call
+# UserCleanUpService.clean_user_data(user) before deleting the account.